@@ -0,0 +1,309 @@
+"""End-to-end load benchmark of the reverse proxy.
+
+Starts an upstream (the Go echo server from ``go/main.go`` or the Python
+stand-in in ``bench/upstream.py``) on port 9999 and the proxy from
+``src/cli.py``. Then it drives the proxy with a built-in async load generator
+and prints one JSON document with throughput, latency percentiles and
+memory, so results from two commits can be diffed:
+
+    python bench/bench_proxy.py --concurrency 64 --duration 10 > before.json
+
+Routes are given as ``path=weight`` and must exist in ``src/routes.yaml``;
+the ``/test/`` route points at port 9999.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import uvloop
+from httptools import HttpResponseParser
+from psutil import NoSuchProcess, Process
+
+ROOT = Path(__file__).resolve().parent.parent
+UPSTREAM_PORT = 9999
+GO_UPSTREAM = ROOT / "bin" / "echo_server"  # built from go/main.go
+
+
+class Response:
+    __slots__ = ("complete",)
+
+    def __init__(self):
+        self.complete = False
+
+    def on_message_complete(self):
+        self.complete = True
+
+
+class Stats:
+    __slots__ = ("connections", "errors", "latencies")
+
+    def __init__(self):
+        self.latencies: list[int] = []
+        self.errors = 0
+        self.connections = 0
+
+
+def build_request(path: bytes, body_size: int, keep_alive: bool) -> bytes:
+    connection = b"" if keep_alive else b"Connection: close\r\n"
+    if not body_size:
+        return b"GET %s HTTP/1.1\r\nHost: bench\r\n%s\r\n" % (path, connection)
+    return b"POST %s HTTP/1.1\r\nHost: bench\r\nContent-Length: %d\r\n%s\r\n%s" % (
+        path,
+        body_size,
+        connection,
+        b"x" * body_size,
+    )
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    response = Response()
+    parser = HttpResponseParser(response)
+    while not response.complete:
+        data = await reader.read(65536)
+        if not data:
+            raise ConnectionError("Connection closed mid-response")
+        parser.feed_data(data)
+    return parser.get_status_code()
+
+
+async def client(
+    host: str,
+    port: int,
+    requests: list[bytes],
+    keep_alive: bool,
+    measure_from: float,
+    deadline: float,
+    stats: Stats,
+):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        request = random.choice(requests)
+        start = time.perf_counter_ns()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                stats.connections += 1
+            writer.write(request)
+            status = await read_response(reader)
+        except (OSError, ConnectionError, ValueError):
+            status = 0
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+        elapsed = time.perf_counter_ns() - start
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+
+        if time.monotonic() < measure_from:
+            continue  # warming up
+        if status == 0 or status >= 500:
+            stats.errors += 1
+        else:
+            stats.latencies.append(elapsed)
+    if writer is not None:
+        writer.close()
+
+
+def rss(process: Process) -> int:
+    total = 0
+    for proc in [process, *process.children(recursive=True)]:
+        try:
+            total += proc.memory_info().rss
+        except NoSuchProcess:
+            pass
+    return total
+
+
+async def sample_rss(process: Process, samples: list[int], interval: float = 0.1):
+    while True:
+        samples.append(rss(process))
+        await asyncio.sleep(interval)
+
+
+def percentile(sorted_values: list[int], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index] / 1e6  # ns -> ms
+
+
+async def run_load(args, proxy: Process) -> dict:
+    routes = []
+    for spec in args.routes.split(","):
+        path, _, weight = spec.partition("=")
+        request = build_request(path.encode(), args.body_size, args.keep_alive)
+        routes.extend([request] * int(weight or 1))
+
+    rss_idle = rss(proxy)
+    samples: list[int] = []
+    sampler = asyncio.create_task(sample_rss(proxy, samples))
+    stats = Stats()
+    start = time.monotonic()
+    measure_from = start + args.warmup
+    deadline = measure_from + args.duration
+    await asyncio.gather(
+        *(
+            client(
+                "127.0.0.1",
+                args.port,
+                routes,
+                args.keep_alive,
+                measure_from,
+                deadline,
+                stats,
+            )
+            for _ in range(args.concurrency)
+        )
+    )
+    sampler.cancel()
+
+    latencies = sorted(stats.latencies)
+    rss_peak = max(samples, default=rss_idle)
+    return {
+        "requests": len(latencies),
+        "errors": stats.errors,
+        "connections": stats.connections,
+        "rps": round(len(latencies) / args.duration, 1),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "p99.9": percentile(latencies, 0.999),
+            "max": latencies[-1] / 1e6 if latencies else 0.0,
+        },
+        "rss_bytes": {
+            "idle": rss_idle,
+            "peak": rss_peak,
+            "per_connection": (rss_peak - rss_idle) // args.concurrency,
+        },
+    }
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing is listening on port {port}")
+
+
+def start_upstream(kind: str, cwd: str) -> subprocess.Popen:
+    if kind == "go":
+        command = [str(GO_UPSTREAM)]
+    else:
+        command = [sys.executable, str(ROOT / "bench" / "upstream.py")]
+    return subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL)
+
+
+def git_revision() -> str | None:
+    if shutil.which("git") is None:
+        return None
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the reverse proxy end to end and print JSON results."
+    )
+    parser.add_argument("--port", type=int, default=8080, help="Proxy port")
+    parser.add_argument("--workers", type=int, default=1, help="Proxy workers")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds")
+    parser.add_argument(
+        "--close",
+        dest="keep_alive",
+        action="store_false",
+        help="Open a new connection for every request",
+    )
+    parser.add_argument(
+        "--body-size",
+        type=int,
+        default=0,
+        help="POST bodies of this many bytes instead of GET",
+    )
+    parser.add_argument(
+        "--routes",
+        default="/test/=1",
+        help="Comma separated path=weight mix (default: /test/=1)",
+    )
+    parser.add_argument("--upstream", choices=("auto", "go", "python"), default="auto")
+    parser.add_argument("--output", type=Path, help="Write JSON here, not stdout")
+    args = parser.parse_args()
+    if args.upstream == "auto":
+        args.upstream = "go" if GO_UPSTREAM.exists() else "python"
+
+    with tempfile.TemporaryDirectory() as cwd:  # logs and access.log go here
+        upstream = start_upstream(args.upstream, cwd)
+        proxy = subprocess.Popen(
+            [
+                sys.executable,
+                str(ROOT / "src" / "cli.py"),
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(args.port),
+                "--workers",
+                str(args.workers),
+            ],
+            cwd=cwd,
+            env={**os.environ, "PYTHONPATH": str(ROOT / "src")},
+        )
+        try:
+            wait_for_port(UPSTREAM_PORT, upstream)
+            wait_for_port(args.port, proxy)
+            results = uvloop.run(run_load(args, Process(proxy.pid)))
+        finally:
+            for process in (proxy, upstream):
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "keep_alive": args.keep_alive,
+            "body_size": args.body_size,
+            "routes": args.routes,
+            "upstream": args.upstream,
+        },
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
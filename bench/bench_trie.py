@@ -87,6 +87,42 @@ def benchmark_deep_nested_match(num_iter=100000):
     print(f"Deep nested path lookup ({num_iter:,} iterations): {time:.4f} seconds")
 
 
+def benchmark_compiled_match(num_iter=100000):
+    compiled = trie.compile()
+
+    def compiled_match_operation():
+        path = choice(test_paths)
+        compiled.match(path + b"/extra/parts")
+
+    time = timeit.timeit(compiled_match_operation, number=num_iter)
+    print(f"Compiled partial match ({num_iter:,} iterations): {time:.4f} seconds")
+
+
+def benchmark_large_table(num_iter=100000, num_routes=5000):
+    large = RouteTrie()
+    large_paths = [b"/service%d/v%d/resource" % (i, i % 3) for i in range(num_routes)]
+    for path in large_paths:
+        large.insert(path, Target(host=b"large.local", port=b"8080"))
+    compiled = large.compile()
+
+    def trie_operation():
+        large.match(choice(large_paths) + b"/123")
+
+    def compiled_operation():
+        compiled.match(choice(large_paths) + b"/123")
+
+    time = timeit.timeit(trie_operation, number=num_iter)
+    print(
+        f"{num_routes:,} routes, trie match ({num_iter:,} iterations): "
+        f"{time:.4f} seconds"
+    )
+    time = timeit.timeit(compiled_operation, number=num_iter)
+    print(
+        f"{num_routes:,} routes, compiled match ({num_iter:,} iterations): "
+        f"{time:.4f} seconds"
+    )
+
+
 def run_all():
     print("=== RouteTrie Performance Benchmarks ===")
     for num_iter in [10_000, 100_000, 1_000_000]:
@@ -97,6 +133,8 @@ def run_all():
         benchmark_root_match(num_iter)
         benchmark_no_match(num_iter)
         benchmark_deep_nested_match(num_iter)
+        benchmark_compiled_match(num_iter)
+        benchmark_large_table(num_iter)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+"""Minimal keep-alive HTTP upstream for benchmarks, a stand-in for go/main.go.
+
+Answers every request with a fixed ``OK`` body, or with the request body
+for ``/echo``, so the numbers measure the proxy and not the backend.
+"""
+
+import argparse
+import asyncio
+
+import uvloop
+from httptools import HttpParserError, HttpRequestParser
+
+
+class EchoProtocol(asyncio.Protocol):
+    __slots__ = ("body", "parser", "transport", "url")
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.parser = HttpRequestParser(self)
+        self.url = b""
+        self.body = bytearray()
+
+    def data_received(self, data):
+        try:
+            self.parser.feed_data(data)
+        except HttpParserError:
+            self.transport.close()
+
+    def on_url(self, url):
+        self.url = url
+
+    def on_body(self, body):
+        self.body.extend(body)
+
+    def on_message_complete(self):
+        body = bytes(self.body) if self.url.startswith(b"/echo") else b"OK"
+        self.body.clear()
+        keep_alive = self.parser.should_keep_alive()
+        self.transport.write(
+            b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n%s"
+            % (len(body), b"" if keep_alive else b"Connection: close\r\n", body)
+        )
+        if not keep_alive:
+            self.transport.close()
+
+
+async def main(host: str, port: int):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(EchoProtocol, host, port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    args = parser.parse_args()
+    uvloop.run(main(args.host, args.port))
@@ -0,0 +1,200 @@
+"""Access log that keeps formatting and disk writes off the event loop.
+
+Each response is recorded as a tuple in a fixed size ring buffer, which is
+all the event loop does. A writer thread drains the ring in batches,
+formats the whole batch and appends it with one ``write``, so workers
+sharing the file never interleave inside a line. When the disk stalls,
+the ring fills up and further records are dropped and counted rather than
+queued, so memory stays bounded and the loop never waits on the disk.
+
+Lines look like the Common Log Format, with the request time in seconds
+and the ``Host`` header appended:
+
+    127.0.0.1 - - [18/Oct/2026:15:39:54 +0000] "GET /test" 200 0.000846 example.com
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+
+from metrics import registry
+
+
+class AccessLog:
+    """Ring buffer of access log records with a thread writing them to ``path``.
+
+    The event loop is the only producer and the writer thread the only
+    consumer: the loop fills a slot before it advances ``_head`` and the
+    thread reads slots before it advances ``_tail``, so neither needs a
+    lock. The thread wakes every ``interval`` seconds, or early once the
+    ring is half full.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_fd",
+        "_half",
+        "_head",
+        "_mask",
+        "_reopen",
+        "_reported",
+        "_slots",
+        "_stopping",
+        "_tail",
+        "_thread",
+        "_wake",
+        "capacity",
+        "dropped",
+        "interval",
+        "lost",
+        "path",
+    )
+
+    def __init__(self, path: str | os.PathLike, capacity: int = 65536, interval=0.2):
+        self.path = path
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.interval = interval
+        self.dropped = registry.counter("proxy_access_log_dropped_total")
+        self.lost = 0  # records dropped by this process
+        self._slots: list[tuple | None] = [None] * size
+        self._mask = size - 1
+        self._half = size >> 1
+        self._head = 0  # next slot to fill, advanced by the event loop only
+        self._tail = 0  # next slot to write, advanced by the writer only
+        self._reported = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._reopen = False
+        self._fd = -1
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._open()
+        self._thread = threading.Thread(
+            target=self._run, name="access-log", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write what is buffered and stop the writer."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        os.close(self._fd)
+        self._fd = -1
+
+    def reopen(self) -> None:
+        """Open ``path`` again before the next write, after it was rotated."""
+        self._reopen = True
+        self._wake.set()
+
+    def record(
+        self,
+        peer: bytes | None,
+        method: bytes | None,
+        url: bytes | None,
+        host: bytes | None,
+        status: int,
+        elapsed: int,
+        time: Callable[[], float] = time.time,  # bytecode opt
+    ) -> None:
+        """Queue a line for a response that took ``elapsed`` nanoseconds."""
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.lost += 1
+            self.dropped.inc()
+            return
+        self._slots[head & self._mask] = (
+            time(),
+            peer,
+            method,
+            url,
+            host,
+            status,
+            elapsed,
+        )
+        self._head = head + 1
+        if head - self._tail == self._half:
+            self._wake.set()
+
+    def _open(self) -> None:
+        self._fd = os.open(
+            self.path,
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_CLOEXEC", 0),
+            0o644,
+        )
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            stopping = self._stopping
+            try:
+                self._flush()
+            except Exception:
+                self.logger.exception("Failed to write the access log")
+            if stopping:
+                return
+
+    def _flush(self) -> None:
+        if self._reopen:
+            self._reopen = False
+            os.close(self._fd)
+            self._open()
+
+        lost = self.lost
+        if lost != self._reported:
+            self.logger.warning(
+                "Access log buffer full, dropped %d records", lost - self._reported
+            )
+            self._reported = lost
+
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+        slots = self._slots
+        mask = self._mask
+        lines = []
+        second = -1
+        stamp = b""
+        for i in range(tail, head):
+            t, peer, method, url, host, status, elapsed = slots[i & mask]
+            slots[i & mask] = None
+            if int(t) != second:
+                second = int(t)
+                stamp = time.strftime(
+                    "%d/%b/%Y:%H:%M:%S %z", time.localtime(second)
+                ).encode()
+            lines.append(
+                b'%s - - [%s] "%s %s" %d %.6f %s\n'
+                % (
+                    peer or b"-",
+                    stamp,
+                    method or b"-",
+                    url or b"-",
+                    status,
+                    elapsed / 1e9,
+                    host or b"-",
+                )
+            )
+        # The loop may fill these slots again while the batch is written
+        self._tail = head
+
+        view = memoryview(b"".join(lines))
+        try:
+            while view:
+                view = view[os.write(self._fd, view) :]
+        except OSError as exc:
+            self.logger.warning("Failed to write the access log: %s", exc)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from time import monotonic
+
+from metrics import registry
+
+
+class ConcurrencyLimit:
+    """Adaptive cap on the requests in flight to upstreams (AIMD).
+
+    Every request released reports its latency. The limit grows by about
+    one per window of ``limit`` requests while they keep it at least half
+    used, and shrinks by ``backoff`` at most once per window when requests
+    time out or the recent latency (a short moving average) rises above
+    ``tolerance`` times the long-run average. Requests beyond the limit
+    are shed instead of queueing behind the slow ones, so the latency of
+    the admitted ones stays close to what the upstreams deliver unloaded.
+    The limit stays between ``min_limit`` and ``max_limit`` and starts at
+    ``max_limit``, so nothing is shed before latency degrades.
+    """
+
+    __slots__ = (
+        "_window",
+        "backoff",
+        "in_flight",
+        "limit",
+        "long",
+        "max_limit",
+        "min_limit",
+        "short",
+        "tolerance",
+    )
+
+    def __init__(
+        self,
+        max_limit: int = 1000,
+        min_limit: int = 4,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+    ):
+        if not 0 < min_limit <= max_limit:
+            raise ValueError("Need 0 < min_limit <= max_limit")
+        self.limit = float(max_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        # Moving averages of the latency in ns, over about 8 and 256 requests
+        self.short = 0.0
+        self.long = 0.0
+        self._window = 0  # requests released since the last decrease
+
+    def acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: int, overloaded: bool = False) -> None:
+        """Give the slot back, ``overloaded`` if the request timed out."""
+        self.in_flight -= 1
+        if not self.long:
+            self.short = self.long = latency
+            return
+        self.short += (latency - self.short) / 8
+        self.long += (latency - self.long) / 256
+        self._window += 1
+        limit = self.limit
+        if overloaded or self.short > self.tolerance * self.long:
+            if self._window >= limit:
+                self._window = 0
+                self.limit = max(self.min_limit, limit * self.backoff)
+        elif self.in_flight * 2 >= limit and limit < self.max_limit:
+            self.limit = min(self.max_limit, limit + 1 / limit)
+
+    def abandon(self) -> None:
+        """Give the slot back without a latency, the request never ran."""
+        self.in_flight -= 1
+
+
+class TokenBuckets:
+    """Per-client rate limit: ``rate`` requests a second, bursts of ``burst``.
+
+    Buckets are kept for the ``max_clients`` most recently seen clients. A
+    client whose bucket was dropped starts over with a full one, which is
+    where an idle client's bucket would be anyway.
+    """
+
+    __slots__ = ("_buckets", "_clock", "burst", "limited", "max_clients", "rate")
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float | None = None,
+        max_clients: int = 65536,
+        clock: Callable[[], float] = monotonic,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(burst if burst is not None else rate, 1.0)
+        self.max_clients = max_clients
+        self.limited = registry.counter("proxy_rate_limited_total")
+        # client -> [tokens, last refill]; least recently seen first
+        self._buckets: dict[bytes | None, list[float]] = {}
+        self._clock = clock
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, client: bytes | None) -> float:
+        """Take a token for ``client``.
+
+        Returns 0 if it had one, otherwise the seconds until it has one.
+        """
+        now = self._clock()
+        bucket = self._buckets.pop(client, None)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                del self._buckets[next(iter(self._buckets))]
+            bucket = [self.burst, now]
+        self._buckets[client] = bucket
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        self.limited.inc()
+        return (1 - tokens) / self.rate
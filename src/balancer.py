@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from math import gcd
+from random import randrange
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from admission import ConcurrencyLimit
+    from cache import ResponseCache
+    from metrics import RouteMetrics
+    from route_trie import Target
+
+
+class UpstreamGroup:
+    """Backends of one route and the policy that picks between them.
+
+    This is what the route trie maps a route to. ``start`` and ``done``
+    bracket every request sent to a target, so ``Target.outstanding``
+    always holds the requests still waiting for a response. Each policy
+    selects a target in O(1) with ``choose``. If that target is ejected by
+    the health checker, ``pick`` falls back to the least loaded healthy
+    one, and when every target is down it routes to the chosen one anyway.
+    Routes with ``cache`` enabled also keep their ResponseCache here,
+    routes with a ``limit`` their ConcurrencyLimit, and routes loaded from
+    the routes file their RouteMetrics.
+    """
+
+    __slots__ = ("cache", "limit", "metrics", "targets")
+
+    def __init__(self, targets: list[Target], metrics: RouteMetrics | None = None):
+        if not targets:
+            raise ValueError("An upstream group needs at least one target")
+        self.targets = targets
+        self.cache: ResponseCache | None = None
+        self.limit: ConcurrencyLimit | None = None
+        self.metrics = metrics
+
+    def pick(self) -> Target:
+        target = self.choose()
+        if target.healthy:
+            return target
+        best = None
+        for candidate in self.targets:
+            if candidate.healthy and (
+                best is None or candidate.outstanding < best.outstanding
+            ):
+                best = candidate
+        return target if best is None else best
+
+    def choose(self) -> Target:
+        return self.targets[0]
+
+    def start(self, target: Target) -> None:
+        target.outstanding += 1
+
+    def done(self, target: Target) -> None:
+        target.outstanding -= 1
+
+
+class RoundRobinGroup(UpstreamGroup):
+    __slots__ = ("_next",)
+
+    def __init__(self, targets: list[Target], metrics: RouteMetrics | None = None):
+        super().__init__(targets, metrics)
+        self._next = 0
+
+    def choose(self) -> Target:
+        i = self._next
+        self._next = (i + 1) % len(self.targets)
+        return self.targets[i]
+
+
+class WeightedGroup(UpstreamGroup):
+    """Smooth weighted round-robin, precomputed into a fixed schedule.
+
+    The schedule spreads each target's turns evenly (weights 5/1/1 give
+    ``a a b a c a a`` rather than ``a a a a a b c``), so picking is an index
+    into a list.
+    """
+
+    __slots__ = ("_next", "_schedule")
+
+    def __init__(self, targets: list[Target], metrics: RouteMetrics | None = None):
+        super().__init__(targets, metrics)
+        weights = [max(target.weight, 0) for target in targets]
+        if not any(weights):
+            weights = [1] * len(targets)
+        divisor = 0
+        for weight in weights:
+            divisor = gcd(divisor, weight)
+        weights = [weight // divisor for weight in weights]
+
+        total = sum(weights)
+        current = [0] * len(targets)
+        schedule = []
+        for _ in range(total):
+            for i, weight in enumerate(weights):
+                current[i] += weight
+            best = max(range(len(targets)), key=current.__getitem__)
+            current[best] -= total
+            schedule.append(targets[best])
+        self._schedule = schedule
+        self._next = 0
+
+    def choose(self) -> Target:
+        i = self._next
+        self._next = (i + 1) % len(self._schedule)
+        return self._schedule[i]
+
+
+class LeastOutstandingGroup(UpstreamGroup):
+    """Picks a target with the fewest requests in flight.
+
+    Outstanding counts only ever move by one, so targets are kept in
+    buckets by count and the lowest non-empty bucket is tracked, the same
+    trick as an O(1) LFU cache.
+    """
+
+    __slots__ = ("_buckets", "_min")
+
+    def __init__(self, targets: list[Target], metrics: RouteMetrics | None = None):
+        super().__init__(targets, metrics)
+        self._buckets: dict[int, dict[Target, None]] = {}
+        for target in targets:
+            self._buckets.setdefault(target.outstanding, {})[target] = None
+        self._min = min(self._buckets)
+
+    def choose(self) -> Target:
+        return next(iter(self._buckets[self._min]))
+
+    def start(self, target: Target) -> None:
+        count = target.outstanding
+        self._move(target, count, count + 1)
+        if self._min == count and count not in self._buckets:
+            self._min = count + 1
+        target.outstanding = count + 1
+
+    def done(self, target: Target) -> None:
+        count = target.outstanding
+        self._move(target, count, count - 1)
+        self._min = min(self._min, count - 1)
+        target.outstanding = count - 1
+
+    def _move(self, target: Target, old: int, new: int) -> None:
+        bucket = self._buckets[old]
+        del bucket[target]
+        if not bucket:
+            del self._buckets[old]
+        self._buckets.setdefault(new, {})[target] = None
+
+
+class PowerOfTwoGroup(UpstreamGroup):
+    """Power of two choices: the less loaded of two random targets."""
+
+    __slots__ = ()
+
+    def choose(self, randrange=randrange) -> Target:  # bytecode opt
+        targets = self.targets
+        n = len(targets)
+        if n == 1:
+            return targets[0]
+        a = randrange(n)
+        b = randrange(n - 1)
+        if b >= a:
+            b += 1
+        first, second = targets[a], targets[b]
+        return first if first.outstanding <= second.outstanding else second
+
+
+POLICIES: dict[str, type[UpstreamGroup]] = {
+    "round_robin": RoundRobinGroup,
+    "weighted": WeightedGroup,
+    "least_outstanding": LeastOutstandingGroup,
+    "p2c": PowerOfTwoGroup,
+}
+
+
+def make_group(
+    targets: list[Target],
+    policy: str = "round_robin",
+    metrics: RouteMetrics | None = None,
+) -> UpstreamGroup:
+    if policy not in POLICIES:
+        raise ValueError(
+            f"Unknown balancing policy {policy!r}, expected one of {list(POLICIES)}"
+        )
+    if len(targets) == 1:
+        return UpstreamGroup(targets, metrics)
+    return POLICIES[policy](targets, metrics)
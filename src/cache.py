@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from protocol import ReverseProxy
+
+# Statuses a shared cache may store when the response says how long for
+CACHEABLE_STATUS = frozenset((200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501))
+
+
+def parse_headers(head: bytes) -> dict[bytes, bytes]:
+    """Header values of a request or response head, by lowercase name.
+
+    Repeated headers are joined with commas, as HTTP allows.
+    """
+    headers: dict[bytes, bytes] = {}
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if not value:
+            continue
+        name = name.strip().lower()
+        value = value.strip()
+        if name in headers:
+            value = headers[name] + b", " + value
+        headers[name] = value
+    return headers
+
+
+def parse_cache_control(value: bytes) -> dict[bytes, bytes | None]:
+    directives: dict[bytes, bytes | None] = {}
+    for directive in value.split(b","):
+        name, eq, argument = directive.partition(b"=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip(b'"') if eq else None
+    return directives
+
+
+def freshness_lifetime(headers: dict[bytes, bytes]) -> float | None:
+    """Seconds a response stays fresh, or None if it must not be stored.
+
+    ``s-maxage`` wins over ``max-age``, which wins over ``Expires``. A
+    response without any of them gets 0, so it is only stored if it can be
+    revalidated.
+    """
+    directives = parse_cache_control(headers.get(b"cache-control", b""))
+    if b"no-store" in directives or b"private" in directives:
+        return None
+    if b"no-cache" in directives:
+        return 0.0
+    for name in (b"s-maxage", b"max-age"):
+        if name in directives:
+            try:
+                return max(float(int(directives[name] or b"")), 0.0)
+            except ValueError:
+                return 0.0
+    expires = headers.get(b"expires")
+    if expires is None:
+        return 0.0
+    try:
+        expires_at = parsedate_to_datetime(expires.decode("latin-1"))
+        date = headers.get(b"date")
+        if date is None:
+            return max(expires_at.timestamp() - time.time(), 0.0)
+        return max(
+            (
+                expires_at - parsedate_to_datetime(date.decode("latin-1"))
+            ).total_seconds(),
+            0.0,
+        )
+    except (TypeError, ValueError):
+        return 0.0  # an invalid Expires means already expired
+
+
+def etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    """Weak comparison, as ``If-None-Match`` requires."""
+    if if_none_match.strip() == b"*":
+        return True
+    etag = etag.removeprefix(b"W/")
+    return any(
+        candidate.strip().removeprefix(b"W/") == etag
+        for candidate in if_none_match.split(b",")
+    )
+
+
+class CacheEntry:
+    __slots__ = (
+        "body",
+        "etag",
+        "expires",
+        "head",
+        "initial_age",
+        "key",
+        "lifetime",
+        "next",
+        "prev",
+        "size",
+        "stored",
+        "vary",
+        "visited",
+    )
+
+    def __init__(self, key: tuple, head: bytes, body: bytes, etag: bytes | None):
+        self.key = key
+        self.head = head  # without the blank line that ends it
+        self.body = body
+        self.etag = etag
+        self.vary: tuple[bytes, ...] = ()
+        self.lifetime: float = 0.0
+        self.expires: float = 0.0
+        self.stored: float = 0.0
+        self.initial_age: float = 0.0
+        self.size = len(head) + len(body)
+        self.visited = False
+        # Towards newer and older entries in the SIEVE queue
+        self.prev: CacheEntry | None = None
+        self.next: CacheEntry | None = None
+
+
+class CacheFill:
+    """A response on its way from the upstream into the cache.
+
+    ``buf`` records the raw response, head and body as sent, until it is
+    longer than the cache takes, then it is dropped. When ``entry`` is set
+    the request revalidates that stale entry, and the response is withheld
+    from the client until it is known not to be a ``304``. ``waiters`` are
+    identical requests that arrived meanwhile, each with its headers and
+    the head to send upstream if the response can't be shared.
+    """
+
+    __slots__ = ("buf", "entry", "headers", "key", "limit", "waiters", "withhold")
+
+    def __init__(self, key: tuple, headers: dict[bytes, bytes], limit: int):
+        self.key = key
+        self.headers = headers
+        self.entry: CacheEntry | None = None
+        self.withhold = False
+        self.buf: bytearray | None = bytearray()
+        self.limit = limit
+        self.waiters: list[tuple[ReverseProxy, dict[bytes, bytes], bytes]] = []
+
+
+class ResponseCache:
+    """Byte bounded in-memory cache of upstream responses, one per route.
+
+    Responses are stored as sent by the upstream, so serving one is a
+    single ``writelines``. Freshness follows ``Cache-Control`` and
+    ``Expires``; a stale entry with an ``ETag`` is revalidated with
+    ``If-None-Match``. A ``Vary`` response is stored per value of the
+    request headers it names. Only one ``GET`` per key is sent upstream at
+    a time: ``pending`` holds its fill, and identical requests wait for it
+    instead of stampeding the upstream when a popular entry expires.
+
+    Eviction is SIEVE: entries sit in insertion order and a hit only sets a
+    visited bit, so lookups never reorder anything. To make room, a hand
+    sweeps from the oldest entry, clearing visited bits, and evicts the
+    first entry that was not visited since the hand last passed it.
+    """
+
+    __slots__ = (
+        "_clock",
+        "_entries",
+        "_hand",
+        "_newest",
+        "_oldest",
+        "_vary",
+        "hits",
+        "max_bytes",
+        "max_entry_bytes",
+        "misses",
+        "pending",
+        "size",
+    )
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.pending: dict[tuple, CacheFill] = {}
+        self._entries: dict[tuple, CacheEntry] = {}
+        # request headers named by the Vary of a stored response, by key
+        self._vary: dict[tuple, tuple[bytes, ...]] = {}
+        self._newest: CacheEntry | None = None
+        self._oldest: CacheEntry | None = None
+        self._hand: CacheEntry | None = None
+        self._clock = clock
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: tuple, headers: dict[bytes, bytes]) -> CacheEntry | None:
+        vary = self._vary.get(key)
+        if vary:
+            key = (key, tuple(headers.get(name) for name in vary))
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry.visited = True
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self._clock() < entry.expires
+
+    def response(self, entry: CacheEntry, head_only: bool = False) -> list[bytes]:
+        """The buffers to write to serve ``entry``, with its current ``Age``."""
+        self.hits += 1
+        age = b"\r\nAge: %d\r\n\r\n" % (
+            entry.initial_age + self._clock() - entry.stored
+        )
+        if head_only:
+            return [entry.head, age]
+        return [entry.head, age, entry.body]
+
+    def store(
+        self, key: tuple, headers: dict[bytes, bytes], response: bytes, status: int
+    ) -> CacheEntry | None:
+        """Store a complete upstream response for a ``GET`` with ``headers``.
+
+        Returns the new entry, or None if the response is not cacheable.
+        """
+        if status not in CACHEABLE_STATUS or len(response) > self.max_entry_bytes:
+            return None
+        end = response.find(b"\r\n\r\n")
+        if end == -1:
+            return None
+        head = response[:end]
+        # A 1xx response before this one
+        if head[9:12] != b"%d" % status:
+            return None
+        response_headers = parse_headers(head)
+        if b"set-cookie" in response_headers:
+            return None
+        lifetime = freshness_lifetime(response_headers)
+        etag = response_headers.get(b"etag")
+        if lifetime is None or (not lifetime and etag is None):
+            return None
+        vary = tuple(
+            sorted(
+                name.strip().lower()
+                for name in response_headers.get(b"vary", b"").split(b",")
+                if name.strip()
+            )
+        )
+        if b"*" in vary:
+            return None
+
+        self._vary.pop(key, None)
+        if vary:
+            self._vary[key] = vary
+            key = (key, tuple(headers.get(name) for name in vary))
+        # The Age is added when the entry is served
+        head = b"\r\n".join(
+            line for line in head.split(b"\r\n") if line[:4].lower() != b"age:"
+        )
+        entry = CacheEntry(key, head, response[end + 4 :], etag)
+        entry.vary = vary
+        self._set_lifetime(entry, lifetime, response_headers)
+
+        old = self._entries.get(key)
+        if old is not None:
+            self._remove(old)
+        while self.size + entry.size > self.max_bytes:
+            self._evict()
+        self._insert(entry)
+        return entry
+
+    def refresh(self, entry: CacheEntry, not_modified: bytes) -> None:
+        """Make ``entry`` fresh again after the upstream answered ``304``."""
+        headers = parse_headers(not_modified[: not_modified.find(b"\r\n\r\n")])
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            lifetime = 0.0
+        elif not lifetime and b"cache-control" not in headers:
+            lifetime = entry.lifetime  # the 304 did not say, keep the old one
+        self._set_lifetime(entry, lifetime, headers)
+
+    def _set_lifetime(
+        self, entry: CacheEntry, lifetime: float, headers: dict[bytes, bytes]
+    ) -> None:
+        try:
+            initial_age = max(float(headers.get(b"age", b"0")), 0.0)
+        except ValueError:
+            initial_age = 0.0
+        now = self._clock()
+        entry.lifetime = lifetime
+        entry.initial_age = initial_age
+        entry.stored = now
+        entry.expires = now + lifetime - initial_age
+
+    # region SIEVE queue
+
+    def _insert(self, entry: CacheEntry) -> None:
+        entry.next = self._newest
+        if self._newest is not None:
+            self._newest.prev = entry
+        self._newest = entry
+        if self._oldest is None:
+            self._oldest = entry
+        self._entries[entry.key] = entry
+        self.size += entry.size
+
+    def _remove(self, entry: CacheEntry) -> None:
+        if self._hand is entry:
+            self._hand = entry.prev
+        if entry.prev is None:
+            self._newest = entry.next
+        else:
+            entry.prev.next = entry.next
+        if entry.next is None:
+            self._oldest = entry.prev
+        else:
+            entry.next.prev = entry.prev
+        entry.prev = entry.next = None
+        del self._entries[entry.key]
+        self.size -= entry.size
+
+    def _evict(self) -> None:
+        hand = self._hand or self._oldest
+        while hand.visited:
+            hand.visited = False
+            hand = hand.prev or self._oldest
+        self._hand = hand
+        self._remove(hand)  # moves the hand on to the next newer entry
+        if hand.vary:
+            # Other variants are stored again on their next miss
+            self._vary.pop(hand.key[0], None)
+
+    # endregion
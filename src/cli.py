@@ -1,9 +1,59 @@
 import argparse
 import asyncio
+import os
+import socket
+import sys
+from pathlib import Path
 
+from config import ROUTES_PATH, count_routes
+from handoff import HandoffServer, confirm, take_listener
+from metrics import capacity, registry
+from rp_logging import setup_logging
 from server import serve
 
 
+def run_worker(
+    host: str,
+    port: int,
+    worker_index: int = 0,
+    control: socket.socket | None = None,
+    **kwargs,
+):
+    registry.attach(worker_index)
+    # The logging queue listener thread doesn't survive a fork, so every
+    # worker process sets up its own
+    setup_logging()
+
+    def ready():
+        # The old process drains once confirmed, so only once we serve. If
+        # we fail before, it sees the control socket close and carries on
+        if control is not None:
+            confirm(control)
+
+    try:
+        asyncio.run(serve(host, port, ready=ready, **kwargs))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control is not None:
+            control.close()
+
+
+def listen_with_handoff(
+    host: str, port: int, path: str, backlog: int
+) -> tuple[socket.socket, socket.socket | None]:
+    """The listening socket, taken over from the proxy serving handoffs on
+    ``path`` if there is one, with the control socket to confirm it on.
+    """
+    taken = take_listener(path)
+    if taken is None:
+        sock, control = socket.create_server((host, port), backlog=backlog), None
+    else:
+        sock, control = taken
+    sock.setblocking(False)
+    return sock, control
+
+
 def main():
     parser = argparse.ArgumentParser(description="Start the reverse proxy server.")
     parser.add_argument(
@@ -12,19 +62,205 @@ def main():
     parser.add_argument(
         "--port", type=int, default=8080, help="Port to listen on (default: 8080)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, 0 means one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "--write-buffer-high",
+        type=int,
+        default=None,
+        help="Write buffer size in bytes above which the other side of a proxied "
+        "connection stops being read (default: 65536)",
+    )
+    parser.add_argument(
+        "--write-buffer-low",
+        type=int,
+        default=None,
+        help="Write buffer size in bytes below which reading resumes (default: 16384)",
+    )
+    parser.add_argument(
+        "--routes",
+        type=Path,
+        default=None,
+        help="Routes file, reloaded on SIGHUP (default: src/routes.yaml)",
+    )
+    parser.add_argument(
+        "--watch-routes",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Also reload the routes file when it changes, checking this often",
+    )
+
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="How long in-flight requests may take to finish on SIGTERM (default: 30)",
+    )
+    for name, default, help in (
+        ("header", 10.0, "to receive a request head"),
+        ("idle", 60.0, "a kept-alive client connection may sit idle"),
+        ("connect", 5.0, "to connect to an upstream"),
+        ("response", 60.0, "without any bytes moving while a request is in flight"),
+    ):
+        parser.add_argument(
+            f"--{name}-timeout",
+            type=float,
+            default=default,
+            metavar="SECONDS",
+            help=f"Seconds {help}, 0 disables it (default: {default:g})",
+        )
+    parser.add_argument(
+        "--concurrency-limit",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Most requests in flight to upstreams per worker. The limit adapts "
+        "below N as upstream latency rises, requests over it get 503",
+    )
+    parser.add_argument(
+        "--client-rate",
+        type=float,
+        default=None,
+        metavar="PER_SECOND",
+        help="Requests a second each client address may make per worker, "
+        "requests over it get 429",
+    )
+    parser.add_argument(
+        "--client-burst",
+        type=float,
+        default=None,
+        help="Requests a client may make at once (default: --client-rate)",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=100,
+        help="Connections waiting to be accepted, beyond them the kernel "
+        "refuses or drops new ones (default: 100)",
+    )
+    parser.add_argument(
+        "--handoff",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Unix socket for zero-downtime upgrades. If a proxy is serving "
+        "handoffs on PATH, take over its listening socket, and it drains and "
+        "exits; then serve handoffs on PATH for the next version",
+    )
+    parser.add_argument(
+        "--admin-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics of all workers on this port at /metrics",
+    )
+    parser.add_argument(
+        "--admin-host",
+        type=str,
+        default="127.0.0.1",
+        help="Host the admin port binds to (default: 127.0.0.1)",
+    )
+
+    parser.add_argument(
+        "--access-log",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help="Append a line per response to this file, reopened on SIGHUP",
+    )
+    parser.add_argument(
+        "--access-log-buffer",
+        type=int,
+        default=65536,
+        metavar="LINES",
+        help="Access log lines buffered per worker while the file is written; "
+        "beyond that lines are dropped (default: 65536)",
+    )
 
     args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+    options = {
+        "write_buffer_high": args.write_buffer_high,
+        "write_buffer_low": args.write_buffer_low,
+        "routes_path": args.routes,
+        "watch_interval": args.watch_routes,
+        "drain_timeout": args.drain_timeout,
+        "admin_host": args.admin_host,
+        "admin_port": args.admin_port,
+        "access_log": args.access_log,
+        "access_log_buffer": args.access_log_buffer,
+        "timeouts": {
+            name: getattr(args, f"{name}_timeout")
+            for name in ("header", "idle", "connect", "response")
+        },
+        "concurrency_limit": args.concurrency_limit,
+        "client_rate": args.client_rate,
+        "client_burst": args.client_burst,
+        "backlog": args.backlog,
+    }
+    handoff_server = control = None
+    if args.handoff:
+        # One listening socket for all workers, it is what gets handed over
+        options["sock"], control = listen_with_handoff(
+            args.host, args.port, args.handoff, args.backlog
+        )
+        handoff_server = HandoffServer(args.handoff, options["sock"])
 
-    # Pass args to serve
+    # Before forking, so the workers share the metrics memory
+    registry.share(workers, *capacity(*count_routes(args.routes or ROUTES_PATH)))
 
-    try:
-        asyncio.run(serve(args.host, args.port))
-    except KeyboardInterrupt:
-        pass
+    if workers == 1:
+        if handoff_server is not None:
+            handoff_server.start()
+        run_worker(args.host, args.port, control=control, **options)
+        return
 
+    from supervisor import Supervisor
 
-if __name__ == "__main__":
-    from .rp_logging import setup_logging
+    # Threads of the supervisor only start once the workers are forked
+    setup_logging(threaded=False)
+    if "sock" not in options:
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Every worker binds its own socket and the kernel balances
+            # between them
+            options["reuse_port"] = True
+        else:
+            # Workers inherit one pre-bound socket and compete on accept
+            sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+            sock.setblocking(False)
+            options["sock"] = sock
 
-    setup_logging()
+    def worker():
+        index = supervisor.worker_index
+        # The first worker confirms the handoff once it serves
+        if index != 0 and control is not None:
+            control.close()
+        run_worker(
+            args.host,
+            args.port,
+            worker_index=index,
+            control=control if index == 0 else None,
+            **options,
+        )
+
+    def on_start():
+        nonlocal control
+        if control is not None:
+            # Only the first worker holds it now, workers restarted later
+            # have nothing to confirm
+            control.close()
+            control = None
+        if handoff_server is not None:
+            handoff_server.start()
+
+    supervisor = Supervisor(worker, workers, on_start=on_start)
+    sys.exit(supervisor.run())
+
+
+if __name__ == "__main__":
     main()
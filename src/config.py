@@ -1,18 +1,202 @@
+import logging
+from collections.abc import Callable, Iterator
 from pathlib import Path
 
 import yaml
 
+from admission import ConcurrencyLimit
+from balancer import UpstreamGroup, make_group
+from cache import ResponseCache
+from host_index import HostIndex
+from metrics import RouteMetrics
+from resolver import Resolver
 from route_trie import RouteTrie, Target
+from static import StaticFiles
 
+ROUTES_PATH = Path(__file__).parent / "routes.yaml"
+SNAPSHOT_SUFFIX = ".snapshot"
 
-def load_routes(path: Path = Path(__file__).parent / "routes.yaml") -> RouteTrie:
-    data: dict[str, dict[str, dict[str, str]]]
-    with open(path, "r") as f:
-        data = yaml.safe_load(f)
+# The libyaml based loader is an order of magnitude faster, when available
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+
+def load_routes(
+    path: Path = ROUTES_PATH,
+    resolver: Resolver | None = None,
+) -> HostIndex:
+    """Build the compiled route tables, indexed by virtual host.
+
+    ``routes`` serves any host, and each entry under ``hosts`` (an exact
+    name or a ``*.`` wildcard) has a route table of its own. Nothing global
+    is touched, so this can run in a thread while the old tables serve
+    requests; the backends to watch are listed in ``HostIndex.upstreams``.
+
+    A route snapshot (see ``snapshot.py``) is used instead of the YAML file
+    when ``path`` is one, or when one next to it is at least as new. If
+    that one can't be loaded, the YAML file is.
+    """
+    if resolver is None:
+        resolver = Resolver()
+    path = Path(path)
+    snapshot_path = find_snapshot(path)
+    if snapshot_path is not None:
+        from snapshot import load_snapshot
+
+        try:
+            return load_snapshot(snapshot_path, resolver)
+        except (OSError, ValueError) as exc:
+            if snapshot_path == path:  # no YAML file to fall back to
+                raise
+            logger.error(
+                "Ignoring %s, loading %s instead: %s", snapshot_path, path, exc
+            )
+
+    data = read_routes(path)
+    index = HostIndex()
+
+    for host, routes in iter_tables(data):
+
+        def make_target(
+            route: str, spec: dict, host: str | None = host
+        ) -> UpstreamGroup | StaticFiles:
+            return make_route_target(spec, resolver, index.upstreams, host, route)
+
+        compiled = build_trie(routes, make_target).compile()
+        if host is None:
+            index.default = compiled
+        else:
+            index.add(host.encode(), compiled)
+    return index
+
+
+def count_routes(path: Path = ROUTES_PATH) -> tuple[int, int]:
+    """The routes and distinct backends of a routes file, without loading it."""
+    path = Path(path)
+    if path.suffix == SNAPSHOT_SUFFIX:
+        from snapshot import read_specs
+
+        specs = read_specs(path)
+    else:
+        specs = [
+            spec
+            for _, routes in iter_tables(read_routes(path))
+            for spec in routes.values()
+        ]
+    backends = {
+        (upstream["host"], str(upstream.get("port", "80")))
+        for spec in specs
+        if "root" not in spec
+        for upstream in spec.get("upstreams", [spec])
+    }
+    return len(specs), len(backends)
+
+
+def iter_tables(data: dict) -> Iterator[tuple[str | None, dict[str, dict]]]:
+    """The route tables of a routes file, ``None`` for the default host."""
+    if data.get("routes"):
+        yield None, data["routes"]
+    yield from (data.get("hosts") or {}).items()
+
+
+def read_routes(path: Path) -> dict[str, dict]:
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def find_snapshot(path: Path) -> Path | None:
+    if path.suffix == SNAPSHOT_SUFFIX:
+        return path
+    snapshot_path = path.with_suffix(SNAPSHOT_SUFFIX)
+    try:
+        if snapshot_path.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            return snapshot_path
+    except FileNotFoundError:
+        return None
+    logger.warning("Ignoring %s, it is older than %s", snapshot_path, path)
+    return None
+
+
+def build_trie(
+    routes: dict[str, dict], make_target: Callable[[str, dict], object]
+) -> RouteTrie:
+    """Build a route trie, mapping every route to ``make_target(route, spec)``."""
     trie = RouteTrie()
-    for route, target in data["routes"].items():
-        trie.insert(
-            route.encode(),
-            Target(target["host"].encode(), str(target.get("port", "80")).encode()),
-        )
+    for route, spec in routes.items():
+        trie.insert(route.encode(), make_target(route, spec))
     return trie
+
+
+def make_route_target(
+    spec: dict,
+    resolver: Resolver,
+    upstreams: list[tuple[Target, bytes | None]],
+    host: str | None = None,
+    route: str = "",
+) -> UpstreamGroup | StaticFiles:
+    """Build what a route maps to: files below ``root``, or upstreams.
+
+    ``host`` and ``route`` label its metrics.
+    """
+    if "root" in spec:
+        return StaticFiles(
+            spec["root"],
+            index=spec.get("index", "index.html"),
+            max_open_files=int(spec.get("max_open_files", 256)),
+            metrics=RouteMetrics(host or "", route),
+        )
+    return make_upstream_group(spec, resolver, upstreams, host, route)
+
+
+def make_upstream_group(
+    spec: dict,
+    resolver: Resolver,
+    upstreams: list[tuple[Target, bytes | None]],
+    host: str | None = None,
+    route: str = "",
+) -> UpstreamGroup:
+    """Build the UpstreamGroup of one route.
+
+    A route either points at a single backend with ``host``/``port``, or
+    at several with an ``upstreams`` list (each entry may set a
+    ``weight``) and a ``balance`` policy. Every backend is appended to
+    ``upstreams`` with the route's ``health_check`` path, or None to probe
+    it with a TCP connect. ``cache`` is either true or a mapping with
+    ``max_bytes`` and ``max_entry_bytes``, and gives the route a
+    ResponseCache. ``limit`` is the most requests the route sends upstream
+    at once, or a mapping of ConcurrencyLimit arguments.
+    """
+    tunnel = bool(spec.get("tunnel", False))
+    health_check = spec.get("health_check")
+    if health_check is not None:
+        health_check = health_check.encode()
+    targets = []
+    for upstream in spec.get("upstreams", [spec]):
+        target = Target(
+            upstream["host"].encode(),
+            str(upstream.get("port", "80")).encode(),
+            tunnel=tunnel,
+            weight=int(upstream.get("weight", 1)),
+        )
+        try:
+            target.addrs = resolver.resolve_now(upstream["host"], int(target.port))
+        except OSError as exc:
+            # resolved again on first connect
+            logger.warning("Failed to resolve %s: %s", upstream["host"], exc)
+        upstreams.append((target, health_check))
+        targets.append(target)
+    group = make_group(
+        targets,
+        spec.get("balance", "round_robin"),
+        RouteMetrics(host or "", route, targets),
+    )
+    cache = spec.get("cache")
+    if cache:
+        group.cache = ResponseCache(**(cache if isinstance(cache, dict) else {}))
+    limit = spec.get("limit")
+    if limit:
+        group.limit = ConcurrencyLimit(
+            **(limit if isinstance(limit, dict) else {"max_limit": int(limit)})
+        )
+    return group
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import socket
+import threading
+from collections.abc import Callable
+
+READY = b"ready"
+
+
+def take_listener(path: str) -> tuple[socket.socket, socket.socket] | None:
+    """Take the listening socket of the proxy serving handoffs on ``path``.
+
+    Returns the listener and the control connection, or None if no proxy
+    is listening there. Call :func:`confirm` on the control connection once
+    the listener is being served, which makes the old proxy drain and exit.
+    """
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        control.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        control.close()
+        return None
+    _, fds, _, _ = socket.recv_fds(control, 16, 1)
+    if not fds:
+        control.close()
+        raise RuntimeError(f"No listening socket received from {path}")
+    return socket.socket(fileno=fds[0]), control
+
+
+def confirm(control: socket.socket) -> None:
+    with control:
+        control.sendall(READY)
+
+
+class HandoffServer:
+    """Hands the listening socket over to a new proxy process.
+
+    A Unix socket at ``path`` accepts a new process (see :func:`take_listener`)
+    and passes it the listener with ``SCM_RIGHTS``, so the listening socket
+    is never closed and no connection is refused. The kernel queues new
+    connections for whichever process accepts first. Once the new process
+    confirms, ``on_handoff`` runs, by default a SIGTERM to this process,
+    which drains it. The path is released before the listener is sent, so
+    the new process can serve handoffs in turn. If it never confirms, this
+    process binds the path again and carries on.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = ("_server", "confirm_timeout", "listener", "on_handoff", "path")
+
+    def __init__(
+        self,
+        path: str,
+        listener: socket.socket,
+        on_handoff: Callable[[], object] | None = None,
+        confirm_timeout: float = 10.0,
+    ):
+        self.path = path
+        self.listener = listener
+        self.on_handoff = on_handoff or (lambda: os.kill(os.getpid(), signal.SIGTERM))
+        self.confirm_timeout = confirm_timeout
+        self._server: socket.socket | None = None
+
+    def start(self) -> None:
+        self._bind()
+        threading.Thread(target=self._serve, name="handoff", daemon=True).start()
+
+    def _bind(self) -> None:
+        try:
+            os.unlink(self.path)  # left behind by a process that crashed
+        except FileNotFoundError:
+            pass
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(1)
+
+    def _release(self) -> None:
+        self._server.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                control, _ = self._server.accept()
+            except OSError:
+                return
+            with control:
+                self._release()
+                socket.send_fds(control, [b"listener"], [self.listener.fileno()])
+                control.settimeout(self.confirm_timeout)
+                try:
+                    confirmed = control.recv(len(READY)) == READY
+                except OSError:
+                    confirmed = False
+            if confirmed:
+                self.logger.info("Listening socket handed over, draining")
+                self.on_handoff()
+                return
+            self.logger.warning("Handoff was not confirmed, keep serving")
+            self._bind()
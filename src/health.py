@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+from resolver import connect
+
+if TYPE_CHECKING:
+    from route_trie import Target
+
+
+class HealthChecker:
+    """Active probes and passive outlier ejection for upstream targets.
+
+    The proxy reports the outcome of every request: a connect failure or a
+    5xx response is a failure, anything else a success. After
+    ``max_failures`` consecutive failures a target is ejected, so
+    ``Target.healthy`` is False and the balancer skips it. It is admitted
+    again after a backoff that doubles with every ejection in a row (capped
+    at ``max_ejection``). Alternatively, a background probe readmits it as
+    soon as the probe succeeds. The probe is a TCP connect, or a ``GET`` of
+    the route's ``health_check`` path when one is set.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_prober",
+        "_readmit_timers",
+        "_watched",
+        "base_ejection",
+        "interval",
+        "max_ejection",
+        "max_failures",
+        "timeout",
+    )
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        timeout: float = 1.0,
+        max_failures: int = 3,
+        base_ejection: float = 5.0,
+        max_ejection: float = 60.0,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        # target -> health check path, None for a plain TCP connect
+        self._watched: dict[Target, bytes | None] = {}
+        self._readmit_timers: dict[Target, asyncio.TimerHandle] = {}
+        self._prober: asyncio.Task | None = None
+
+    def watch(self, target: Target, path: bytes | None = None) -> None:
+        self._watched[target] = path
+
+    def watch_all(self, targets: Iterable[tuple[Target, bytes | None]]) -> None:
+        """Replace the probed targets, e.g. after the routes were reloaded."""
+        self._watched = dict(targets)
+        for target in list(self._readmit_timers):
+            if target not in self._watched:
+                self._readmit_timers.pop(target).cancel()
+
+    def start(self) -> None:
+        if self._prober is None:
+            self._prober = asyncio.get_running_loop().create_task(self._probe_loop())
+
+    def stop(self) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
+        for timer in self._readmit_timers.values():
+            timer.cancel()
+        self._readmit_timers.clear()
+
+    # region Passive checks
+
+    def success(self, target: Target) -> None:
+        if target.failures:
+            target.failures = 0
+            target.ejections = 0
+
+    def failure(self, target: Target) -> None:
+        target.failures += 1
+        if target.healthy and target.failures >= self.max_failures:
+            self.eject(target)
+
+    def eject(self, target: Target) -> None:
+        backoff = min(self.base_ejection * 2**target.ejections, self.max_ejection)
+        self.logger.warning(
+            "Ejecting upstream %s:%s for %.1fs after %d failures",
+            target.host,
+            target.port,
+            backoff,
+            target.failures,
+        )
+        target.healthy = False
+        target.ejections += 1
+        self._readmit_timers[target] = asyncio.get_running_loop().call_later(
+            backoff, self.readmit, target
+        )
+
+    def readmit(self, target: Target) -> None:
+        timer = self._readmit_timers.pop(target, None)
+        if timer is not None:
+            timer.cancel()
+        if target.healthy:
+            return
+        self.logger.info("Readmitting upstream %s:%s", target.host, target.port)
+        target.healthy = True
+        # One more failure ejects it again, for longer
+        target.failures = self.max_failures - 1
+
+    # endregion
+
+    # region Active checks
+
+    async def probe(self, target: Target, path: bytes | None) -> bool:
+        writer = None
+        try:
+            async with asyncio.timeout(self.timeout):
+                if target.addrs is not None:
+                    reader, writer = await asyncio.open_connection(
+                        sock=await connect(target.addrs)
+                    )
+                else:
+                    reader, writer = await asyncio.open_connection(
+                        target.host.decode(), int(target.port)
+                    )
+                if path is None:
+                    return True
+                writer.write(
+                    b"GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n"
+                    % (path, target.host)
+                )
+                status_line = await reader.readline()
+        except (OSError, TimeoutError):
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+        parts = status_line.split(None, 2)
+        return len(parts) >= 2 and parts[1].isdigit() and int(parts[1]) < 500
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            targets = list(self._watched.items())
+            results = await asyncio.gather(
+                *(self.probe(target, path) for target, path in targets),
+                return_exceptions=True,
+            )
+            for (target, _), ok in zip(targets, results):
+                if isinstance(ok, BaseException):
+                    # Never let one probe end the loop, it counts as failed
+                    self.logger.error(
+                        "Probe of %s:%s failed", target.host, target.port, exc_info=ok
+                    )
+                    ok = False
+                if ok:
+                    if not target.healthy:
+                        self.readmit(target)
+                elif target.healthy:
+                    self.failure(target)
+
+    # endregion
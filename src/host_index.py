@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from route_trie import CompiledRoutes, Target
+
+
+class _LabelNode:
+    __slots__ = ("children", "routes")
+
+    def __init__(self) -> None:
+        self.children: dict[bytes, _LabelNode] = {}
+        self.routes: CompiledRoutes | None = None
+
+
+class HostIndex:
+    """Selects the route table for the ``Host`` of a request.
+
+    Exact hosts live in a dict, so the common case is one lookup of the
+    header value as sent. Wildcards like ``*.example.com`` live in a trie
+    of reversed labels (``com`` -> ``example``), which picks the longest
+    matching suffix. A wildcard matches one or more extra labels, never
+    the bare domain. Requests for any other host, or without a host, use
+    the ``default`` table.
+    """
+
+    __slots__ = ("default", "exact", "upstreams", "wildcards")
+
+    def __init__(self, default: CompiledRoutes | None = None) -> None:
+        self.exact: dict[bytes, CompiledRoutes] = {}
+        self.wildcards: _LabelNode = _LabelNode()
+        self.default = default
+        # every backend of every table, with its health check path
+        self.upstreams: list[tuple[Target, bytes | None]] = []
+
+    def add(self, host: bytes, routes: CompiledRoutes) -> None:
+        host = host.lower().rstrip(b".")
+        if not host.startswith(b"*."):
+            self.exact[host] = routes
+            return
+        node = self.wildcards
+        for label in reversed(host[2:].split(b".")):
+            node = node.children.setdefault(label, _LabelNode())
+        node.routes = routes
+
+    def lookup(self, host: bytes | None) -> CompiledRoutes | None:
+        if host is None:
+            return self.default
+        routes = self.exact.get(host)
+        if routes is not None:
+            return routes
+
+        host = host.lower()
+        if host[-1:] != b"]":  # not a bare IPv6 literal
+            host = host.rpartition(b":")[0] or host  # strip the port
+        host = host.rstrip(b".")
+        routes = self.exact.get(host)
+        if routes is not None:
+            return routes
+
+        labels = host.split(b".")
+        node = self.wildcards
+        routes = self.default
+        # labels[0] is never consumed, a wildcard needs at least one label
+        for i in range(len(labels) - 1, 0, -1):
+            node = node.children.get(labels[i])
+            if node is None:
+                break
+            if node.routes is not None:
+                routes = node.routes
+        return routes
@@ -0,0 +1,377 @@
+"""Counters and latency histograms shared by all worker processes.
+
+One anonymous shared mapping is created before the workers are forked, and
+every worker writes to its own region of it, so recording takes no locks
+and no syscalls. Whichever worker answers a scrape on the admin port sums
+the regions of all workers. A worker restarted by the supervisor takes
+over the region of the one it replaces, so counters never go backwards.
+
+A region is int64 words: a header (series count, next free word), a
+directory of up to ``max_series`` series (data offset, kind, name length,
+name), then the data. ``capacity`` sizes regions for a routes file.
+A counter is one word. A histogram is ``BUCKETS`` log-linear buckets of
+microseconds, 8 per power of two (HDR style, 12.5% precision up to about
+4.5 minutes), then the count and the sum.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import mmap
+import socket
+import threading
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from route_trie import Target
+
+REGION_SIZE = 4 * 1024 * 1024
+MAX_SERIES = 2048
+HEADER_WORDS = 8
+ENTRY_WORDS = 32
+NAME_SIZE = (ENTRY_WORDS - 3) * 8
+
+COUNTER = 0
+HISTOGRAM = 1
+
+SUB_BITS = 3  # 8 buckets per power of two
+MAX_US = (1 << 28) - 1
+BUCKETS = ((MAX_US.bit_length() - SUB_BITS - 1) << SUB_BITS) + (1 << (SUB_BITS + 1))
+COUNT = BUCKETS
+SUM = BUCKETS + 1
+HISTOGRAM_WORDS = BUCKETS + 2
+
+
+def region_size(histograms: int, counters: int) -> int:
+    """Bytes of a region holding that many histograms and counters."""
+    series = histograms + counters
+    return 8 * (
+        HEADER_WORDS + series * ENTRY_WORDS + histograms * HISTOGRAM_WORDS + counters
+    )
+
+
+def capacity(routes: int, upstreams: int) -> tuple[int, int]:
+    """Region size and series for ``routes`` routes and ``upstreams`` backends.
+
+    Leaves room for reloads to add as many again, and never goes below the
+    defaults.
+    """
+    histograms = 2 * (
+        routes * RouteMetrics.HISTOGRAMS + upstreams * UpstreamMetrics.HISTOGRAMS
+    )
+    counters = 2 * (
+        routes * RouteMetrics.COUNTERS + upstreams * UpstreamMetrics.COUNTERS
+    )
+    return (
+        max(REGION_SIZE, region_size(histograms, counters)),
+        max(MAX_SERIES, histograms + counters),
+    )
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Exclusive upper bound of a histogram bucket, in microseconds."""
+    if index < 1 << (SUB_BITS + 1):
+        return index + 1
+    shift = (index >> SUB_BITS) - 1
+    return ((index & ((1 << SUB_BITS) - 1) | 1 << SUB_BITS) + 1) << shift
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    __slots__ = ("index", "words")
+
+    def __init__(self, words: memoryview, index: int):
+        self.words = words
+        self.index = index
+
+    def inc(self, amount: int = 1) -> None:
+        self.words[self.index] += amount
+
+
+class Histogram:
+    __slots__ = ("words",)
+
+    def __init__(self, words: memoryview):
+        self.words = words
+
+    def record(
+        self,
+        ns: int,
+        MAX_US=MAX_US,  # bytecode opt
+        COUNT=COUNT,  # bytecode opt
+        SUM=SUM,  # bytecode opt
+        max=max,  # bytecode opt
+        min=min,  # bytecode opt
+    ) -> None:
+        us = ns // 1000
+        if us < 16:
+            index = max(us, 0)
+        else:
+            us = min(us, MAX_US)
+            shift = us.bit_length() - 4
+            index = (shift << 3) + (us >> shift)
+        words = self.words
+        words[index] += 1
+        words[COUNT] += 1
+        words[SUM] += us
+
+
+class Registry:
+    """Allocates series by name in this worker's region and renders all of them.
+
+    Asking for a name that already exists returns the same storage, so
+    reloaded routes keep counting where the old tables stopped.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_full",
+        "_lock",
+        "_map",
+        "_names",
+        "_words",
+        "max_series",
+        "region_size",
+        "workers",
+    )
+
+    def __init__(
+        self,
+        workers: int = 1,
+        region_size: int = REGION_SIZE,
+        max_series: int = MAX_SERIES,
+    ):
+        self._lock = threading.Lock()
+        self.share(workers, region_size, max_series)
+
+    def share(
+        self,
+        workers: int,
+        region_size: int = REGION_SIZE,
+        max_series: int = MAX_SERIES,
+    ) -> None:
+        """Make room for ``workers`` processes; call it before forking them."""
+        self.workers = workers
+        self.region_size = region_size
+        self.max_series = max_series
+        # Anonymous mappings are shared with the children forked later
+        self._map = mmap.mmap(-1, workers * region_size)
+        self.attach(0)
+
+    def attach(self, worker: int) -> None:
+        """Record into the region of ``worker`` from now on."""
+        with self._lock:
+            self._words = self._region(worker)
+            self._names: dict[str, tuple[int, int]] = dict(self._directory(self._words))
+            self._full = False
+            if not self._words[1]:
+                self._words[1] = HEADER_WORDS + self.max_series * ENTRY_WORDS
+
+    def _region(self, worker: int) -> memoryview:
+        start = worker * self.region_size
+        return memoryview(self._map)[start : start + self.region_size].cast("q")
+
+    @staticmethod
+    def _directory(words: memoryview) -> Iterable[tuple[str, tuple[int, int]]]:
+        names = words.cast("B")
+        for i in range(words[0]):
+            entry = HEADER_WORDS + i * ENTRY_WORDS
+            start = (entry + 3) * 8
+            name = bytes(names[start : start + words[entry + 2]]).decode()
+            yield name, (words[entry], words[entry + 1])
+
+    def counter(self, name: str) -> Counter:
+        words, offset = self._allocate(name, COUNTER, 1)
+        return Counter(words, offset)
+
+    def histogram(self, name: str) -> Histogram:
+        words, offset = self._allocate(name, HISTOGRAM, HISTOGRAM_WORDS)
+        return Histogram(words[offset : offset + HISTOGRAM_WORDS])
+
+    def _allocate(self, name: str, kind: int, size: int) -> tuple[memoryview, int]:
+        with self._lock:
+            words = self._words
+            found = self._names.get(name)
+            if found is not None and found[1] == kind:
+                return words, found[0]
+            encoded = name.encode()
+            offset = words[1]
+            if (
+                words[0] >= self.max_series
+                or len(encoded) > NAME_SIZE
+                or (offset + size) * 8 > self.region_size
+            ):
+                if not self._full:
+                    self._full = True
+                    self.logger.warning("Metrics region full, not exporting %s", name)
+                return memoryview(bytearray(size * 8)).cast("q"), 0
+
+            entry = HEADER_WORDS + words[0] * ENTRY_WORDS
+            words[entry] = offset
+            words[entry + 1] = kind
+            words[entry + 2] = len(encoded)
+            start = (entry + 3) * 8
+            words.cast("B")[start : start + len(encoded)] = encoded
+            words[1] = offset + size
+            # Published last, a concurrent scrape never sees a partial entry
+            words[0] += 1
+            self._names[name] = (offset, kind)
+            return words, offset
+
+    def collect(self) -> dict[str, tuple[int, list[int]]]:
+        """Every series summed over all workers, by name."""
+        totals: dict[str, tuple[int, list[int]]] = {}
+        for worker in range(self.workers):
+            words = self._region(worker)
+            for name, (offset, kind) in self._directory(words):
+                size = HISTOGRAM_WORDS if kind == HISTOGRAM else 1
+                values = words[offset : offset + size].tolist()
+                if name in totals:
+                    values = [a + b for a, b in zip(totals[name][1], values)]
+                totals[name] = (kind, values)
+        return totals
+
+    def render(self) -> bytes:
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+        for name, (kind, values) in sorted(self.collect().items()):
+            family, _, labels = name.partition("{")
+            labels = labels.rstrip("}")
+            if family not in typed:
+                typed.add(family)
+                lines.append(
+                    f"# TYPE {family} {'histogram' if kind == HISTOGRAM else 'counter'}"
+                )
+            if kind == COUNTER:
+                lines.append(f"{name} {values[0]}")
+                continue
+            prefix = f"{family}_bucket{{{labels}," if labels else f"{family}_bucket{{"
+            cumulative = 0
+            for index in range(BUCKETS):
+                cumulative += values[index]
+                upper = bucket_upper_bound(index)
+                if upper & (upper - 1) == 0 and upper >= 16:  # powers of two
+                    lines.append(f'{prefix}le="{upper / 1e6!r}"}} {cumulative}')
+            lines.append(f'{prefix}le="+Inf"}} {values[COUNT]}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{family}_sum{suffix} {values[SUM] / 1e6!r}")
+            lines.append(f"{family}_count{suffix} {values[COUNT]}")
+        lines.append("")
+        return "\n".join(lines).encode()
+
+
+registry = Registry()
+
+
+class UpstreamMetrics:
+    __slots__ = ("connect", "errors", "total", "ttfb")
+
+    HISTOGRAMS = 3
+    COUNTERS = 1
+
+    def __init__(self, target: Target):
+        labels = f'upstream="{escape_label(target.host.decode())}:{int(target.port)}"'
+        self.connect = registry.histogram(
+            f'proxy_upstream_stage_seconds{{stage="connect",{labels}}}'
+        )
+        self.ttfb = registry.histogram(
+            f'proxy_upstream_stage_seconds{{stage="ttfb",{labels}}}'
+        )
+        self.total = registry.histogram(
+            f'proxy_upstream_stage_seconds{{stage="total",{labels}}}'
+        )
+        self.errors = registry.counter(f"proxy_upstream_errors_total{{{labels}}}")
+
+
+class RouteMetrics:
+    """Stage latencies and response counts of one route and its upstreams.
+
+    ``route`` runs from accepting the connection (or, on a kept-alive
+    connection, from parsing the request head) until the route matched,
+    ``connect`` until the request head was sent upstream, ``ttfb`` until
+    the first response byte arrived and ``total`` until the response was
+    complete.
+    """
+
+    __slots__ = ("connect", "responses", "route", "shed", "total", "ttfb", "upstreams")
+
+    HISTOGRAMS = 4
+    COUNTERS = 6
+
+    def __init__(self, vhost: str, route: str, targets: Iterable[Target] = ()):
+        labels = f'route="{escape_label(route)}",vhost="{escape_label(vhost)}"'
+        self.route = registry.histogram(
+            f'proxy_stage_seconds{{stage="route",{labels}}}'
+        )
+        self.connect = registry.histogram(
+            f'proxy_stage_seconds{{stage="connect",{labels}}}'
+        )
+        self.ttfb = registry.histogram(f'proxy_stage_seconds{{stage="ttfb",{labels}}}')
+        self.total = registry.histogram(
+            f'proxy_stage_seconds{{stage="total",{labels}}}'
+        )
+        # By status class, 1xx to 5xx
+        self.responses = [
+            registry.counter(f'proxy_responses_total{{code="{i}xx",{labels}}}')
+            for i in range(1, 6)
+        ]
+        # Requests answered 503 by the concurrency limits
+        self.shed = registry.counter(f"proxy_shed_total{{{labels}}}")
+        self.upstreams = {target: UpstreamMetrics(target) for target in targets}
+
+    def response(self, status: int) -> None:
+        if 100 <= status < 600:
+            self.responses[status // 100 - 1].inc()
+
+
+class AdminProtocol(asyncio.Protocol):
+    """Answers ``GET /metrics`` on the admin port, then closes."""
+
+    __slots__ = ("buf", "transport")
+
+    def __init__(self):
+        self.transport: asyncio.Transport | None = None
+        self.buf = bytearray()
+
+    def connection_made(self, transport: asyncio.Transport):  # type: ignore
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        self.buf.extend(data)
+        if b"\r\n\r\n" not in self.buf:
+            if len(self.buf) > 8192:
+                self.transport.close()
+            return
+        if self.buf.startswith(b"GET /metrics ") or self.buf.startswith(
+            b"GET /metrics?"
+        ):
+            body = registry.render()
+            self.transport.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body
+            )
+        else:
+            self.transport.write(
+                b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+        self.transport.close()
+
+
+async def serve_admin(host: str, port: int) -> asyncio.Server:
+    """Serve metrics on ``host:port``.
+
+    Every worker binds the port, and whichever one the kernel picks reports
+    the totals of all workers.
+    """
+    return await asyncio.get_running_loop().create_server(
+        AdminProtocol, host, port, reuse_port=hasattr(socket, "SO_REUSEPORT")
+    )
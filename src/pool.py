@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+
+PoolKey = tuple[bytes, bytes]
+
+
+class UpstreamPool:
+    """Keep-alive pool of idle upstream transports shared by all client connections.
+
+    Idle transports are keyed by ``(host, port)`` of their target. A single
+    ordered dict keeps them in release order, which doubles as the LRU order
+    for the global ``max_idle`` cap and as the expiry order for
+    ``idle_timeout``. ``max_per_host`` caps idle transports kept per target;
+    in-use transports are never limited, the proxy always opens a new one
+    when nothing idle is available.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_idle",
+        "_per_host",
+        "_sweeper",
+        "idle_timeout",
+        "max_idle",
+        "max_per_host",
+    )
+
+    def __init__(
+        self, max_idle: int = 512, max_per_host: int = 64, idle_timeout: float = 30.0
+    ):
+        self.max_idle = max_idle
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        # transport -> (key, released_at); oldest first
+        self._idle: OrderedDict[asyncio.Transport, tuple[PoolKey, float]] = (
+            OrderedDict()
+        )
+        # key -> stack of idle transports, most recently released last
+        self._per_host: dict[PoolKey, list[asyncio.Transport]] = {}
+        self._sweeper: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def acquire(self, key: PoolKey) -> asyncio.Transport | None:
+        """Check out the most recently released live transport for ``key``."""
+        stack = self._per_host.get(key)
+        while stack:
+            transport = stack.pop()
+            del self._idle[transport]
+            if not transport.is_closing():
+                return transport
+        return None
+
+    def release(self, key: PoolKey, transport: asyncio.Transport) -> None:
+        """Return a transport whose response has been fully read to the pool."""
+        if transport.is_closing():
+            return
+        if self.max_idle <= 0 or self.max_per_host <= 0:
+            transport.close()
+            return
+
+        stack = self._per_host.setdefault(key, [])
+        if len(stack) >= self.max_per_host:
+            self._evict(stack[0])
+        stack.append(transport)
+        self._idle[transport] = (key, monotonic())
+
+        while len(self._idle) > self.max_idle:
+            self._evict(next(iter(self._idle)))
+
+        if self._sweeper is None:
+            self._schedule_sweep()
+
+    def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for transport in list(self._idle):
+            self._evict(transport)
+
+    def _evict(self, transport: asyncio.Transport) -> None:
+        key, _ = self._idle.pop(transport)
+        stack = self._per_host[key]
+        stack.remove(transport)
+        if not stack:
+            del self._per_host[key]
+        if not transport.is_closing():
+            transport.close()
+
+    def _schedule_sweep(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._sweeper = loop.call_later(self.idle_timeout / 2, self._sweep)
+
+    def _sweep(self) -> None:
+        self._sweeper = None
+        deadline = monotonic() - self.idle_timeout
+        idle = self._idle
+        while idle:
+            transport = next(iter(idle))
+            _, released_at = idle[transport]
+            if released_at > deadline and not transport.is_closing():
+                break
+            self._evict(transport)
+        self.logger.debug("Idle upstream sweep done, %d kept", len(idle))
+        if idle:
+            self._schedule_sweep()
@@ -2,33 +2,149 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import TYPE_CHECKING, Callable
+import re
+from math import ceil
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Callable, ClassVar
 from weakref import WeakSet
 
-from httptools import HttpRequestParser, parse_url
+from httptools import (
+    HttpParserError,
+    HttpParserUpgrade,
+    HttpRequestParser,
+    HttpResponseParser,
+    parse_url,
+)
 
-from config import load_routes
+from cache import CacheFill, etag_matches, parse_headers
+from config import ROUTES_PATH, load_routes
+from health import HealthChecker
+from pool import UpstreamPool
+from resolver import Resolver, connect
+from static import FileSender, StaticFiles
+from timer_wheel import Timer, TimerWheel
+from tunnel import SPLICE_SUPPORTED, hand_over
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
+    from access_log import AccessLog
+    from admission import ConcurrencyLimit, TokenBuckets
+    from balancer import UpstreamGroup
+    from cache import CacheEntry, ResponseCache
+    from host_index import HostIndex
     from route_trie import Target
 
 
-class UpStreamReaderProtocol(asyncio.StreamReaderProtocol):
-    __slots__ = ()
+class UpStreamReaderProtocol(asyncio.Protocol):
+    """Forwards upstream bytes to the proxy while tracking response boundaries.
+
+    Bytes are handed to the proxy as they arrive and never retained. The
+    response parser only sees them, it never copies the payload (there is
+    no ``on_body``), and tells the proxy when a final (non-1xx) response is
+    complete so the upstream can be reused.
+    """
+
+    __slots__ = ("head_request", "proxy", "resp_parser", "transport")
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self.proxy: ReverseProxy | None = None
+        self.transport: asyncio.Transport | None = None
+        self.resp_parser: HttpResponseParser | None = None
+        self.head_request: bool = False
+
+    def connection_made(self, transport: asyncio.Transport):  # type: ignore
+        self.transport = transport
+        self.resp_parser = HttpResponseParser(self)
 
-    proxy: "ReverseProxy" | None = None
+    def connection_lost(self, exc: Exception | None):
+        if self.proxy is not None:
+            self.proxy.upstream_done()
 
     def data_received(
         self,
         data: bytes,
-        __super_call=asyncio.StreamReaderProtocol.data_received,  # bytecode opt
+        HttpParserError=HttpParserError,  # bytecode opt
+        HttpParserUpgrade=HttpParserUpgrade,  # bytecode opt
     ):
-        __super_call(self, data=data)
-        self.proxy.write(data)
+        if self.proxy is None:  # idle in the pool, nobody asked for these bytes
+            self.transport.close()
+            return
+        if self.proxy.sent:
+            self.proxy.first_byte_received()
+        self.proxy.progressed = True
+        if self.proxy.fill is None:
+            self.proxy.write(data)
+        else:
+            self.proxy.fill_received(data)
 
-    def eof_received(self, __super_call=asyncio.StreamReaderProtocol.eof_received):
+        if self.resp_parser is None:  # upgraded, raw tunnel from now on
+            return
+        try:
+            self.resp_parser.feed_data(data)
+        except HttpParserUpgrade:
+            self.resp_parser = None
+        except HttpParserError as exc:
+            self.logger.warning("Malformed upstream response: %s", exc)
+            self.resp_parser = None
+            self.proxy.upstream_done()
+
+    def eof_received(self):
+        if self.proxy is None:
+            self.transport.close()
+            return
         self.proxy.upstream_done()
-        return __super_call(self)
+
+    def pause_writing(self):
+        if self.proxy is not None:
+            self.proxy.upstream_pause_writing()
+
+    def resume_writing(self):
+        if self.proxy is not None:
+            self.proxy.upstream_resume_writing()
+
+    # region HttpResponseParser callbacks
+
+    def on_headers_complete(self):
+        if self.head_request and self.resp_parser.get_status_code() >= 200:
+            # The parser can't know there is no body after a HEAD request and
+            # would wait for Content-Length bytes, so finish here and start over
+            keep_alive = self.resp_parser.should_keep_alive()
+            status = self.resp_parser.get_status_code()
+            self.resp_parser = HttpResponseParser(self)
+            self.head_request = False
+            self.proxy.upstream_response_complete(keep_alive, status)
+
+    def on_message_complete(self):
+        status = self.resp_parser.get_status_code()
+        if status < 200:  # 100 Continue and friends
+            return
+        self.proxy.upstream_response_complete(
+            self.resp_parser.should_keep_alive(), status
+        )
+
+    # endregion
+
+
+# Special ReverseProxy.body_remaining values, besides a Content-Length countdown
+CHUNKED = -1  # the request parser tells where the body ends
+TUNNEL = -2  # upgraded or tunnel route, everything is forwarded raw
+# The line feed ending an empty line, where a chunked body may end
+EMPTY_LINE_END = re.compile(rb"(?<=\n)\r?\n")
+
+# Request headers about the client connection only, not forwarded upstream.
+# Transfer-Encoding stays, bodies are forwarded as they arrive, still chunked
+HOP_BY_HOP = frozenset(
+    (b"connection", b"keep-alive", b"proxy-connection", b"te", b"upgrade")
+)
+# Kept for an upgrade, which the upstream must see to switch protocols
+UPGRADE_HEADERS = frozenset((b"connection", b"upgrade"))
+# Connection options that don't name a header
+CONNECTION_OPTIONS = frozenset((b"close", b"keep-alive", b"upgrade"))
+REWRITTEN = HOP_BY_HOP | {b"x-forwarded-for"}
+REWRITTEN_LENGTHS = frozenset(len(name) for name in REWRITTEN)
 
 
 class ReverseProxy:
@@ -39,22 +155,97 @@ class ReverseProxy:
     __slots__ = (
         "transport",
         "upstream_transport",
+        "upstream_key",
         "req_parser",
+        "url",
         "path",
+        "host",
+        "method",
         "should_keep_alive",
+        "content_length",
+        "body_remaining",
+        "chunked_tail",
+        "in_flight",
+        "request_complete",
+        "upstream_idle",
+        "writing_paused",
+        "upstream_writing_paused",
+        "group",
         "target",
+        "fill",
+        "file_sender",
+        "started",
+        "routed",
+        "sent",
+        "peer",
+        "timer",
+        "progressed",
+        "connecting",
+        "admitted",
+        "strip_len",
+        "rewrites",
+        "forwarded_for",
+        "connection_headers",
+        "__parsed",
+        "__head",
         "__buf",
     )
 
+    __response_400 = (
+        b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    )
     __response_404 = (
         b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
     )
+    __response_408 = (
+        b"HTTP/1.1 408 Request Timeout\r\nContent-Length: 0\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    __response_431 = (
+        b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+        b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+    )
     __response_502 = (
         b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
     )
-    __route_trie = load_routes()
+    __response_504 = (
+        b"HTTP/1.1 504 Gateway Timeout\r\nContent-Length: 0\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    _resolver = Resolver()
+    # Set by serve when access logging is on
+    access_log: AccessLog | None = None
+    # Set by serve: the limit on requests in flight to all upstreams, next
+    # to each route's own, and the per-client rate limit
+    admission: ConcurrencyLimit | None = None
+    client_limit: TokenBuckets | None = None
+    # Seconds shed clients are asked to wait
+    retry_after = 1
+    # Added to the Via header of requests sent upstream
+    via = b"py-reverse-proxy"
+    _health = HealthChecker()
+    # Installed by install_routes, every request looks it up anew
+    _routes: HostIndex
+    routes_path: Path = ROUTES_PATH
+    _pool = UpstreamPool()
     _tasks: WeakSet[asyncio.Task] = WeakSet()
-    _loop = asyncio.get_event_loop()
+    _connections: ClassVar[set[ReverseProxy]] = set()
+    # Set by drain, every connection closes after its current response
+    draining = False
+    max_head_size = 64 * 1024
+    # High/low water marks of both the client and upstream write buffers, the
+    # other side stops being read while a buffer is above the high mark
+    write_buffer_high = 64 * 1024
+    write_buffer_low = 16 * 1024
+    # Seconds, None disables. The head must arrive within header_timeout of
+    # its first byte (or of the accept), a kept-alive connection may sit
+    # idle for idle_timeout, and an in-flight request is given up after
+    # response_timeout without any bytes moving in either direction
+    _timers = TimerWheel()
+    header_timeout: float | None = 10.0
+    idle_timeout: float | None = 60.0
+    connect_timeout: float | None = 5.0
+    response_timeout: float | None = 60.0
 
     def __init__(
         self,
@@ -66,130 +257,1020 @@ class ReverseProxy:
             lenient_keep_alive=True, lenient_data_after_close=True
         )
         self.should_keep_alive: bool = False
+        self.content_length: int = 0
+        self.body_remaining: int = 0
+        # Last bytes of a chunked body so far, for an empty line split by reads
+        self.chunked_tail: bytes = b""
+        self.in_flight: bool = False
+        self.request_complete: bool = False
+        self.upstream_idle: bool = False
+        self.writing_paused: bool = False
+        self.upstream_writing_paused: bool = False
+        self.method: bytes | None = None
+        self.__head: bytes | None = None
         self.__buf: bytearray = bytearray()
         self.upstream_transport: asyncio.Transport | None = None
-        self.path: str | None = None
+        self.upstream_key: tuple[bytes, bytes] | None = None
+        self.url: bytes | None = None
+        self.path: bytes | None = None
+        self.host: bytes | None = None
+        self.group: UpstreamGroup | StaticFiles | None = None
         self.target: Target | None = None
+        # Set while the response goes into the route's cache
+        self.fill: CacheFill | None = None
+        # Set while a static file is being sent
+        self.file_sender: FileSender | None = None
+        # perf_counter_ns() timestamps of the request stages, 0 when not reached
+        self.started: int = 0
+        self.routed: int = 0
+        self.sent: int = 0
+        # Client address, only looked up for the access log
+        self.peer: bytes | None = None
+        # One timer for whichever timeout applies to the current stage
+        self.timer = Timer(self.on_timeout)
+        # Set when bytes move while a request is in flight
+        self.progressed: bool = False
+        self.connecting: asyncio.Task | None = None
+        # Holds a slot of the concurrency limits
+        self.admitted: bool = False
+        # How the head is rewritten for the upstream, see outgoing_head
+        self.strip_len: int = 0
+        self.rewrites: list[tuple[int, int, bytes]] | None = None
+        self.forwarded_for: bytes | None = None
+        self.connection_headers: list[bytes] | None = None
+        # The head being parsed, header offsets are found in it
+        self.__parsed: bytes | None = None
+
+    @classmethod
+    def install_routes(cls, routes: HostIndex) -> None:
+        """Swap in new route tables.
+
+        Requests already routed keep their upstream group and target, only
+        requests parsed from now on see the new tables.
+        """
+        cls._resolver.watch_all(target for target, _ in routes.upstreams)
+        cls._health.watch_all(routes.upstreams)
+        cls._routes = routes
+
+    @classmethod
+    async def reload_routes(cls) -> bool:
+        """Load ``routes_path`` in a thread and install it.
+
+        The event loop keeps serving with the current tables meanwhile. If
+        the file is invalid those tables stay in place.
+        """
+        try:
+            routes = await asyncio.get_running_loop().run_in_executor(
+                None, load_routes, cls.routes_path, cls._resolver
+            )
+        except Exception:
+            # Whatever the file holds, the current tables keep serving
+            cls.logger.exception("Failed to reload %s", cls.routes_path)
+            return False
+        cls.install_routes(routes)
+        cls.logger.info("Reloaded routes from %s", cls.routes_path)
+        return True
+
+    @classmethod
+    async def drain(cls, timeout: float) -> None:
+        """Finish in-flight requests and close every connection.
+
+        Call it once the server stopped accepting. Idle connections close
+        right away, busy ones after their current response. Whatever is
+        still open after ``timeout`` seconds is closed.
+        """
+        cls.draining = True
+        for proxy in list(cls._connections):
+            if proxy.in_flight or proxy.__buf:
+                proxy.should_keep_alive = False
+            else:
+                proxy.connection_lost()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while cls._connections and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if cls._connections:
+            cls.logger.warning(
+                "Closing %d connections still busy after draining for %ss",
+                len(cls._connections),
+                timeout,
+            )
+            for proxy in list(cls._connections):
+                proxy.connection_lost()
+        cls._pool.close()
 
     # endregion
 
     # region asyncio.Protocol callbacks
 
     def connection_made(self, transport: asyncio.Transport):  # type: ignore
-        self.logger.debug("Connection established: %s", transport)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Connection established: %s", transport)
         self.transport = transport
+        transport.set_write_buffer_limits(self.write_buffer_high, self.write_buffer_low)
+        self._connections.add(self)
+        # The first request is timed from the accept
+        self.started = perf_counter_ns()
+        self.set_timeout(self.header_timeout)
+        peer = transport.get_extra_info("peername")
+        self.peer = str(peer[0]).encode() if peer else None
 
-    def connection_lost(
-        self, exc: Exception | None = None
-    ):  # TODO: handle Connection: close properly
+    def connection_lost(self, exc: Exception | None = None):
         if exc:
             self.logger.warning("Connection lost with error: %s", exc, exc_info=True)
         else:
-            self.logger.debug("Connection closed cleanly")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Connection closed cleanly")
 
-        if self.transport and not self.transport.is_closing():
-            self.transport.close()
+        if self.transport:
+            if not self.transport.is_closing():
+                self.transport.close()
             self.transport = None
 
-        if self.upstream_transport and not self.upstream_transport.is_closing():
-            self.upstream_transport.close()
-            self.upstream_transport = None
+        self._connections.discard(self)
+        self._timers.cancel(self.timer)
+        if self.file_sender is not None:
+            self.file_sender.close()
+            self.file_sender = None
+        self.abandon_fill()
+        self.end_request()
+        self.release_upstream(reusable=self.upstream_idle)
 
     def data_received(
         self,
         data: bytes,
     ):
-        if self.upstream_transport and not self.__buf:
-            self.upstream_transport.write(data)
-        else:
-            self.__buf.extend(data)
-            self.req_parser.feed_data(data)
+        if self.body_remaining and self.upstream_transport and not self.__buf:
+            # Fast path, body bytes go straight to the upstream
+            data = self.forward_body(data)
+            if not data:
+                return
+        if not self.in_flight and not self.__buf:
+            # The first bytes of a request head
+            self.set_timeout(self.header_timeout)
+        self.__buf.extend(data)
+        self.process_buffer()
 
     def eof_received(self):
-        if self.upstream_transport:
+        if self.upstream_transport and self.body_remaining == TUNNEL:
             self.upstream_transport.write_eof()
 
+    def pause_writing(self):
+        # Slow client, stop reading the response until it catches up
+        self.writing_paused = True
+        if self.upstream_transport:
+            self.upstream_transport.pause_reading()
+
+    def resume_writing(self):
+        self.writing_paused = False
+        if self.upstream_transport:
+            self.upstream_transport.resume_reading()
+
     # endregion
 
     # region HttpRequestParser callbacks
 
-    def on_url(
+    def on_url(self, url: bytes):
+        self.url = url
+
+    def on_header(
         self,
-        url: bytes,
+        name: bytes,
+        value: bytes,
+        len: Callable[[object], int] = len,  # bytecode opt
+        REWRITTEN_LENGTHS=REWRITTEN_LENGTHS,  # bytecode opt
+    ):
+        length = len(name)
+        if length == 14 and name.lower() == b"content-length":
+            self.content_length = int(value)
+        elif length == 4 and name.lower() == b"host":
+            self.host = value
+        elif length in REWRITTEN_LENGTHS and name.lower() in REWRITTEN:
+            self.record_header(name, value)
+
+    def on_headers_complete(self):
+        if self.in_flight:
+            return
+        self.should_keep_alive = (
+            self.req_parser.should_keep_alive() and not self.draining
+        )
+        self.method = self.req_parser.get_method()
+
+    def on_message_complete(self):
+        self.request_complete = True
+        if self.body_remaining == CHUNKED:
+            self.body_remaining = 0
+
+    # endregion
+
+    # region Internal methods
+
+    def write(self, data):
+        if self.transport and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def process_buffer(self):
+        buf = self.__buf
+        while buf and self.transport:
+            if self.in_flight:
+                if not self.body_remaining:
+                    # Pipelined request, it waits for the current response
+                    self.transport.pause_reading()
+                    return
+                if self.upstream_transport is None:  # still connecting
+                    return
+                data = bytes(buf)
+                buf.clear()
+                buf.extend(self.forward_body(data))
+                continue
+
+            end = buf.find(b"\r\n\r\n")
+            if end == -1:
+                if len(buf) > self.max_head_size:
+                    self.write(self.__response_431)
+                    self.connection_lost()
+                return
+            head = bytes(buf[: end + 4])
+            del buf[: end + 4]
+            self.start_request(head)
+
+    def start_request(
+        self,
+        head: bytes,
         parse_url: Callable[[bytes], object] = parse_url,  # bytecode opt
         len: Callable[[object], int] = len,  # bytecode opt
+        perf_counter_ns: Callable[[], int] = perf_counter_ns,  # bytecode opt
     ):
-        self.path = parse_url(url).path
-        self.logger.debug("Parsed URL path: %s", self.path)
-        match = self.__route_trie.match(self.path)
+        if not self.started:
+            self.started = perf_counter_ns()
+        self.content_length = 0
+        self.host = None
+        self.request_complete = False
+        self.strip_len = 0
+        self.rewrites = self.forwarded_for = self.connection_headers = None
+        upgrade = False
+        self.__parsed = head
+        try:
+            self.req_parser.feed_data(head)
+        except HttpParserUpgrade:
+            upgrade = True
+        except HttpParserError as exc:
+            self.logger.info("Malformed request: %s", exc)
+            self.write(self.__response_400)
+            self.connection_lost()
+            return
+        finally:
+            self.__parsed = None
+        try:
+            url = parse_url(self.url)
+        except HttpParserError as exc:
+            self.logger.info("Malformed request URL %s: %s", self.url, exc)
+            self.write(self.__response_400)
+            self.connection_lost()
+            return
+
+        self.path = url.path
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Parsed URL path: %s", self.path)
+        # An absolute-form request target overrides the Host header
+        host = url.host or self.host
+        routes = self._routes.lookup(host)
+        match = routes.match(self.path) if routes is not None else None
 
         if not match:
-            self.logger.info("No route matched for path %s, returning 404", self.path)
+            self.logger.info(
+                "No route matched for host %s path %s, returning 404",
+                host,
+                self.path,
+            )
+            self.log_access(404, perf_counter_ns() - self.started)
             self.write(self.__response_404)
             self.connection_lost()
             return
 
-        key, target = match
-        self.target = target
+        prefix_len, self.group = match
+        self.routed = perf_counter_ns()
+        self.group.metrics.route.record(self.routed - self.started)
+        if self.client_limit is not None:
+            wait = self.client_limit.take(self.peer)
+            if wait:
+                self.reject(b"429 Too Many Requests", wait)
+                return
+        if self.group.__class__ is StaticFiles:
+            self.serve_static(self.group, self.path[prefix_len:], head)
+            return
+
+        if url.host is not None and self.path is not None:
+            # Upstreams get the origin-form, without scheme and authority
+            self.strip_len = self.url.index(b"/", self.url.index(b"//") + 2)
+        if 0 < prefix_len < len(self.path):
+            # remove added path from req to backend
+            self.strip_len += prefix_len
+
+        cache = self.group.cache
+        if (
+            cache is not None
+            and (self.method == b"GET" or self.method == b"HEAD")
+            and self.request_complete
+            and not upgrade
+        ):
+            head = self.use_cache(cache, host, head)
+            if head is None:  # served from the cache, or waiting for it
+                return
+        self.forward(head, upgrade)
 
-        if key == self.path:
+    def forward(self, head: bytes, upgrade: bool = False):
+        """Send the routed request to an upstream of its group, if admitted."""
+        self.target = self.group.pick()
+        if (
+            (self.group.limit is not None or self.admission is not None)
+            and not (upgrade or self.target.tunnel)
+            and not self.admit()
+        ):
             return
 
-        key_position = self.__buf.find(key)
-        self.logger.debug("Curr buf is %s", self.__buf)
-        if key_position != -1:
-            self.__buf = (
-                self.__buf[:key_position] + self.__buf[key_position + len(key) :]
-            )  # remove added path from req to backend
-            self.logger.debug("Modifying buffer to %s", self.__buf)
+        self.in_flight = True
+        self.group.start(self.target)
+        if upgrade or self.target.tunnel:
+            self.body_remaining = TUNNEL
+        elif self.request_complete:
+            self.body_remaining = 0
+        elif self.content_length:
+            self.body_remaining = self.content_length
+        else:
+            self.body_remaining = CHUNKED
+            self.chunked_tail = b""
+        self.dispatch(head)
 
-    def on_headers_complete(self):
-        self.should_keep_alive = self.req_parser.should_keep_alive()
-        self.logger.debug(f"{self.should_keep_alive=} {self.transport}")
+    def admit(self) -> bool:
+        """Take a slot of the route's and the global concurrency limit.
+
+        Sheds the request with a ``503`` if either is full.
+        """
+        limit = self.group.limit
+        if limit is None or limit.acquire():
+            if self.admission is None or self.admission.acquire():
+                self.admitted = True
+                return True
+            if limit is not None:
+                limit.abandon()
+        self.group.metrics.shed.inc()
+        # Identical requests waiting for this one fetch their own
+        self.abandon_fill()
+        self.reject(b"503 Service Unavailable", self.retry_after)
+        return False
+
+    def release_admission(
+        self,
+        overloaded: bool = False,
+        perf_counter_ns: Callable[[], int] = perf_counter_ns,  # bytecode opt
+    ):
+        self.admitted = False
+        latency = perf_counter_ns() - self.routed
+        if self.group.limit is not None:
+            self.group.limit.release(latency, overloaded)
+        if self.admission is not None:
+            self.admission.release(latency, overloaded)
 
-        t = self._loop.create_task(self.route_and_pipe())
+    def reject(self, status: bytes, retry_after: float):
+        """Answer without going upstream, asking to retry later."""
+        if not self.request_complete:
+            # The body is not read, nothing can follow it on this connection
+            self.should_keep_alive = False
+        self.request_done(int(status[:3]))
+        self.write(
+            b"HTTP/1.1 %s\r\nRetry-After: %d\r\nContent-Length: 0\r\n%s\r\n"
+            % (
+                status,
+                ceil(retry_after),
+                b"" if self.should_keep_alive else b"Connection: close\r\n",
+            )
+        )
+        if not self.should_keep_alive:
+            self.connection_lost()
+
+    def serve_static(self, files: StaticFiles, path: bytes, head: bytes):
+        if not self.request_complete:
+            # The body is not read, nothing can follow it on this connection
+            self.should_keep_alive = False
+        response, file, offset, count = files.respond(
+            self.method, path, parse_headers(head), self.should_keep_alive
+        )
+        status = int(response[9:12])
+        self.in_flight = True
+        self.target = None
+        self.body_remaining = 0
+        if file is None:
+            self.write(response)
+        else:
+            sender = FileSender(
+                asyncio.get_running_loop(),
+                self.transport,
+                response,
+                file,
+                offset,
+                count,
+                lambda ok: self.file_sent(ok, status),
+            )
+            try:
+                if not sender.start():
+                    self.file_sender = sender
+                    self.set_timeout(self.response_timeout)
+                    return
+            except OSError as exc:
+                self.logger.info("Failed to send %s: %s", path, exc)
+                self.connection_lost()
+                return
+        self.request_done(status)
+        self.end_request()
+        if not self.should_keep_alive:
+            self.connection_lost()
+
+    def file_sent(self, ok: bool, status: int):
+        self.file_sender = None
+        if ok:
+            self.request_done(status)
+        self.end_request()
+        if not ok or not self.should_keep_alive:
+            self.connection_lost()
+            return
+        if self.__buf:
+            self.transport.resume_reading()
+            self.process_buffer()
+
+    def use_cache(
+        self, cache: ResponseCache, host: bytes | None, head: bytes
+    ) -> bytes | None:
+        """Serve the request from ``cache``, or prepare to store its response.
+
+        Returns None if the request was served, or joined an identical
+        request already on its way upstream. Otherwise returns the head to
+        send upstream, which asks to revalidate a stale entry with its ETag.
+        """
+        headers = parse_headers(head)
+        if b"authorization" in headers:
+            return head
+        cache_control = headers.get(b"cache-control", b"")
+        if b"no-store" in cache_control:
+            return head
+        key = (host, self.url)
+        entry = None
+        if b"no-cache" not in cache_control and b"no-cache" not in headers.get(
+            b"pragma", b""
+        ):
+            entry = cache.lookup(key, headers)
+        if entry is not None:
+            if cache.is_fresh(entry):
+                self.serve_cached(cache, entry, headers.get(b"if-none-match"))
+                return None
+            if (
+                entry.etag is None
+                or b"if-none-match" in headers
+                or b"if-modified-since" in headers
+            ):  # the client revalidates itself
+                entry = None
+        if self.method != b"GET":
+            return head
+
+        pending = cache.pending.get(key)
+        if pending is not None:
+            # Collapse into the request already fetching this response
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Waiting for the pending response to %s", self.url)
+            pending.waiters.append((self, headers, head))
+            self.in_flight = True
+            self.target = None
+            self.body_remaining = 0
+            self.set_timeout(self.response_timeout)
+            return None
+
+        self.fill = cache.pending[key] = CacheFill(key, headers, cache.max_entry_bytes)
+        if entry is not None:
+            self.fill.entry = entry
+            self.fill.withhold = True
+            head = head[:-2] + b"If-None-Match: " + entry.etag + b"\r\n\r\n"
+        return head
+
+    def serve_cached(
+        self, cache: ResponseCache, entry: CacheEntry, if_none_match: bytes | None
+    ):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Serving %s from the cache", self.url)
+        if (
+            if_none_match is not None
+            and entry.etag is not None
+            and etag_matches(if_none_match, entry.etag)
+        ):
+            cache.hits += 1
+            self.request_done(304)
+            self.write(b"HTTP/1.1 304 Not Modified\r\nETag: %s\r\n\r\n" % entry.etag)
+        else:
+            self.request_done(int(entry.head[9:12]))
+            if self.transport and not self.transport.is_closing():
+                self.transport.writelines(cache.response(entry, self.method == b"HEAD"))
+        if not self.should_keep_alive:
+            self.connection_lost()
+
+    def fill_received(self, data: bytes, len=len):  # bytecode opt
+        fill = self.fill
+        if not fill.withhold:
+            self.write(data)
+        buf = fill.buf
+        if buf is None:
+            return
+        if len(buf) + len(data) > fill.limit:
+            # Too large for the cache, forward the rest as it comes
+            fill.buf = None
+            if fill.withhold:
+                fill.withhold = False
+                self.write(buf)
+                self.write(data)
+            return
+        buf.extend(data)
+
+    def finish_fill(self, keep_alive: bool, status: int):
+        fill, self.fill = self.fill, None
+        cache = self.group.cache
+        entry = None
+        if fill.buf is None:
+            pass  # too large, already forwarded
+        elif fill.entry is not None and status == 304:
+            entry = fill.entry
+            cache.refresh(entry, bytes(fill.buf))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Revalidated %s", self.url)
+            if self.transport and not self.transport.is_closing():
+                self.transport.writelines(cache.response(entry))
+        else:
+            if fill.withhold:
+                self.write(fill.buf)
+            # A close delimited response would tell the client to close as well
+            if keep_alive:
+                entry = cache.store(fill.key, fill.headers, bytes(fill.buf), status)
+        self.wake_waiters(cache, fill, entry)
+
+    def abandon_fill(self):
+        fill, self.fill = self.fill, None
+        if fill is not None:
+            self.wake_waiters(self.group.cache, fill, None)
+
+    @staticmethod
+    def wake_waiters(
+        cache: ResponseCache, fill: CacheFill, entry: CacheEntry | None
+    ) -> None:
+        """Answer the requests collapsed into ``fill``.
+
+        They share ``entry``, the response just stored or revalidated, if
+        their headers select it under its ``Vary``. Responses that could not
+        be shared, like private or oversized ones, are fetched again by each
+        waiter, within the concurrency limits like any other request.
+        """
+        if cache.pending.get(fill.key) is fill:
+            del cache.pending[fill.key]
+        for proxy, headers, head in fill.waiters:
+            if proxy.transport is None:  # the client went away meanwhile
+                continue
+            if entry is not None and cache.lookup(fill.key, headers) is entry:
+                proxy.in_flight = False
+                proxy.serve_cached(cache, entry, headers.get(b"if-none-match"))
+                if proxy.transport and proxy.__buf:
+                    proxy.transport.resume_reading()
+                    proxy.process_buffer()
+            else:
+                proxy.in_flight = False
+                proxy.forward(head)
+
+    def dispatch(self, head: bytes):
+        key = (self.target.host, self.target.port)
+        upstream_transport = self.upstream_transport
+        if upstream_transport is not None and (
+            self.upstream_key != key or upstream_transport.is_closing()
+        ):
+            self.release_upstream(reusable=self.upstream_idle)
+            upstream_transport = None
+
+        if upstream_transport is None:
+            upstream_transport = self._pool.acquire(key)
+            if upstream_transport is None:
+                self.__head = head
+                t = asyncio.get_running_loop().create_task(self.route_and_pipe(key))
+                self._tasks.add(t)
+                t.add_done_callback(self._tasks.discard)
+                self.connecting = t
+                self.set_timeout(self.connect_timeout)
+                return
+            self.attach_upstream(key, upstream_transport)
+
+        self.send_head(head)
+
+    def attach_upstream(self, key: tuple[bytes, bytes], upstream_transport):
+        upstream_transport.get_protocol().proxy = self
+        self.upstream_transport = upstream_transport
+        self.upstream_key = key
+        if self.writing_paused:
+            upstream_transport.pause_reading()
+
+    def send_head(
+        self,
+        head: bytes,
+        perf_counter_ns: Callable[[], int] = perf_counter_ns,  # bytecode opt
+    ):
+        self.sent = perf_counter_ns()
+        metrics = self.group.metrics
+        elapsed = self.sent - self.routed
+        metrics.connect.record(elapsed)
+        metrics.upstreams[self.target].connect.record(elapsed)
+        self.progressed = False
+        self.set_timeout(self.response_timeout)
+        self.upstream_idle = False
+        self.upstream_transport.get_protocol().head_request = self.method == b"HEAD"
+        self.upstream_transport.writelines(self.outgoing_head(head))
+        if self.target.tunnel and SPLICE_SUPPORTED:
+            # Once the head and already buffered body bytes are flushed, the
+            # kernel moves everything else
+            asyncio.get_running_loop().call_soon(self.start_splice)
+
+    def outgoing_head(
+        self,
+        head: bytes,
+        memoryview=memoryview,  # bytecode opt
+    ) -> list[bytes | memoryview]:
+        """The head to send upstream, as segments of ``head`` for writelines.
+
+        Cuts ``strip_len`` bytes from the start of the request target (the
+        scheme and authority of an absolute-form one, and the route prefix),
+        leaves out hop-by-hop headers (and those named by ``Connection``)
+        and adds the client to ``X-Forwarded-For`` and this proxy to
+        ``Via``, all without copying ``head``.
+        """
+        view = memoryview(head)
+        segments: list[bytes | memoryview] = []
+        pos = 0
+        if self.strip_len:
+            url_start = head.index(b" ") + 1
+            segments.append(view[:url_start])
+            pos = url_start + self.strip_len
+
+        rewrites = self.rewrites
+        if self.connection_headers is not None:
+            rewrites = self.find_connection_headers(head)
+        if rewrites is not None:
+            # An upgrade needs its Connection and Upgrade headers
+            keep = UPGRADE_HEADERS if self.body_remaining == TUNNEL else ()
+            for start, end, name in rewrites:
+                if name not in keep:
+                    segments.append(view[pos:start])
+                    pos = end
+        # Up to the end of the last header line
+        segments.append(view[pos:-2])
+
+        line_end = head.index(b"\r\n")
+        forwarded_for = self.forwarded_for
+        if self.peer is not None:
+            forwarded_for = (
+                self.peer
+                if forwarded_for is None
+                else forwarded_for + b", " + self.peer
+            )
+        segments.append(
+            b"X-Forwarded-For: %s\r\n" % forwarded_for
+            if forwarded_for is not None
+            else b""
+        )
+        segments.append(
+            b"Via: %s %s\r\n\r\n" % (head[line_end - 3 : line_end], self.via)
+        )
+        return segments
+
+    def record_header(self, name: bytes, value: bytes):
+        """Find a header the upstream won't get as is in the head being parsed."""
+        head = self.__parsed
+        if head is None:  # a trailer after a chunked body
+            return
+        rewrites = self.rewrites
+        if rewrites is None:
+            rewrites = self.rewrites = []
+        # Headers come in order, so each starts after the previous one. A
+        # line break comes first, a header value can't contain one
+        start = head.find(b"\r\n" + name + b":", rewrites[-1][1] if rewrites else 0)
+        if start == -1:
+            return
+        end = head.find(b"\r\n", start + 2)
+        lower = name.lower()
+        rewrites.append((start, end, lower))
+        if lower == b"x-forwarded-for":
+            self.forwarded_for = (
+                value
+                if self.forwarded_for is None
+                else self.forwarded_for + b", " + value
+            )
+        elif lower == b"connection":
+            for option in value.lower().split(b","):
+                option = option.strip()
+                if option and option not in CONNECTION_OPTIONS:
+                    if self.connection_headers is None:
+                        self.connection_headers = []
+                    self.connection_headers.append(option)
+
+    def find_connection_headers(self, head: bytes) -> list[tuple[int, int, bytes]]:
+        """``rewrites`` plus the headers named by ``Connection``.
+
+        They may come before ``Connection``, so the whole head is searched.
+        """
+        rewrites = list(self.rewrites or ())
+        lower_head = head.lower()
+        for name in self.connection_headers:
+            start = lower_head.find(b"\r\n" + name + b":")
+            while start != -1:
+                end = lower_head.find(b"\r\n", start + 2)
+                rewrites.append((start, end, name))
+                start = lower_head.find(b"\r\n" + name + b":", end)
+        rewrites.sort()
+        return rewrites
+
+    def start_splice(self):
+        if self.transport is None or self.upstream_transport is None:
+            return
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Handing %s over to a splice tunnel", self.transport)
+        loop = asyncio.get_running_loop()
+        t = loop.create_task(hand_over(loop, self.transport, self.upstream_transport))
         self._tasks.add(t)
         t.add_done_callback(self._tasks.discard)
 
-    # endregion
+    def forward_body(
+        self,
+        data: bytes,
+        len: Callable[[object], int] = len,  # bytecode opt
+    ) -> bytes:
+        """Forward body bytes upstream, return the bytes of the next request."""
+        remaining = self.body_remaining
+        if remaining == TUNNEL:
+            self.upstream_transport.write(data)
+            return b""
 
-    # region Internal methods
+        rest = b""
+        try:
+            if remaining == CHUNKED:
+                split = self.split_chunked(data)
+                if split is None:
+                    self.connection_lost()
+                    return b""
+                data, rest = split
+            else:
+                if len(data) > remaining:
+                    rest = data[remaining:]
+                    data = data[:remaining]
+                self.body_remaining = remaining - len(data)
+                # No on_body callback, so this only advances the parser state
+                self.req_parser.feed_data(data)
+        except HttpParserError as exc:
+            self.logger.info("Malformed request body: %s", exc)
+            self.connection_lost()
+            return b""
 
-    def write(self, data):
-        if self.transport and not self.transport.is_closing():
-            self.transport.write(data)
+        self.progressed = True
+        self.upstream_transport.write(data)
+        return rest
+
+    def split_chunked(
+        self,
+        data: bytes,
+        EMPTY_LINE_END=EMPTY_LINE_END,  # bytecode opt
+    ) -> tuple[bytes, bytes] | None:
+        """Feed chunked body bytes to the parser, split off the next request.
+
+        The parser only tells that the body ended, not where. A chunked body
+        ends with an empty line, so the bytes are fed up to each empty line
+        in turn until the request is complete. Returns the body bytes and
+        the bytes after them, or None if the body ended anywhere else.
+        """
+        tail = self.chunked_tail
+        window = tail + data
+        start = 0
+        for match in EMPTY_LINE_END.finditer(window):
+            end = match.end() - len(tail)
+            if end <= start:
+                continue
+            self.req_parser.feed_data(data[start:end])
+            start = end
+            if self.request_complete:
+                return data[:end], data[end:]
+        self.req_parser.feed_data(data[start:])
+        if self.request_complete:
+            self.logger.info("Chunked request body ended past its last line")
+            return None
+        self.chunked_tail = window[-2:]
+        return data, b""
+
+    def first_byte_received(
+        self,
+        perf_counter_ns: Callable[[], int] = perf_counter_ns,  # bytecode opt
+    ):
+        elapsed = perf_counter_ns() - self.sent
+        self.sent = 0
+        metrics = self.group.metrics
+        metrics.ttfb.record(elapsed)
+        metrics.upstreams[self.target].ttfb.record(elapsed)
+
+    def request_done(
+        self,
+        status: int,
+        perf_counter_ns: Callable[[], int] = perf_counter_ns,  # bytecode opt
+    ) -> int:
+        """Record the response of the current request, return its total time."""
+        elapsed = perf_counter_ns() - self.started
+        self.started = 0
+        metrics = self.group.metrics
+        metrics.total.record(elapsed)
+        metrics.response(status)
+        if self.access_log is not None:
+            self.log_access(status, elapsed)
+        self.set_timeout(self.idle_timeout)
+        return elapsed
+
+    def log_access(self, status: int, elapsed: int):
+        if self.access_log is not None:
+            self.access_log.record(
+                self.peer, self.method, self.url, self.host, status, elapsed
+            )
+
+    def upstream_response_complete(self, keep_alive: bool, status: int):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Upstream response complete, keep-alive=%s", keep_alive)
+        if self.admitted:  # before waiters that can't share it take its place
+            self.release_admission()
+        if self.fill is not None:
+            self.finish_fill(keep_alive, status)
+        if self.in_flight:
+            if status >= 500:
+                self._health.failure(self.target)
+            else:
+                self._health.success(self.target)
+            if self.target is not None:
+                self.group.metrics.upstreams[self.target].total.record(
+                    self.request_done(status)
+                )
+        self.end_request()
+        self.upstream_idle = keep_alive and self.request_complete
+        if not self.should_keep_alive or not self.request_complete:
+            self.connection_lost()
+            return
+        if not keep_alive:
+            self.release_upstream(reusable=False)
+        if self.__buf:
+            if not self.upstream_writing_paused:
+                self.transport.resume_reading()
+            self.process_buffer()
+
+    def end_request(self):
+        if self.admitted:
+            self.release_admission()
+        if self.in_flight:
+            self.in_flight = False
+            if self.target is not None:  # unless it waited for another request
+                self.group.done(self.target)
+
+    def set_timeout(self, delay: float | None):
+        if delay:
+            self._timers.schedule(self.timer, delay)
+        else:
+            self._timers.cancel(self.timer)
+
+    def on_timeout(self):
+        if self.transport is None:
+            return
+        if not self.in_flight:
+            if self.__buf:
+                self.logger.info("Timed out reading a request head")
+                self.log_access(408, perf_counter_ns() - self.started)
+                self.write(self.__response_408)
+            else:
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Closing idle connection")
+            self.connection_lost()
+            return
+        if self.body_remaining == TUNNEL:
+            return  # open for as long as both ends keep it open
+        sender = self.file_sender
+        if sender is not None:
+            progressed, sender.progressed = sender.progressed, False
+        else:
+            progressed, self.progressed = self.progressed, False
+        if progressed or (self.target is None and sender is None):
+            # Still moving, or waiting for an identical request's response
+            self.set_timeout(self.response_timeout)
+            return
+
+        if self.admitted:
+            self.release_admission(overloaded=True)
+        target = self.target
+        if target is not None:
+            self._health.failure(target)
+            self.group.metrics.upstreams[target].errors.inc()
+        if self.connecting is not None:
+            self.logger.warning(
+                "Timed out connecting to %s:%s", target.host, target.port
+            )
+            self.connecting.cancel()
+            self.connecting = None
+            self.request_done(504)
+            self.write(self.__response_504)
+        elif self.sent:  # no response byte arrived yet
+            self.logger.warning(
+                "Timed out waiting for a response from %s:%s", target.host, target.port
+            )
+            self.request_done(504)
+            self.write(self.__response_504)
+        else:
+            self.logger.info("Response stalled, closing %s", self.transport)
+        self.connection_lost()
+
+    def upstream_pause_writing(self):
+        # Slow upstream, stop reading the request body until it catches up
+        self.upstream_writing_paused = True
+        if self.transport:
+            self.transport.pause_reading()
+
+    def upstream_resume_writing(self):
+        self.upstream_writing_paused = False
+        if self.transport and not (
+            self.in_flight and not self.body_remaining and self.__buf
+        ):  # unless a pipelined request is waiting for its turn
+            self.transport.resume_reading()
 
     def upstream_done(self):
-        self.logger.debug("Upstream finished sending data (EOF)")
-        if not self.should_keep_alive:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Upstream finished sending data (EOF)")
+        # A response still in flight is delimited by this EOF, and the client
+        # can only see its end if we close too
+        response_in_flight = self.in_flight
+        if self.fill is not None and self.fill.withhold and self.fill.buf:
+            self.write(self.fill.buf)
+        self.abandon_fill()
+        self.end_request()
+        # A half-closed upstream can never serve another request
+        self.upstream_idle = False
+        self.release_upstream(reusable=False)
+        if response_in_flight or not self.should_keep_alive:
             self.connection_lost()
 
+    def release_upstream(self, reusable: bool):
+        upstream_transport = self.upstream_transport
+        if upstream_transport is None:
+            return
+        self.upstream_transport = None
+        upstream_transport.get_protocol().proxy = None
+        if self.upstream_writing_paused:
+            self.upstream_resume_writing()
+        if reusable:
+            if self.writing_paused:
+                upstream_transport.resume_reading()
+            self._pool.release(self.upstream_key, upstream_transport)
+        elif not upstream_transport.is_closing():
+            upstream_transport.close()
+
     async def route_and_pipe(
         self,
-        ConnectionError=ConnectionError,  # bytecode opt
-        bytes=bytes,  # bytecode opt
+        key: tuple[bytes, bytes],
+        OSError=OSError,  # bytecode opt
         UpStreamReaderProtocol=UpStreamReaderProtocol,  # bytecode opt
-        asyncio=asyncio,  # bytecode opt
     ):
+        target = self.target
         try:
-            self.logger.debug("Connection to %s:%s", self.target.host, self.target.port)
-            if self.upstream_transport is None or self.upstream_transport.is_closing():
-                (
-                    self.upstream_transport,
-                    upstream_proto,
-                ) = await self._loop.create_connection(
-                    lambda: UpStreamReaderProtocol(
-                        asyncio.StreamReader(loop=self._loop), loop=self._loop
-                    ),
-                    self.target.host.decode(),
-                    self.target.port.decode(),
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Connection to %s:%s", target.host, target.port)
+            addrs = target.addrs
+            if addrs is None:
+                addrs = await self._resolver.resolve(
+                    target.host.decode(), int(target.port)
                 )
-                upstream_proto.proxy = self
-
-            self.upstream_transport.write(bytes(self.__buf))
-            self.__buf.clear()
-
-        except ConnectionError as exc:
+            upstream_transport, _ = await asyncio.get_running_loop().create_connection(
+                UpStreamReaderProtocol, sock=await connect(addrs)
+            )
+        except OSError as exc:
+            self.connecting = None
             self.logger.error("Failed to connect to upstream: %s", exc, exc_info=True)
+            self._health.failure(target)
+            self.group.metrics.upstreams[target].errors.inc()
+            self.log_access(502, perf_counter_ns() - self.started)
             self.write(self.__response_502)
             self.connection_lost()
+            return
+
+        self.connecting = None
+        upstream_transport.set_write_buffer_limits(
+            self.write_buffer_high, self.write_buffer_low
+        )
+        if self.transport is None:
+            # Client went away while we were connecting, keep the connection
+            self._pool.release(key, upstream_transport)
+            return
+
+        self.attach_upstream(key, upstream_transport)
+        head, self.__head = self.__head, None
+        self.send_head(head)
+        self.process_buffer()
+
+    # endregion
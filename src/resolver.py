@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import logging
+import socket
+from collections.abc import Iterable
+from time import monotonic
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from route_trie import Target
+
+
+def is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class Resolver:
+    """TTL cache in front of ``getaddrinfo`` for upstream addresses.
+
+    Targets are resolved once when the routes are loaded and keep every
+    ``(family, sockaddr)`` of the result on ``Target.addrs``, in resolver
+    order, so connecting never has to resolve and :func:`connect` can fall
+    back to the next address. Hostname
+    targets are registered with :meth:`watch` and re-resolved in the
+    background every ``ttl`` seconds; a failed refresh keeps serving the
+    last good address.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = ("_cache", "_refresher", "_watched", "ttl")
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        # (host, port) -> (addresses, expires_at)
+        self._cache: dict[tuple[str, int], tuple[tuple, float]] = {}
+        # (host, port) -> targets pointing at it
+        self._watched: dict[tuple[str, int], list[Target]] = {}
+        self._refresher: asyncio.Task | None = None
+
+    def resolve_now(self, host: str, port: int) -> tuple:
+        """Blocking resolution, for load time only."""
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return self._store(host, port, infos)
+
+    async def resolve(self, host: str, port: int) -> tuple:
+        cached = self._cache.get((host, port))
+        if cached is not None and cached[1] > monotonic():
+            return cached[0]
+        return await self._lookup(host, port)
+
+    def watch(self, target: Target) -> None:
+        self._add_watched(self._watched, target)
+
+    def watch_all(self, targets: Iterable[Target]) -> None:
+        """Replace the watched targets, e.g. after the routes were reloaded."""
+        watched: dict[tuple[str, int], list[Target]] = {}
+        for target in targets:
+            self._add_watched(watched, target)
+        # A refresh in progress keeps iterating the old dict
+        self._watched = watched
+
+    def _add_watched(
+        self, watched: dict[tuple[str, int], list[Target]], target: Target
+    ) -> None:
+        host, port = target.host.decode(), int(target.port)
+        if is_ip_literal(host):
+            return
+        watched.setdefault((host, port), []).append(target)
+
+    def start(self) -> None:
+        if self._refresher is None:
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh())
+
+    def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _lookup(self, host: str, port: int) -> tuple:
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return self._store(host, port, infos)
+
+    def _store(self, host: str, port: int, infos: list) -> tuple:
+        addresses = tuple((family, sockaddr) for family, _, _, _, sockaddr in infos)
+        self._cache[(host, port)] = (addresses, monotonic() + self.ttl)
+        return addresses
+
+    async def _refresh(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl)
+            # watch() may add targets while a lookup is awaited
+            for (host, port), targets in list(self._watched.items()):
+                try:
+                    addresses = await self._lookup(host, port)
+                except OSError as exc:
+                    self.logger.warning(
+                        "Failed to refresh %s:%s, keeping old address: %s",
+                        host,
+                        port,
+                        exc,
+                    )
+                    continue
+                except Exception:
+                    # Never let one lookup end the refresher
+                    self.logger.exception(
+                        "Failed to refresh %s:%s, keeping old address", host, port
+                    )
+                    continue
+                for target in targets:
+                    target.addrs = addresses
+
+
+async def connect(addresses: Iterable[tuple[int, tuple]]) -> socket.socket:
+    """Connect to the first of ``addresses`` that accepts, in resolver order.
+
+    Unlike ``create_connection`` given a host, the whole sockaddr is used,
+    so IPv6 flow info and scope ids survive.
+    """
+    loop = asyncio.get_running_loop()
+    error: OSError | None = None
+    for family, sockaddr in addresses:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            await loop.sock_connect(sock, sockaddr)
+        except OSError as exc:
+            sock.close()
+            error = exc
+            continue
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    raise error if error is not None else OSError("No address to connect to")
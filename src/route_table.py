@@ -0,0 +1,170 @@
+"""Packed binary layout of a compiled route table.
+
+``RouteTrie.compile`` packs the trie into one buffer and ``CompiledRoutes``
+matches over it, the compiled extension without copying it, so the same
+bytes can come from memory or be mapped from a route snapshot. Native byte
+order, every array 8-byte aligned:
+
+    header      nodes, slots, blob length, reserved (4 x u32)
+    targets     i32 per node, index into the target list or -1
+    params      i32 per node, the ``:param`` child or -1
+    wildcards   i32 per node, index into the target list or -1
+    edges       slots x (u64 hash, i32 parent, i32 child, i64 offset,
+                i64 length), open addressing, parent -1 marks an empty slot
+    blob        all literal segments back to back
+
+An edge is found by FNV-1a over its segment, seeded with the parent node,
+and linear probing from ``hash & (slots - 1)``.
+"""
+
+import struct
+from typing import NamedTuple
+
+FNV_OFFSET = 14695981039346656037
+FNV_PRIME = 1099511628211
+MASK64 = (1 << 64) - 1
+
+HEADER = struct.Struct("=IIII")
+EDGE = struct.Struct("=Qiiqq")
+
+
+class Layout(NamedTuple):
+    nodes: int
+    slots: int
+    blob_len: int
+    targets: int
+    params: int
+    wildcards: int
+    edges: int
+    blob: int
+    size: int
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def layout(nodes: int, slots: int, blob_len: int) -> Layout:
+    targets = HEADER.size
+    params = targets + 4 * nodes
+    wildcards = params + 4 * nodes
+    edges = _align(wildcards + 4 * nodes)
+    blob = edges + EDGE.size * slots
+    return Layout(
+        nodes, slots, blob_len, targets, params, wildcards, edges, blob, blob + blob_len
+    )
+
+
+def read_layout(table) -> Layout:
+    return layout(*HEADER.unpack_from(table)[:3])
+
+
+def check_table(table, targets: int) -> Layout:
+    """Return the layout of ``table``, checked to be safe to match over.
+
+    The compiled ``CompiledRoutes`` follows the sizes and indexes in a table
+    without bounds checks, so a table read from a file is checked first.
+    ``targets`` is the length of its target list. Raises ValueError if the
+    table is shorter than its layout or any index points outside of it.
+    """
+    if len(table) < HEADER.size:
+        raise ValueError("route table shorter than its header")
+    spec = read_layout(table)
+    if spec.size > len(table):
+        raise ValueError("route table shorter than its layout")
+    if spec.nodes < 1 or spec.slots < 1 or spec.slots & (spec.slots - 1):
+        raise ValueError("route table with no nodes, or slots not a power of two")
+    view = memoryview(table)
+    for offset, limit in (
+        (spec.targets, targets),
+        (spec.params, spec.nodes),
+        (spec.wildcards, targets),
+    ):
+        indexes = view[offset : offset + 4 * spec.nodes].cast("i")
+        if min(indexes) < -1 or max(indexes) >= limit:
+            raise ValueError("route table index out of range")
+    empty = False
+    for _, parent, child, offset, length in EDGE.iter_unpack(
+        view[spec.edges : spec.blob]
+    ):
+        if parent < 0:
+            empty = True
+        elif (
+            parent >= spec.nodes
+            or not 0 <= child < spec.nodes
+            or offset < 0
+            or length < 0
+            or offset + length > spec.blob_len
+        ):
+            raise ValueError("route table edge out of range")
+    if not empty:
+        # Probing for a missing segment would never stop
+        raise ValueError("route table without an empty edge slot")
+    return spec
+
+
+def segment_hash(parent: int, segment: bytes) -> int:
+    h = ((FNV_OFFSET ^ parent) * FNV_PRIME) & MASK64
+    for byte in segment:
+        h = ((h ^ byte) * FNV_PRIME) & MASK64
+    return h
+
+
+def pack_routes(root) -> tuple[bytes, list]:
+    """Pack the trie under ``root`` and return it with its target list.
+
+    Nodes are numbered breadth first. Node targets and wildcard targets are
+    stored as indexes into the returned list, so a snapshot can store any
+    stand-in for them.
+    """
+    nodes = [root]
+    params: list[int] = []
+    edges: list[tuple[int, int, bytes]] = []  # parent, child, segment
+    node_id = 0
+    while node_id < len(nodes):
+        node = nodes[node_id]
+        for segment, child in node.children.items():
+            edges.append((node_id, len(nodes), segment))
+            nodes.append(child)
+        if node.param is None:
+            params.append(-1)
+        else:
+            params.append(len(nodes))
+            nodes.append(node.param)
+        node_id += 1
+
+    targets: list = []
+
+    def index(target) -> int:
+        if target is None:
+            return -1
+        targets.append(target)
+        return len(targets) - 1
+
+    node_targets = [index(node.target) for node in nodes]
+    wildcards = [index(node.wildcard) for node in nodes]
+
+    # At most half full, so probing always reaches an empty slot
+    slots = 1
+    while slots < 2 * len(edges):
+        slots <<= 1
+    table: list[tuple[int, int, int, int, int] | None] = [None] * slots
+    blob = bytearray()
+    for parent, child, segment in edges:
+        h = segment_hash(parent, segment)
+        slot = h & (slots - 1)
+        while table[slot] is not None:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = (h, parent, child, len(blob), len(segment))
+        blob += segment
+
+    spec = layout(len(nodes), slots, len(blob))
+    buf = bytearray(spec.size)
+    HEADER.pack_into(buf, 0, spec.nodes, spec.slots, spec.blob_len, 0)
+    struct.pack_into(f"={spec.nodes}i", buf, spec.targets, *node_targets)
+    struct.pack_into(f"={spec.nodes}i", buf, spec.params, *params)
+    struct.pack_into(f"={spec.nodes}i", buf, spec.wildcards, *wildcards)
+    for slot, edge in enumerate(table):
+        EDGE.pack_into(buf, spec.edges + slot * EDGE.size, *(edge or (0, -1, -1, 0, 0)))
+    buf[spec.blob :] = blob
+    return bytes(buf), targets
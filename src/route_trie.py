@@ -1,5 +1,6 @@
 import warnings
-from typing import Optional
+
+from route_table import EDGE, pack_routes, read_layout
 
 warnings.warn(
     "Using pure Python (CPython) implementation of RouteTrie. "
@@ -10,25 +11,62 @@ warnings.warn(
 
 
 class Target:
-    __slots__ = ("host", "port")
+    __slots__ = (
+        "addrs",
+        "ejections",
+        "failures",
+        "healthy",
+        "host",
+        "outstanding",
+        "port",
+        "tunnel",
+        "weight",
+    )
 
     host: bytes
     port: bytes
+    tunnel: bool
+    addrs: tuple | None  # resolved (family, sockaddr) pairs
+    weight: int
+    outstanding: int  # requests waiting for a response
+    healthy: bool  # False while ejected by the health checker
+    failures: int  # consecutive failed requests or probes
+    ejections: int  # consecutive ejections, for the backoff
 
-    def __init__(self, host: bytes, port: bytes):
+    def __init__(self, host: bytes, port: bytes, tunnel: bool = False, weight: int = 1):
         self.host = host
         self.port = port
+        self.tunnel = tunnel
+        self.addrs = None
+        self.weight = weight
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ejections = 0
 
 
 class RouteTrieNode:
-    __slots__ = ("children", "target")
+    __slots__ = ("children", "param", "target", "wildcard")
 
     def __init__(self) -> None:
-        self.children: dict[bytes, "RouteTrieNode"] = {}
-        self.target: Optional[Target] = None
+        self.children: dict[bytes, RouteTrieNode] = {}
+        self.param: RouteTrieNode | None = None  # a ``:name`` segment
+        self.wildcard: Target | None = None  # a trailing ``*`` segment
+        self.target: Target | None = None
 
 
 class RouteTrie:
+    """Longest prefix match over path segments.
+
+    Besides literal segments a route can contain ``:name`` segments, which
+    match any single segment, and end with a ``*`` segment, which matches
+    one or more remaining segments. At every segment a literal beats a
+    parameter, which beats a wildcard. Matching is a single pass with no
+    backtracking: once a literal segment matched, a parameter sibling is
+    not tried for the same segment. The matched prefix of a wildcard route
+    stops before the wildcard, so the upstream gets the rest of the path.
+    """
+
     __slots__ = ("root",)
 
     def __init__(self) -> None:
@@ -37,28 +75,130 @@ class RouteTrie:
     def insert(self, path: bytes, target: Target) -> None:
         node: RouteTrieNode = self.root
         parts: list[bytes] = [p for p in path.strip(b"/").split(b"/") if p]
-        for part in parts:
-            node = node.children.setdefault(part, RouteTrieNode())
+        for i, part in enumerate(parts):
+            if part[:1] == b"*":
+                if i != len(parts) - 1:
+                    raise ValueError(
+                        f"Wildcard must be the last segment of route {path!r}"
+                    )
+                node.wildcard = target
+                return
+            if part[:1] == b":":
+                if node.param is None:
+                    node.param = RouteTrieNode()
+                node = node.param
+            else:
+                node = node.children.setdefault(part, RouteTrieNode())
         node.target = target
 
     def match(self, path: bytes) -> tuple[bytes, Target] | None:
         node: RouteTrieNode = self.root
         parts: list[bytes] = [p for p in path.strip(b"/").split(b"/") if p]
-        matched_parts = []
         last_target: Target | None = self.root.target
         last_depth: int = 0 if self.root.target else -1
 
         for i, part in enumerate(parts):
-            if part in node.children:
-                node = node.children[part]
-                matched_parts.append(part)
-                if node.target is not None:
-                    last_target = node.target
-                    last_depth = i + 1
-            else:
-                break
+            if node.wildcard is not None:
+                last_target = node.wildcard
+                last_depth = i
+            child = node.children.get(part)
+            if child is None:
+                child = node.param
+                if child is None:
+                    break
+            node = child
+            if node.target is not None:
+                last_target = node.target
+                last_depth = i + 1
 
         if last_target is not None:
             matched_path = b"/" + b"/".join(parts[:last_depth])
             return matched_path, last_target
         return None
+
+    def compile(self) -> "CompiledRoutes":
+        return CompiledRoutes(*pack_routes(self.root))
+
+
+class CompiledRoutes:
+    """Read-only snapshot of a RouteTrie for the request path.
+
+    Built from the packed table of ``route_table`` (see there), which is
+    unpacked into one edge dict keyed by ``(node, segment)`` plus per node
+    lists of the target, the ``:param`` child and the wildcard target.
+    ``match`` walks the raw path without splitting it and returns the
+    length of the matched prefix of that path instead of building a new
+    bytes object.
+    """
+
+    __slots__ = ("edges", "params", "targets", "wildcards")
+
+    def __init__(self, table: bytes | memoryview, targets: list) -> None:
+        spec = read_layout(table)
+        view = memoryview(table)
+
+        def array(offset: int) -> list[int]:
+            return view[offset : offset + 4 * spec.nodes].cast("i").tolist()
+
+        self.targets: list[Target | None] = [
+            targets[i] if i >= 0 else None for i in array(spec.targets)
+        ]
+        self.params: list[int] = array(spec.params)  # -1 for no ``:param`` child
+        self.wildcards: list[Target | None] = [
+            targets[i] if i >= 0 else None for i in array(spec.wildcards)
+        ]
+        blob = bytes(view[spec.blob : spec.size])
+        self.edges: dict[tuple[int, bytes], int] = {}
+        for slot in range(spec.slots):
+            _, parent, child, offset, length = EDGE.unpack_from(
+                view, spec.edges + slot * EDGE.size
+            )
+            if parent >= 0:
+                self.edges[(parent, blob[offset : offset + length])] = child
+
+    def match(
+        self,
+        path: bytes,
+        len=len,  # bytecode opt
+    ) -> tuple[int, Target] | None:
+        """Return ``(prefix_len, target)`` for the longest matching route.
+
+        ``path[:prefix_len]`` is the matched part of the path, up to the
+        end of its last matched segment (0 for the root route).
+        """
+        edges = self.edges
+        targets = self.targets
+        params = self.params
+        wildcards = self.wildcards
+        best = targets[0]
+        best_end = 0
+        node = 0
+        length = len(path)
+        start = end = 0
+        while True:
+            while start < length and path[start] == 47:  # b"/"
+                start += 1
+            if start >= length:
+                break
+            wildcard = wildcards[node]
+            if wildcard is not None:
+                best = wildcard
+                best_end = end
+            end = path.find(b"/", start)
+            if end == -1:
+                end = length
+            child = edges.get((node, path[start:end]), -1)
+            if child == -1:
+                child = params[node]
+                if child == -1:
+                    break
+            node = child
+            target = targets[node]
+            if target is not None:
+                best = target
+                best_end = end
+            start = end
+
+        if best is None:
+            return None
+        return best_end, best
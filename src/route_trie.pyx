@@ -1,10 +1,17 @@
 # cython: language_level=3
 # Although the current implementation still relies on the CPython API and holds the GIL, it achieves a 60% performance improvement.
 from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_GET_SIZE
+from libc.stdint cimport int32_t, uint64_t
 from libc.stdlib cimport malloc, free
-from libc.string cimport memcpy
+from libc.string cimport memcmp, memcpy
+
+from route_table import pack_routes, read_layout
 
 DEF SLASH = 47  # "slash/"
+DEF COLON = 58  # ":param"
+DEF STAR = 42  # "*wildcard"
+DEF FNV_OFFSET = 14695981039346656037
+DEF FNV_PRIME = 1099511628211
 
 cdef inline list fast_path_split(bytes path):
     cdef char* data = PyBytes_AS_STRING(path)
@@ -35,22 +42,50 @@ cdef inline list fast_path_split(bytes path):
 cdef class Target:
     cdef public bytes host
     cdef public bytes port
+    cdef public bint tunnel
+    cdef public object addrs  # resolved (family, sockaddr) pairs
+    cdef public int weight
+    cdef public long outstanding  # requests waiting for a response
+    cdef public bint healthy  # False while ejected by the health checker
+    cdef public int failures  # consecutive failed requests or probes
+    cdef public int ejections  # consecutive ejections, for the backoff
 
-    def __cinit__(self, object host, object port):
+    def __cinit__(self, object host, object port, bint tunnel=False, int weight=1):
         self.host = host
         self.port = port
+        self.tunnel = tunnel
+        self.addrs = None
+        self.weight = weight
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ejections = 0
 
 cdef class RouteTrieNode:
-    cdef dict children
-    cdef object target
+    cdef readonly dict children
+    cdef readonly RouteTrieNode param  # a ``:name`` segment
+    cdef readonly object wildcard  # target of a trailing ``*`` segment
+    cdef readonly object target
 
     def __cinit__(self):
         self.children = {}
+        self.param = None
+        self.wildcard = None
         self.target = None
 
 
 cdef class RouteTrie:
-    cdef RouteTrieNode root
+    """Longest prefix match over path segments.
+
+    Besides literal segments a route can contain ``:name`` segments, which
+    match any single segment, and end with a ``*`` segment, which matches
+    one or more remaining segments. At every segment a literal beats a
+    parameter, which beats a wildcard. Matching is a single pass with no
+    backtracking: once a literal segment matched, a parameter sibling is
+    not tried for the same segment. The matched prefix of a wildcard route
+    stops before the wildcard, so the upstream gets the rest of the path.
+    """
+    cdef readonly RouteTrieNode root
 
     def __cinit__(self):
         self.root = RouteTrieNode()
@@ -58,17 +93,32 @@ cdef class RouteTrie:
     cpdef void insert(self, bytes path, object target):
         cdef RouteTrieNode node = self.root
         cdef list parts = fast_path_split(path)
+        cdef Py_ssize_t i
         cdef bytes part
-        for part in parts:
+        for i in range(len(parts)):
+            part = parts[i]
             if not part:
                 continue
-            if part not in node.children:
-                node.children[part] = RouteTrieNode()
-            node = node.children[part]
+            if part[0] == STAR:
+                if i != len(parts) - 1:
+                    raise ValueError(
+                        f"Wildcard must be the last segment of route {path!r}"
+                    )
+                node.wildcard = target
+                return
+            if part[0] == COLON:
+                if node.param is None:
+                    node.param = RouteTrieNode()
+                node = node.param
+            else:
+                if part not in node.children:
+                    node.children[part] = RouteTrieNode()
+                node = node.children[part]
         node.target = target
 
     cpdef object match(self, bytes path):
         cdef RouteTrieNode node = self.root
+        cdef RouteTrieNode child
         cdef list parts = fast_path_split(path)
         cdef int length = len(parts)
         cdef object last_target = self.root.target
@@ -84,13 +134,18 @@ cdef class RouteTrie:
         i = 0
         while i < length:
             part = parts[i]
-            if part in node.children:
-                node = node.children[part]
-                if node.target is not None:
-                    last_target = node.target
-                    last_depth = i + 1
-            else:
-                break
+            if node.wildcard is not None:
+                last_target = node.wildcard
+                last_depth = i
+            child = node.children.get(part)
+            if child is None:
+                child = node.param
+                if child is None:
+                    break
+            node = child
+            if node.target is not None:
+                last_target = node.target
+                last_depth = i + 1
             i += 1
 
         if last_target is not None:
@@ -120,3 +175,116 @@ cdef class RouteTrie:
             return b"/" + result, last_target
 
         return None
+
+    def compile(self):
+        return CompiledRoutes(*pack_routes(self.root))
+
+
+cdef struct Edge:
+    uint64_t hash  # of the segment, seeded with the parent node
+    int32_t parent  # -1 marks an empty slot
+    int32_t child
+    Py_ssize_t offset  # of the segment bytes in the blob
+    Py_ssize_t length
+
+
+cdef inline uint64_t seed_hash(int32_t parent) noexcept nogil:
+    return (<uint64_t>FNV_OFFSET ^ <uint64_t>parent) * <uint64_t>FNV_PRIME
+
+
+cdef class CompiledRoutes:
+    """Read-only snapshot of a RouteTrie for the request path.
+
+    Matches directly over the packed table of ``route_table`` (see there),
+    which may be a bytes object or a slice of a mapped route snapshot; the
+    table is never copied. ``match`` hashes segments straight from the path
+    buffer and returns the length of the matched prefix of that path
+    instead of building a new bytes object.
+    """
+    cdef const unsigned char[::1] table
+    cdef const Edge* edges
+    cdef uint64_t mask
+    cdef const int32_t* node_targets  # index into targets, -1 for none
+    cdef const int32_t* params  # -1 for no ``:param`` child
+    cdef const int32_t* wildcards  # index into targets, -1 for none
+    cdef const unsigned char* segments
+    cdef list targets
+
+    def __cinit__(self, table, list targets):
+        cdef const unsigned char* base
+        spec = read_layout(table)
+        self.table = table
+        self.targets = targets
+        base = &self.table[0]
+        self.node_targets = <const int32_t*>(base + <Py_ssize_t>spec.targets)
+        self.params = <const int32_t*>(base + <Py_ssize_t>spec.params)
+        self.wildcards = <const int32_t*>(base + <Py_ssize_t>spec.wildcards)
+        self.edges = <const Edge*>(base + <Py_ssize_t>spec.edges)
+        self.segments = base + <Py_ssize_t>spec.blob
+        self.mask = spec.slots - 1
+
+    cdef inline int32_t find_edge(
+        self,
+        int32_t parent,
+        uint64_t h,
+        const unsigned char* segment,
+        Py_ssize_t length,
+    ) noexcept:
+        cdef uint64_t slot = h & self.mask
+        cdef const Edge* edge
+        while True:
+            edge = &self.edges[slot]
+            if edge.parent < 0:
+                return -1
+            if (
+                edge.hash == h
+                and edge.parent == parent
+                and edge.length == length
+                and memcmp(self.segments + edge.offset, segment, length) == 0
+            ):
+                return edge.child
+            slot = (slot + 1) & self.mask
+
+    cpdef object match(self, bytes path):
+        """Return ``(prefix_len, target)`` for the longest matching route.
+
+        ``path[:prefix_len]`` is the matched part of the path, up to the
+        end of its last matched segment (0 for the root route).
+        """
+        cdef const unsigned char* data = <const unsigned char*>PyBytes_AS_STRING(path)
+        cdef Py_ssize_t length = PyBytes_GET_SIZE(path)
+        cdef Py_ssize_t start = 0
+        cdef Py_ssize_t end = 0
+        cdef Py_ssize_t best_end = 0
+        cdef int32_t node = 0
+        cdef int32_t child
+        cdef int32_t best = self.node_targets[0]
+        cdef uint64_t h
+
+        while True:
+            while start < length and data[start] == SLASH:
+                start += 1
+            if start >= length:
+                break
+            if self.wildcards[node] >= 0:
+                best = self.wildcards[node]
+                best_end = end
+            end = start
+            h = seed_hash(node)
+            while end < length and data[end] != SLASH:
+                h = (h ^ data[end]) * <uint64_t>FNV_PRIME
+                end += 1
+            child = self.find_edge(node, h, data + start, end - start)
+            if child < 0:
+                child = self.params[node]
+                if child < 0:
+                    break
+            node = child
+            if self.node_targets[node] >= 0:
+                best = self.node_targets[node]
+                best_end = end
+            start = end
+
+        if best < 0:
+            return None
+        return best_end, self.targets[best]
@@ -1,8 +1,11 @@
 import atexit
 import logging.config
 import os
+import queue
 from logging import Handler
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from metrics import registry
 
 
 class SeparateFilenameRotatingFileHandler(Handler):
@@ -35,6 +38,25 @@ class SeparateFilenameRotatingFileHandler(Handler):
         super().close()
 
 
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the listener thread, dropping them when it falls behind.
+
+    With a bounded queue a stalled log disk costs records, counted in
+    ``dropped`` (``proxy_log_dropped_total``), instead of memory and blocked
+    callers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dropped = registry.counter("proxy_log_dropped_total")
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped.inc()
+
+
 DEFAULT_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -60,7 +82,8 @@ DEFAULT_CONFIG = {
             "backupCount": 3,
         },
         "queue_handler": {
-            "class": "logging.handlers.QueueHandler",
+            "class": DroppingQueueHandler,
+            "queue": {"()": "queue.Queue", "maxsize": 10_000},
             "handlers": ["stderr", "file"],
             "respect_handler_level": True,
         },
@@ -69,8 +92,22 @@ DEFAULT_CONFIG = {
 }
 
 
-def setup_logging():
-    logging.config.dictConfig(DEFAULT_CONFIG)
+def setup_logging(threaded: bool = True):
+    """Configure logging, handing records to a listener thread if ``threaded``.
+
+    A process that forks must not be ``threaded``: its children would
+    inherit the queue, but not the thread that empties it.
+    """
+    config = DEFAULT_CONFIG
+    if not threaded:
+        handlers = dict(config["handlers"])
+        del handlers["queue_handler"]
+        config = {
+            **config,
+            "handlers": handlers,
+            "loggers": {"root": {"level": "DEBUG", "handlers": ["stderr", "file"]}},
+        }
+    logging.config.dictConfig(config)
     queue_handler = logging.getHandlerByName("queue_handler")
     if queue_handler is not None:
         queue_handler.listener.start()
@@ -1,16 +1,148 @@
 import asyncio
+import os
+import signal
+import socket
+from collections.abc import Callable
+from pathlib import Path
 
 
-async def serve(host="0.0.0.0", port=8080):
+async def serve(
+    host="0.0.0.0",
+    port=8080,
+    reuse_port: bool = False,
+    sock: socket.socket | None = None,
+    write_buffer_high: int | None = None,
+    write_buffer_low: int | None = None,
+    routes_path: Path | None = None,
+    watch_interval: float | None = None,
+    drain_timeout: float = 30.0,
+    admin_host: str = "127.0.0.1",
+    admin_port: int | None = None,
+    access_log: Path | None = None,
+    access_log_buffer: int = 65536,
+    timeouts: dict[str, float | None] | None = None,
+    concurrency_limit: int | None = None,
+    client_rate: float | None = None,
+    client_burst: float | None = None,
+    backlog: int = 100,
+    ready: Callable[[], object] | None = None,
+):
+    """Serve until SIGTERM, then stop accepting and drain.
+
+    Connections get up to ``drain_timeout`` seconds to finish their
+    in-flight requests. With ``admin_port``, metrics are served on
+    ``http://admin_host:admin_port/metrics``. With ``access_log``, every
+    response is logged to that file, buffering up to ``access_log_buffer``
+    lines; SIGHUP reopens it. ``timeouts`` overrides the ``header``,
+    ``idle``, ``connect`` and ``response`` timeouts of ``ReverseProxy``.
+
+    ``concurrency_limit`` caps the requests in flight to all upstreams,
+    adapting below it as latency rises, and ``client_rate`` the requests a
+    second of each client, in bursts of up to ``client_burst``. Requests
+    over either limit are shed. At most ``backlog`` connections wait to be
+    accepted. ``ready`` is called once connections are being accepted.
+    """
+    from config import load_routes
     from protocol import ReverseProxy
 
-    loop = asyncio.get_event_loop()
-    ReverseProxy._loop = loop
-    server = await loop.create_server(ReverseProxy, host, port, start_serving=False)
+    loop = asyncio.get_running_loop()
+    if write_buffer_high is not None:
+        ReverseProxy.write_buffer_high = write_buffer_high
+    if write_buffer_low is not None:
+        ReverseProxy.write_buffer_low = write_buffer_low
+    if routes_path is not None:
+        ReverseProxy.routes_path = routes_path
+    for name, value in (timeouts or {}).items():
+        setattr(ReverseProxy, f"{name}_timeout", value)
+    ReverseProxy.install_routes(
+        load_routes(ReverseProxy.routes_path, ReverseProxy._resolver)
+    )
+    ReverseProxy._resolver.start()
+    ReverseProxy._health.start()
+    ReverseProxy._timers.start()
+    if concurrency_limit:
+        from admission import ConcurrencyLimit
+
+        ReverseProxy.admission = ConcurrencyLimit(
+            concurrency_limit, min(4, concurrency_limit)
+        )
+    if client_rate:
+        from admission import TokenBuckets
+
+        ReverseProxy.client_limit = TokenBuckets(client_rate, client_burst)
+    if access_log is not None:
+        from access_log import AccessLog
+
+        ReverseProxy.access_log = AccessLog(access_log, access_log_buffer)
+        ReverseProxy.access_log.start()
+
+    reloads: set[asyncio.Task] = set()
+
+    def reload():
+        if ReverseProxy.access_log is not None:
+            ReverseProxy.access_log.reopen()
+        t = loop.create_task(ReverseProxy.reload_routes())
+        reloads.add(t)
+        t.add_done_callback(reloads.discard)
+
+    loop.add_signal_handler(signal.SIGHUP, reload)
+    stop = loop.create_future()
+    loop.add_signal_handler(
+        signal.SIGTERM, lambda: stop.done() or stop.set_result(None)
+    )
+    if watch_interval:
+        t = loop.create_task(watch_routes(ReverseProxy.routes_path, watch_interval))
+        reloads.add(t)
+
+    if sock is not None:
+        server = await loop.create_server(
+            ReverseProxy, sock=sock, backlog=backlog, start_serving=False
+        )
+    else:
+        server = await loop.create_server(
+            ReverseProxy,
+            host,
+            port,
+            reuse_port=reuse_port,
+            backlog=backlog,
+            start_serving=False,
+        )
     ReverseProxy.logger.info("Reverse proxy running at http://%s:%s", host, port)
 
+    if admin_port is not None:
+        from metrics import serve_admin
+
+        await serve_admin(admin_host, admin_port)
+
     async with server:
-        await server.serve_forever()
+        await server.start_serving()
+        if ready is not None:
+            ready()
+        await stop
+        ReverseProxy.logger.info("Stopped accepting, draining connections")
+        server.close()
+        await ReverseProxy.drain(drain_timeout)
+        if ReverseProxy.access_log is not None:
+            ReverseProxy.access_log.stop()
+
+
+async def watch_routes(path: Path, interval: float):
+    """Reload the routes whenever the modification time of ``path`` changes."""
+    from protocol import ReverseProxy
+
+    def mtime():
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    last = mtime()
+    while True:
+        await asyncio.sleep(interval)
+        current = mtime()
+        if current != last and current is not None:
+            last = current
+            await ReverseProxy.reload_routes()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+"""Precompiled binary route snapshots.
+
+Compile the routes offline, next to the YAML file so ``load_routes`` picks
+the snapshot up on startup and on every reload:
+
+    python src/snapshot.py src/routes.yaml        # -> src/routes.snapshot
+
+A snapshot holds the packed route tables (see ``route_table``) as they are
+matched, and is mapped read-only, so loading it neither parses YAML nor
+builds a trie, and forked workers share its pages. Only the upstream
+groups, one per route, are built at load time from their specs.
+
+Layout: header (magic, version, byte order mark, metadata length), JSON
+metadata with the host, route and spec of every group and the offset,
+length and target group indexes of every table, then the tables, each
+8-byte aligned.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from config import (
+    ROUTES_PATH,
+    SNAPSHOT_SUFFIX,
+    build_trie,
+    iter_tables,
+    make_route_target,
+    read_routes,
+)
+from host_index import HostIndex
+from resolver import Resolver
+from route_table import check_table, pack_routes
+from route_trie import CompiledRoutes
+
+MAGIC = b"RPROUTES"
+VERSION = 2
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("=8sIIQ")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def compile_snapshot(routes_path: Path, snapshot_path: Path) -> None:
+    data = read_routes(routes_path)
+    groups: list[dict] = []
+    entries = []
+    blobs = []
+    offset = 0
+    for host, routes in iter_tables(data):
+
+        def make_target(route: str, spec: dict, host: str | None = host) -> int:
+            groups.append({"host": host, "route": route, "spec": spec})
+            return len(groups) - 1
+
+        table, targets = pack_routes(build_trie(routes, make_target).root)
+        entries.append(
+            {"host": host, "offset": offset, "length": len(table), "targets": targets}
+        )
+        blobs.append(table)
+        offset = _align(offset + len(table))
+
+    meta = json.dumps({"groups": groups, "tables": entries}).encode()
+    data_start = _align(HEADER.size + len(meta))
+    tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK, len(meta)))
+        f.write(meta)
+        for entry, table in zip(entries, blobs):
+            f.seek(data_start + entry["offset"])
+            f.write(table)
+    # Workers that mapped the old snapshot keep reading the old inode
+    os.replace(tmp_path, snapshot_path)
+
+
+def _map(path: Path) -> tuple[mmap.mmap, int]:
+    """The mapped snapshot and the length of its metadata."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < HEADER.size:
+        raise ValueError(f"{path} is not a route snapshot")
+    magic, version, byte_order_mark, meta_len = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION or byte_order_mark != BYTE_ORDER_MARK:
+        raise ValueError(f"{path} is not a route snapshot of this version/platform")
+    return mapped, meta_len
+
+
+def read_specs(path: Path) -> list[dict]:
+    """The spec of every route in a snapshot."""
+    mapped, meta_len = _map(path)
+    try:
+        meta = json.loads(mapped[HEADER.size : HEADER.size + meta_len])
+        return [group["spec"] for group in meta["groups"]]
+    except (KeyError, TypeError, UnicodeDecodeError) as exc:
+        raise ValueError(f"{path} is a corrupt route snapshot: {exc!r}") from exc
+
+
+def load_snapshot(path: Path, resolver: Resolver) -> HostIndex:
+    mapped, meta_len = _map(path)
+    try:
+        return _load_tables(path, mapped, meta_len, resolver)
+    except (KeyError, IndexError, TypeError, UnicodeDecodeError) as exc:
+        raise ValueError(f"{path} is a corrupt route snapshot: {exc!r}") from exc
+
+
+def _load_tables(
+    path: Path, mapped: mmap.mmap, meta_len: int, resolver: Resolver
+) -> HostIndex:
+    meta = json.loads(mapped[HEADER.size : HEADER.size + meta_len])
+    data_start = _align(HEADER.size + meta_len)
+
+    index = HostIndex()
+    groups = [
+        make_route_target(
+            group["spec"], resolver, index.upstreams, group["host"], group["route"]
+        )
+        for group in meta["groups"]
+    ]
+    view = memoryview(mapped)
+    for entry in meta["tables"]:
+        start = data_start + entry["offset"]
+        end = start + entry["length"]
+        if end > len(mapped):
+            raise ValueError(f"{path} is a truncated route snapshot")
+        if start < data_start or start & 7 or end < start:
+            raise ValueError(f"{path} is a corrupt route snapshot")
+        if not all(0 <= i < len(groups) for i in entry["targets"]):
+            raise ValueError(f"{path} is a corrupt route snapshot")
+        targets = [groups[i] for i in entry["targets"]]
+        table = view[start:end]
+        check_table(table, len(targets))
+        routes = CompiledRoutes(table, targets)
+        if entry["host"] is None:
+            index.default = routes
+        else:
+            index.add(entry["host"].encode(), routes)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile a routes file into a binary route snapshot."
+    )
+    parser.add_argument(
+        "routes",
+        type=Path,
+        nargs="?",
+        default=ROUTES_PATH,
+        help="Routes file (default: src/routes.yaml)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        help="Snapshot file (default: the routes file with a .snapshot suffix)",
+    )
+    args = parser.parse_args()
+    compile_snapshot(
+        args.routes, args.output or args.routes.with_suffix(SNAPSHOT_SUFFIX)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import mimetypes
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from stat import S_ISDIR, S_ISREG
+from typing import TYPE_CHECKING
+from urllib.parse import unquote_to_bytes
+
+from cache import etag_matches
+
+if TYPE_CHECKING:
+    from metrics import RouteMetrics
+
+CHUNK_SIZE = 1024 * 1024
+SENDFILE_SUPPORTED = hasattr(os, "sendfile")
+
+
+class OpenFile:
+    """An open file descriptor in the StaticFiles cache, with its headers."""
+
+    __slots__ = (
+        "checked",
+        "etag",
+        "evicted",
+        "fd",
+        "headers",
+        "mtime",
+        "size",
+        "stat",
+        "users",
+    )
+
+    def __init__(self, fd: int, stat: os.stat_result, content_type: str, now: float):
+        self.fd = fd
+        self.stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.etag = b'"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        self.headers = (
+            b"Content-Type: %s\r\nETag: %s\r\nLast-Modified: %s\r\n"
+            b"Accept-Ranges: bytes\r\n"
+            % (
+                content_type.encode(),
+                self.etag,
+                formatdate(stat.st_mtime, usegmt=True).encode(),
+            )
+        )
+        self.checked = now
+        self.users = 0  # responses still sending from it
+        self.evicted = False
+
+    def release(self) -> None:
+        self.users -= 1
+        if self.evicted and not self.users:
+            self.close()
+
+    def close(self) -> None:
+        if self.fd != -1:
+            os.close(self.fd)
+            self.fd = -1
+
+    # Tables dropped by a route reload close their files this way
+    __del__ = close
+
+
+class StaticFiles:
+    """Route target that serves files below ``root`` instead of an upstream.
+
+    The rest of the path after the route prefix names the file, and a
+    directory serves its ``index``. Open descriptors are kept for the most
+    recently served ``max_open_files`` files and are checked against the
+    file system at most every ``check_interval`` seconds, so a hot file
+    costs no ``open`` or ``stat``. Responses carry ``ETag`` and
+    ``Last-Modified``, answer conditional requests with ``304`` and a single
+    ``Range`` with ``206``; bodies are sent with ``sendfile``.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_files",
+        "check_interval",
+        "index",
+        "max_open_files",
+        "metrics",
+        "root",
+    )
+
+    def __init__(
+        self,
+        root: str | Path,
+        index: str = "index.html",
+        max_open_files: int = 256,
+        check_interval: float = 1.0,
+        metrics: RouteMetrics | None = None,
+    ):
+        self.root = os.fsencode(Path(root).resolve())
+        self.index = os.fsencode(index)
+        self.max_open_files = max_open_files
+        self.check_interval = check_interval
+        self.metrics = metrics
+        # least recently served first
+        self._files: dict[bytes, OpenFile] = {}
+
+    def resolve(self, path: bytes) -> bytes | None:
+        """File system path for the request ``path``, None if it escapes."""
+        path = unquote_to_bytes(path)
+        if b"\0" in path:
+            return None
+        segments = [segment for segment in path.split(b"/") if segment]
+        if b".." in segments:
+            return None
+        return os.path.join(self.root, *segments)
+
+    def open(self, path: bytes) -> OpenFile | None:
+        file = self._files.pop(path, None)
+        now = time.monotonic()
+        if file is not None:
+            if now - file.checked < self.check_interval:
+                self._files[path] = file
+                return file
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is not None and file.stat == (
+                stat.st_ino,
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                file.checked = now
+                self._files[path] = file
+                return file
+            self._evict(file)
+
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        except OSError:
+            return None
+        stat = os.fstat(fd)
+        if S_ISDIR(stat.st_mode):
+            os.close(fd)
+            return self.open(os.path.join(path, self.index))
+        if not S_ISREG(stat.st_mode):
+            os.close(fd)
+            return None
+        content_type, _ = mimetypes.guess_type(os.fsdecode(path))
+        file = OpenFile(fd, stat, content_type or "application/octet-stream", now)
+        if len(self._files) >= self.max_open_files:
+            self._evict(self._files.pop(next(iter(self._files))))
+        self._files[path] = file
+        return file
+
+    def _evict(self, file: OpenFile) -> None:
+        file.evicted = True
+        if not file.users:
+            file.close()
+
+    def respond(
+        self,
+        method: bytes,
+        path: bytes,
+        headers: dict[bytes, bytes],
+        keep_alive: bool,
+    ) -> tuple[bytes, OpenFile | None, int, int]:
+        """Build the response to a request for ``path`` below the route.
+
+        Returns the response head, and the file with the offset and length
+        of the body to send from it, or None when there is no body. The
+        caller releases the file once the body was sent.
+        """
+        connection = b"" if keep_alive else b"Connection: close\r\n"
+        if method != b"GET" and method != b"HEAD":
+            return (
+                b"HTTP/1.1 405 Method Not Allowed\r\nAllow: GET, HEAD\r\n"
+                b"Content-Length: 0\r\n%s\r\n" % connection,
+                None,
+                0,
+                0,
+            )
+        fs_path = self.resolve(path)
+        file = self.open(fs_path) if fs_path is not None else None
+        if file is None:
+            return (
+                b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n%s\r\n" % connection,
+                None,
+                0,
+                0,
+            )
+
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, file.etag)
+        else:
+            not_modified = self._not_modified_since(
+                headers.get(b"if-modified-since"), file.mtime
+            )
+        if not_modified:
+            return (
+                b"HTTP/1.1 304 Not Modified\r\n%s%s\r\n" % (file.headers, connection),
+                None,
+                0,
+                0,
+            )
+
+        status = b"200 OK"
+        offset, length = 0, file.size
+        content_range = b""
+        byte_range = headers.get(b"range")
+        if byte_range is not None and self._if_range(headers.get(b"if-range"), file):
+            parsed = self._parse_range(byte_range, file.size)
+            if parsed is False:
+                return (
+                    b"HTTP/1.1 416 Range Not Satisfiable\r\n"
+                    b"Content-Range: bytes */%d\r\nContent-Length: 0\r\n%s\r\n"
+                    % (file.size, connection),
+                    None,
+                    0,
+                    0,
+                )
+            if parsed is not None:
+                offset, length = parsed
+                status = b"206 Partial Content"
+                content_range = b"Content-Range: bytes %d-%d/%d\r\n" % (
+                    offset,
+                    offset + length - 1,
+                    file.size,
+                )
+        head = b"HTTP/1.1 %s\r\n%s%sContent-Length: %d\r\n%s\r\n" % (
+            status,
+            file.headers,
+            content_range,
+            length,
+            connection,
+        )
+        if method == b"HEAD" or not length:
+            return head, None, 0, 0
+        file.users += 1
+        return head, file, offset, length
+
+    @staticmethod
+    def _not_modified_since(since: bytes | None, mtime: int) -> bool:
+        if since is None:
+            return False
+        try:
+            return mtime <= parsedate_to_datetime(since.decode("latin-1")).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _if_range(if_range: bytes | None, file: OpenFile) -> bool:
+        """Whether a ``Range`` applies, given the ``If-Range`` validator."""
+        if if_range is None:
+            return True
+        if if_range.startswith((b'"', b"W/")):
+            return if_range == file.etag  # strong comparison
+        try:
+            return (
+                parsedate_to_datetime(if_range.decode("latin-1")).timestamp()
+                == file.mtime
+            )
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _parse_range(value: bytes, size: int) -> tuple[int, int] | None | bool:
+        """Offset and length of a single byte range.
+
+        Returns None to ignore the header (unknown unit, several ranges, or
+        invalid syntax) and serve the whole file, False if the range is not
+        satisfiable.
+        """
+        unit, _, spec = value.partition(b"=")
+        if unit.strip().lower() != b"bytes" or b"," in spec:
+            return None
+        first, dash, last = spec.strip().partition(b"-")
+        if not dash:
+            return None
+        try:
+            if not first:  # the last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    return False
+                return max(size - suffix, 0), min(suffix, size)
+            start = int(first)
+            end = int(last) if last else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            return False
+        if end < start:
+            return None
+        return start, min(end, size - 1) - start + 1
+
+
+class FileSender:
+    """Sends a response head and a file range over a client connection.
+
+    The bytes bypass the transport: they go straight to a duplicate of the
+    client socket with ``os.write`` and ``os.sendfile``, so the file never
+    passes through user space. Sending waits until the transport flushed
+    whatever it still buffers, which keeps responses in order, and the
+    transport is not written to until ``on_done`` ran.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "file",
+        "head",
+        "loop",
+        "offset",
+        "on_done",
+        "progressed",
+        "remaining",
+        "sock",
+        "transport",
+        "waiting",
+    )
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        transport: asyncio.Transport,
+        head: bytes,
+        file: OpenFile,
+        offset: int,
+        count: int,
+        on_done,
+    ):
+        self.loop = loop
+        self.transport = transport
+        # A descriptor of our own, the loop refuses to watch the transport's
+        self.sock = os.dup(transport.get_extra_info("socket").fileno())
+        self.head = head
+        self.file = file
+        self.offset = offset
+        self.remaining = count
+        self.on_done = on_done
+        self.waiting = False
+        self.progressed = False  # cleared by the owner to detect stalls
+
+    def start(self) -> bool:
+        """Send what the socket takes now, True if everything was sent.
+
+        Otherwise the rest is sent as the socket drains, then ``on_done``
+        is called with whether it succeeded. Raises OSError if sending
+        fails right away.
+        """
+        if not self.transport.get_write_buffer_size():
+            try:
+                done = self.send()
+            except OSError:
+                self.close()
+                raise
+            if done:
+                self.close()
+                return True
+        self.waiting = True
+        self.loop.add_writer(self.sock, self.on_writable)
+        return False
+
+    def send(
+        self,
+        write=os.write,  # bytecode opt
+        sendfile=os.sendfile if SENDFILE_SUPPORTED else None,  # bytecode opt
+    ) -> bool:
+        try:
+            while self.head:
+                self.head = self.head[write(self.sock, self.head) :]
+                self.progressed = True
+            while self.remaining:
+                if sendfile is not None:
+                    sent = sendfile(
+                        self.sock,
+                        self.file.fd,
+                        self.offset,
+                        min(self.remaining, CHUNK_SIZE),
+                    )
+                else:
+                    sent = write(
+                        self.sock,
+                        os.pread(
+                            self.file.fd, min(self.remaining, CHUNK_SIZE), self.offset
+                        ),
+                    )
+                if not sent:
+                    raise EOFError("File shrank while it was being sent")
+                self.offset += sent
+                self.remaining -= sent
+                self.progressed = True
+        except BlockingIOError:
+            return False
+        except EOFError as exc:
+            raise OSError(str(exc)) from exc
+        return True
+
+    def on_writable(self):
+        if self.transport.get_write_buffer_size():
+            return  # earlier responses are still being flushed
+        try:
+            done = self.send()
+        except OSError as exc:
+            self.logger.info("Failed to send file: %s", exc)
+            self.close()
+            self.on_done(False)
+            return
+        if done:
+            self.close()
+            self.on_done(True)
+
+    def close(self):
+        if self.sock == -1:
+            return
+        if self.waiting:
+            self.loop.remove_writer(self.sock)
+            self.waiting = False
+        os.close(self.sock)
+        self.sock = -1
+        self.file.release()
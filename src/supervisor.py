@@ -0,0 +1,115 @@
+import logging
+import os
+import signal
+import time
+from collections.abc import Callable
+
+FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+
+class Supervisor:
+    """Forks worker processes, restarts the ones that die and relays signals.
+
+    Every worker runs ``target`` in a forked child. SIGTERM and SIGINT are
+    forwarded to all workers and stop the supervisor once they have exited,
+    SIGHUP is only forwarded (a worker that exits on it is simply restarted).
+    Workers that die within ``min_uptime`` seconds are restarted after
+    ``restart_delay`` so a broken config doesn't turn into a fork loop.
+    In a worker, ``worker_index`` tells which of the ``workers`` it is; a
+    restarted worker gets the index of the one it replaces. ``on_start``
+    runs in the supervisor once the workers are forked, threads of the
+    supervisor start there, so the workers don't inherit their locks.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_children",
+        "_stopping",
+        "min_uptime",
+        "on_start",
+        "restart_delay",
+        "target",
+        "worker_index",
+        "workers",
+    )
+
+    def __init__(
+        self,
+        target: Callable[[], object],
+        workers: int,
+        min_uptime: float = 1.0,
+        restart_delay: float = 1.0,
+        on_start: Callable[[], object] | None = None,
+    ):
+        self.target = target
+        self.workers = workers
+        self.min_uptime = min_uptime
+        self.restart_delay = restart_delay
+        self.on_start = on_start
+        self.worker_index: int | None = None
+        self._children: dict[int, tuple[float, int]] = {}  # pid -> start time, index
+        self._stopping = False
+
+    def run(self) -> int:
+        for signum in FORWARDED_SIGNALS:
+            signal.signal(signum, self._handle_signal)
+
+        for index in range(self.workers):
+            self._spawn(index)
+        self.logger.info("Supervisor %s started %d workers", os.getpid(), self.workers)
+        if self.on_start is not None:
+            self.on_start()
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            child = self._children.pop(pid, None)
+            if child is None:
+                continue
+            started, index = child
+
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping:
+                self.logger.info("Worker %s exited with %s", pid, code)
+                continue
+
+            self.logger.warning("Worker %s died with %s, restarting", pid, code)
+            if time.monotonic() - started < self.min_uptime:
+                time.sleep(self.restart_delay)
+            if not self._stopping:
+                self._spawn(index)
+
+        self.logger.info("Supervisor %s stopped", os.getpid())
+        return 0
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            self.worker_index = index
+            for signum in FORWARDED_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            # SIGINT keeps raising KeyboardInterrupt so the worker exits cleanly
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            code = 0
+            try:
+                self.target()
+            except BaseException:
+                self.logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+
+        self._children[pid] = (time.monotonic(), index)
+
+    def _handle_signal(self, signum: int, frame: object) -> None:
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable
+from time import monotonic
+
+
+class Timer:
+    """A deadline in a TimerWheel, reused for every timeout of its owner."""
+
+    __slots__ = ("callback", "deadline", "tick")
+
+    def __init__(self, callback: Callable[[], object]):
+        self.callback = callback
+        self.deadline = 0.0
+        self.tick = -1  # the tick of the slot holding it, -1 when not scheduled
+
+
+class TimerWheel:
+    """Hashed timer wheel for per-connection timeouts.
+
+    Time advances in ticks of ``resolution`` seconds, and a timer sits in
+    the slot of the tick its deadline falls in, modulo ``slots``. One loop
+    callback per tick expires the timers in the current slot, so a hundred
+    thousand connections cost no more loop handles than one, and
+    scheduling or cancelling is a set insertion or removal.
+
+    Moving a deadline later leaves the timer in its slot and only updates
+    the deadline: when the slot comes up, the timer is moved on instead of
+    expired. Timeouts that are pushed back on every request therefore cost
+    no set operations. Deadlines further away than a full turn of the wheel
+    simply go round again. Deadlines are measured from the clock of the
+    last tick, so timers fire within a tick of their delay.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = (
+        "_clock",
+        "_count",
+        "_handle",
+        "_mask",
+        "_slots",
+        "_tick",
+        "now",
+        "resolution",
+    )
+
+    def __init__(
+        self,
+        resolution: float = 0.5,
+        slots: int = 512,
+        clock: Callable[[], float] = monotonic,
+    ):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.resolution = resolution
+        self._clock = clock
+        # Coarse clock, advanced every tick, so scheduling reads no clock
+        self.now = clock()
+        self._slots: list[set[Timer]] = [set() for _ in range(slots)]
+        self._mask = slots - 1
+        self._tick = int(self.now / resolution)  # next tick to expire
+        self._count = 0
+        self._handle: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def start(self) -> None:
+        """Expire timers from now on, every ``resolution`` seconds."""
+        if self._handle is None:
+            # The wheel may be built long before the loop runs, so
+            # deadlines scheduled from here on count from the clock now
+            self.now = self._clock()
+            self._tick = int(self.now / self.resolution)
+            for bucket in self._slots:
+                for timer in [t for t in bucket if t.tick < self._tick]:
+                    bucket.discard(timer)
+                    self._insert(timer, self._tick)
+            self._handle = asyncio.get_running_loop().call_later(
+                self.resolution, self.advance
+            )
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def schedule(self, timer: Timer, delay: float, int=int) -> None:  # bytecode opt
+        """Call ``timer.callback`` once ``delay`` seconds have passed.
+
+        Replaces whatever deadline the timer had.
+        """
+        deadline = self.now + delay
+        timer.deadline = deadline
+        tick = int(deadline / self.resolution) + 1
+        if timer.tick == -1:
+            self._count += 1
+        elif timer.tick <= tick:
+            return  # found in its slot in time, and moved on from there
+        else:
+            self._slots[timer.tick & self._mask].discard(timer)
+        self._insert(timer, tick)
+
+    def cancel(self, timer: Timer) -> None:
+        if timer.tick != -1:
+            self._slots[timer.tick & self._mask].discard(timer)
+            timer.tick = -1
+            self._count -= 1
+
+    def _insert(self, timer: Timer, tick: int) -> None:
+        tick = max(tick, self._tick)
+        timer.tick = tick
+        self._slots[tick & self._mask].add(timer)
+
+    def advance(self) -> None:
+        """Expire the timers of every tick up to now."""
+        now = self.now = self._clock()
+        current = int(now / self.resolution)
+        while self._tick <= current:
+            tick = self._tick
+            self._tick += 1
+            bucket = self._slots[tick & self._mask]
+            if not bucket:
+                continue
+            # Callbacks may schedule or cancel timers, including these
+            for timer in list(bucket):
+                if timer.tick != tick:
+                    continue  # cancelled, or moved by an earlier callback
+                bucket.discard(timer)
+                if timer.deadline > now:
+                    # Pushed back, or a turn of the wheel away
+                    self._insert(timer, int(timer.deadline / self.resolution) + 1)
+                    continue
+                timer.tick = -1
+                self._count -= 1
+                try:
+                    timer.callback()
+                except Exception:
+                    self.logger.exception("Timer callback failed")
+        if self._handle is not None:
+            self._handle = asyncio.get_running_loop().call_later(
+                self.resolution, self.advance
+            )
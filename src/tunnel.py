@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+
+SPLICE_SUPPORTED = hasattr(os, "splice")
+SPLICE_FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+PIPE_SIZE = 1024 * 1024
+CHUNK_SIZE = PIPE_SIZE
+
+
+class _Pump:
+    """One direction of a tunnel: ``src`` socket -> pipe -> ``dst`` socket."""
+
+    __slots__ = (
+        "dst",
+        "dst_sock",
+        "eof",
+        "pending",
+        "pipe_r",
+        "pipe_w",
+        "src",
+        "tunnel",
+    )
+
+    def __init__(self, tunnel: SpliceTunnel, src: socket.socket, dst: socket.socket):
+        self.tunnel = tunnel
+        self.src = src.fileno()
+        self.dst = dst.fileno()
+        self.dst_sock = dst
+        self.pipe_r, self.pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        try:
+            import fcntl
+
+            fcntl.fcntl(self.pipe_w, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        except (ImportError, AttributeError, OSError):
+            pass  # default 64 KiB pipe, fewer bytes per wakeup but still works
+        self.pending = 0  # bytes sitting in the pipe
+        self.eof = False
+
+    def start(self):
+        self.tunnel.loop.add_reader(self.src, self.on_readable)
+
+    def on_readable(
+        self,
+        splice=os.splice if SPLICE_SUPPORTED else None,  # bytecode opt
+        flags=SPLICE_FLAGS,  # bytecode opt
+    ):
+        try:
+            n = splice(self.src, self.pipe_w, CHUNK_SIZE, flags=flags)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self.tunnel.close(exc)
+            return
+
+        if n == 0:
+            self.eof = True
+            self.tunnel.loop.remove_reader(self.src)
+        else:
+            self.pending += n
+        self.flush()
+
+    def on_writable(self):
+        self.tunnel.loop.remove_writer(self.dst)
+        self.flush()
+        if not self.pending and not self.eof and not self.tunnel.closed:
+            self.tunnel.loop.add_reader(self.src, self.on_readable)
+
+    def flush(
+        self,
+        splice=os.splice if SPLICE_SUPPORTED else None,  # bytecode opt
+        flags=SPLICE_FLAGS,  # bytecode opt
+    ):
+        while self.pending:
+            try:
+                self.pending -= splice(self.pipe_r, self.dst, self.pending, flags=flags)
+            except BlockingIOError:
+                # dst is full, stop reading src until it drains
+                self.tunnel.loop.remove_reader(self.src)
+                self.tunnel.loop.add_writer(self.dst, self.on_writable)
+                return
+            except OSError as exc:
+                self.tunnel.close(exc)
+                return
+
+        if self.eof:
+            try:
+                self.dst_sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            self.tunnel.pump_finished()
+
+    def close(self):
+        loop = self.tunnel.loop
+        loop.remove_reader(self.src)
+        loop.remove_writer(self.dst)
+        os.close(self.pipe_r)
+        os.close(self.pipe_w)
+
+
+class SpliceTunnel:
+    """Relays two connected sockets through pipes with ``os.splice``.
+
+    Bytes move kernel-to-kernel and Python only runs on readiness events.
+    EOF on one side is passed on as a write shutdown of the other, and the
+    tunnel closes both sockets once both directions are done or either
+    one fails. The tunnel owns the two sockets.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    __slots__ = ("closed", "finished", "loop", "pumps", "sock_a", "sock_b")
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        sock_a: socket.socket,
+        sock_b: socket.socket,
+    ):
+        self.loop = loop
+        self.sock_a = sock_a
+        self.sock_b = sock_b
+        self.pumps = (_Pump(self, sock_a, sock_b), _Pump(self, sock_b, sock_a))
+        self.finished = 0
+        self.closed = False
+
+    def start(self):
+        for pump in self.pumps:
+            pump.start()
+
+    def pump_finished(self):
+        self.finished += 1
+        if self.finished == len(self.pumps):
+            self.close()
+
+    def close(self, exc: Exception | None = None):
+        if self.closed:
+            return
+        self.closed = True
+        if exc is not None:
+            self.logger.debug("Splice tunnel closed with error: %s", exc)
+        for pump in self.pumps:
+            pump.close()
+        self.sock_a.close()
+        self.sock_b.close()
+
+
+async def hand_over(
+    loop: asyncio.AbstractEventLoop,
+    transport_a: asyncio.Transport,
+    transport_b: asyncio.Transport,
+) -> SpliceTunnel | None:
+    """Take the sockets of two transports and relay them with a SpliceTunnel.
+
+    Both transports stop reading, and their write buffers are flushed before
+    the sockets are duplicated. Then the transports are closed, so the
+    sockets belong only to the tunnel. Returns None if either side closed
+    first.
+    """
+    transport_a.pause_reading()
+    transport_b.pause_reading()
+    while transport_a.get_write_buffer_size() or transport_b.get_write_buffer_size():
+        if transport_a.is_closing() or transport_b.is_closing():
+            return None
+        await asyncio.sleep(0.001)
+    if transport_a.is_closing() or transport_b.is_closing():
+        return None
+
+    sock_a = socket.socket(fileno=os.dup(transport_a.get_extra_info("socket").fileno()))
+    sock_b = socket.socket(fileno=os.dup(transport_b.get_extra_info("socket").fileno()))
+    sock_a.setblocking(False)
+    sock_b.setblocking(False)
+    transport_a.close()
+    transport_b.close()
+
+    tunnel = SpliceTunnel(loop, sock_a, sock_b)
+    tunnel.start()
+    return tunnel
@@ -8,6 +8,9 @@ import uvloop
 
 pytestmarkasyncio = pytest.mark.asyncio(scope="session")
 
+# The routes of the backends started by the fixtures below
+ROUTES = pathlib.Path(__file__).parent / "routes.yaml"
+
 
 @pytest_asyncio.fixture(autouse=True)
 def proxy_logging():
@@ -30,8 +33,10 @@ async def proxy_server():
     """Start the reverse proxy server."""
     loop = asyncio.get_running_loop()
 
+    from config import load_routes
     from protocol import ReverseProxy
 
+    ReverseProxy.install_routes(load_routes(ROUTES, ReverseProxy._resolver))
     server = await loop.create_server(
         ReverseProxy, "127.0.0.1", 8080, start_serving=False
     )
@@ -63,3 +68,37 @@ async def upstream_server():
         process.wait(timeout=5)
     except subprocess.TimeoutExpired:
         process.kill()
+
+
+class NamedBackend(asyncio.Protocol):
+    def __init__(self, name: bytes):
+        self.name = name
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write(
+            b"HTTP/1.1 200 OK\r\nContent-Length: "
+            + str(len(self.name)).encode()
+            + b"\r\n\r\n"
+            + self.name
+        )
+
+
+@pytest_asyncio.fixture()
+async def backends():
+    """Start two upstreams on ports 9101 and 9102, answering A and B."""
+    loop = asyncio.get_running_loop()
+    servers = [
+        await loop.create_server(lambda: NamedBackend(b"A"), "127.0.0.1", 9101),
+        await loop.create_server(lambda: NamedBackend(b"B"), "127.0.0.1", 9102),
+    ]
+    yield
+    from protocol import ReverseProxy
+
+    # Kept-alive connections would outlive the servers and answer later tests
+    ReverseProxy._pool.close()
+    for server in servers:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+
+@pytest_asyncio.fixture()
+async def access_log(tmp_path):
+    from access_log import AccessLog
+    from protocol import ReverseProxy
+
+    log = AccessLog(tmp_path / "access.log", interval=60)
+    log.start()
+    ReverseProxy.access_log = log
+    yield tmp_path / "access.log"
+    ReverseProxy.access_log = None
+    log.stop()
+
+
+@pytestmarkasyncio
+async def test_responses_are_logged(access_log, proxy_server, backends):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /multi/?x=1 HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    await asyncio.wait_for(reader.readuntil(b"A"), timeout=5)
+    writer.write(b"GET /nowhere HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    await asyncio.wait_for(reader.read(), timeout=5)
+    writer.close()
+
+    from protocol import ReverseProxy
+
+    ReverseProxy.access_log.stop()
+    first, second = access_log.read_bytes().splitlines()
+    assert first.startswith(b"127.0.0.1 - - [")
+    assert b'] "GET /multi/?x=1" 200 ' in first
+    assert first.endswith(b" a.multi.test")
+    assert b'] "GET /nowhere" 404 ' in second
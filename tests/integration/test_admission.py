@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+REQUEST = b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n"
+
+
+class SlowBackend(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        asyncio.get_running_loop().call_later(
+            0.3,
+            self.transport.write,
+            b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nslow",
+        )
+
+
+@pytest_asyncio.fixture()
+async def slow_backend():
+    server = await asyncio.get_running_loop().create_server(
+        SlowBackend, "127.0.0.1", 9101
+    )
+    yield
+    from protocol import ReverseProxy
+
+    ReverseProxy._pool.close()
+    server.close()
+    await server.wait_closed()
+
+
+@pytest_asyncio.fixture()
+async def limits():
+    from protocol import ReverseProxy
+
+    yield ReverseProxy
+    ReverseProxy.admission = None
+    ReverseProxy.client_limit = None
+
+
+@pytestmarkasyncio
+async def test_requests_over_the_limit_are_shed(limits, proxy_server, slow_backend):
+    from admission import ConcurrencyLimit
+
+    limits.admission = ConcurrencyLimit(max_limit=1, min_limit=1)
+    first_reader, first_writer = await asyncio.open_connection("127.0.0.1", 8080)
+    first_writer.write(REQUEST)
+    await asyncio.sleep(0.1)
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(REQUEST)
+    response = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+    assert response == (
+        b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+        b"Content-Length: 0\r\n\r\n"
+    )
+
+    # The admitted request is served, and frees its slot
+    response = await asyncio.wait_for(first_reader.readuntil(b"slow"), timeout=5)
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert limits.admission.in_flight == 0
+    writer.write(REQUEST)
+    response = await asyncio.wait_for(reader.readuntil(b"slow"), timeout=5)
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    first_writer.close()
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_clients_over_their_rate_are_limited(limits, proxy_server, backends):
+    from admission import TokenBuckets
+
+    limits.client_limit = TokenBuckets(rate=0.5, burst=2)
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    for _ in range(2):
+        writer.write(REQUEST)
+        await asyncio.wait_for(reader.readuntil(b"A"), timeout=5)
+    writer.write(REQUEST)
+    response = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+    assert response == (
+        b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 2\r\nContent-Length: 0\r\n\r\n"
+    )
+    writer.close()
@@ -0,0 +1,153 @@
+import asyncio
+from typing import ClassVar
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+RESPONSES = {
+    b"/fresh": b'Cache-Control: max-age=60\r\nETag: "v1"\r\n',
+    b"/stale": b'Cache-Control: max-age=0\r\nETag: "v1"\r\n',
+    b"/private": b"Cache-Control: private, max-age=60\r\n",
+    b"/slow": b"Cache-Control: max-age=60\r\n",
+    b"/slow-private": b"Cache-Control: private\r\n",
+}
+SLOW_RESPONSE_DELAY = 0.2
+
+
+class CountingBackend(asyncio.Protocol):
+    """Answers with the request count, and 304 to a matching If-None-Match."""
+
+    requests: ClassVar[list[bytes]] = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.requests.append(data)
+        path = data.split(b" ", 2)[1]
+        if b'If-None-Match: "v1"' in data:
+            self.transport.write(b'HTTP/1.1 304 Not Modified\r\nETag: "v1"\r\n\r\n')
+            return
+        body = b"%d" % len(self.requests)
+        response = b"HTTP/1.1 200 OK\r\n%sContent-Length: %d\r\n\r\n%s" % (
+            RESPONSES[path],
+            len(body),
+            body,
+        )
+        if path.startswith(b"/slow"):
+            asyncio.get_running_loop().call_later(
+                SLOW_RESPONSE_DELAY, self.transport.write, response
+            )
+        else:
+            self.transport.write(response)
+
+
+@pytest_asyncio.fixture()
+async def counting_backend():
+    CountingBackend.requests = []
+    server = await asyncio.get_running_loop().create_server(
+        CountingBackend, "127.0.0.1", 9103
+    )
+    yield CountingBackend.requests
+    server.close()
+    await server.wait_closed()
+
+
+async def get(writer, reader, path: bytes, headers: bytes = b"") -> tuple[bytes, bytes]:
+    writer.write(
+        b"GET /cached%s HTTP/1.1\r\nHost: localhost\r\n%s\r\n" % (path, headers)
+    )
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    return head, await reader.readexactly(length)
+
+
+@pytestmarkasyncio
+async def test_fresh_response_is_served_from_cache(proxy_server, counting_backend):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    first_head, first = await get(writer, reader, b"/fresh")
+    second_head, second = await get(writer, reader, b"/fresh")
+
+    assert first == second == b"1"
+    assert len(counting_backend) == 1
+    assert b"Age: 0" in second_head
+    assert b"Age:" not in first_head
+
+    head, body = await get(writer, reader, b"/fresh", b'If-None-Match: "v1"\r\n')
+    assert head.startswith(b"HTTP/1.1 304")
+    assert body == b""
+    assert len(counting_backend) == 1
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_stale_response_is_revalidated(proxy_server, counting_backend):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    await get(writer, reader, b"/stale")
+    head, body = await get(writer, reader, b"/stale")
+
+    # The upstream answered 304, the client gets the cached 200
+    assert head.startswith(b"HTTP/1.1 200 OK")
+    assert body == b"1"
+    assert len(counting_backend) == 2
+    assert b'If-None-Match: "v1"' in counting_backend[1]
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_uncacheable_responses(proxy_server, counting_backend):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    assert (await get(writer, reader, b"/private"))[1] == b"1"
+    assert (await get(writer, reader, b"/private"))[1] == b"2"
+    # Requests that carry credentials bypass the cache
+    await get(writer, reader, b"/fresh")
+    _, body = await get(writer, reader, b"/fresh", b"Authorization: Basic eDp5\r\n")
+    assert body == b"4"
+    writer.close()
+
+
+async def get_concurrently(path: bytes, clients: int) -> list[bytes]:
+    connections = [
+        await asyncio.open_connection("127.0.0.1", 8080) for _ in range(clients)
+    ]
+    bodies = await asyncio.gather(
+        *(get(writer, reader, path) for reader, writer in connections)
+    )
+    for _, writer in connections:
+        writer.close()
+    return [body for _, body in bodies]
+
+
+@pytestmarkasyncio
+async def test_identical_requests_are_collapsed(proxy_server, counting_backend):
+    assert await get_concurrently(b"/slow", 10) == [b"1"] * 10
+    assert len(counting_backend) == 1
+
+
+@pytestmarkasyncio
+async def test_private_responses_are_not_shared(proxy_server, counting_backend):
+    bodies = await get_concurrently(b"/slow-private", 5)
+    # The first response goes to its own client only, the others fetch again
+    assert sorted(bodies) == [b"1", b"2", b"3", b"4", b"5"]
+    assert len(counting_backend) == 5
+
+
+@pytestmarkasyncio
+async def test_unshared_waiters_are_admitted_like_any_request(
+    proxy_server, counting_backend
+):
+    from admission import ConcurrencyLimit
+    from protocol import ReverseProxy
+
+    ReverseProxy.admission = ConcurrencyLimit(max_limit=1, min_limit=1)
+    try:
+        bodies = await get_concurrently(b"/slow-private", 5)
+    finally:
+        ReverseProxy.admission = None
+    # One waiter takes the slot the first request freed, the others are shed
+    assert sorted(bodies) == [b"", b"", b"", b"1", b"2"]
+    assert len(counting_backend) == 2
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+SLOW_RESPONSE_DELAY = 0.3
+
+
+class SlowBackend(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        asyncio.get_running_loop().call_later(
+            SLOW_RESPONSE_DELAY,
+            self.transport.write,
+            b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nslow",
+        )
+
+
+@pytest_asyncio.fixture()
+async def slow_backend():
+    server = await asyncio.get_running_loop().create_server(
+        SlowBackend, "127.0.0.1", 9101
+    )
+    yield
+    server.close()
+    await server.wait_closed()
+
+
+@pytest_asyncio.fixture()
+async def draining():
+    from protocol import ReverseProxy
+
+    yield ReverseProxy
+    ReverseProxy.draining = False
+
+
+async def read_until_closed(reader: asyncio.StreamReader) -> bytes:
+    return await asyncio.wait_for(reader.read(), timeout=5)
+
+
+@pytestmarkasyncio
+async def test_drain_finishes_in_flight_requests(proxy_server, slow_backend, draining):
+    idle_reader, idle_writer = await asyncio.open_connection("127.0.0.1", 8080)
+    busy_reader, busy_writer = await asyncio.open_connection("127.0.0.1", 8080)
+    busy_writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    await asyncio.sleep(0.1)
+
+    proxy_server.close()
+    await draining.drain(timeout=5)
+
+    # The idle keep-alive connection is closed without a response
+    assert await read_until_closed(idle_reader) == b""
+    # The busy one gets its response, then the connection is closed
+    response = await read_until_closed(busy_reader)
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b"slow")
+    assert not draining._connections
+    idle_writer.close()
+    busy_writer.close()
+
+
+@pytestmarkasyncio
+async def test_drain_deadline(proxy_server, slow_backend, draining):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    await asyncio.sleep(0.05)
+
+    await draining.drain(timeout=0.1)
+    assert await read_until_closed(reader) == b""
+    assert not draining._connections
+    writer.close()
@@ -20,7 +20,9 @@ async def test_keep_alive_basic(proxy_server, upstream_server):
         async with session.get(url, headers={"Connection": "keep-alive"}) as resp:
             assert resp.status == 200
             body = await resp.json()
-            assert body["headers"].get("Connection", "")[0].lower() == "keep-alive"
+            # Hop-by-hop, the upstream gets the proxy's own
+            assert "Connection" not in body["headers"]
+            assert body["headers"]["X-Forwarded-For"] == ["127.0.0.1"]
 
             # Verify new connection was established
             assert count_open_connections() == initial_conn_count + 1
@@ -63,7 +65,7 @@ async def test_connection_close_header(
             assert count_open_connections() == initial_conn_count
             assert resp.status == 200
             body = await resp.json()
-            assert body["headers"].get("Connection", "")[0].lower() == "close"
+            assert "Connection" not in body["headers"]
 
             # Verify connection was established
             first_conn = session1.connector
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+ADMIN_PORT = 9180
+
+
+@pytest_asyncio.fixture()
+async def admin_server():
+    from metrics import serve_admin
+
+    server = await serve_admin("127.0.0.1", ADMIN_PORT)
+    yield
+    server.close()
+    await server.wait_closed()
+
+
+async def scrape(path: bytes = b"/metrics") -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", ADMIN_PORT)
+    writer.write(b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+    response = await asyncio.wait_for(reader.read(), timeout=5)
+    writer.close()
+    return response
+
+
+def value(metrics: bytes, series: bytes) -> int:
+    for line in metrics.splitlines():
+        if line.startswith(series + b" "):
+            return int(line.rsplit(b" ", 1)[1])
+    return 0
+
+
+@pytestmarkasyncio
+async def test_request_stages_are_exported(proxy_server, backends, admin_server):
+    labels = b'route="/multi/",vhost="a.multi.test"'
+    before = await scrape()
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    for _ in range(3):
+        writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+        await asyncio.wait_for(reader.readuntil(b"A"), timeout=5)
+    writer.close()
+
+    after = await scrape()
+    assert after.startswith(b"HTTP/1.1 200 OK\r\n")
+    for stage in (b"route", b"connect", b"ttfb", b"total"):
+        series = b'proxy_stage_seconds_count{stage="%s",%s}' % (stage, labels)
+        assert value(after, series) - value(before, series) == 3
+    series = b'proxy_responses_total{code="2xx",%s}' % labels
+    assert value(after, series) - value(before, series) == 3
+    series = (
+        b'proxy_upstream_stage_seconds_count{stage="ttfb",upstream="127.0.0.1:9101"}'
+    )
+    assert value(after, series) - value(before, series) == 3
+
+
+@pytestmarkasyncio
+async def test_admin_not_found(admin_server):
+    assert (await scrape(b"/")).startswith(b"HTTP/1.1 404 Not Found\r\n")
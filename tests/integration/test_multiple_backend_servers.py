@@ -1 +1,37 @@
-# TODO implement
+from aiohttp import ClientSession, TCPConnector
+
+from .conftest import pytestmarkasyncio
+
+
+@pytestmarkasyncio
+async def test_round_robin_between_backends(proxy_server, backends):
+    names = []
+    async with ClientSession(connector=TCPConnector(force_close=True)) as session:
+        for _ in range(4):
+            async with session.get("http://127.0.0.1:8080/multi/") as resp:
+                assert resp.status == 200
+                names.append(await resp.text())
+
+    assert sorted(names) == ["A", "A", "B", "B"]
+    assert names[0] != names[1]
+
+
+@pytestmarkasyncio
+async def test_host_header_selects_route_table(proxy_server, backends):
+    async with ClientSession() as session:
+        for host, name in [
+            ("a.multi.test", "A"),
+            ("x.b.multi.test:8080", "B"),
+            ("a.multi.test", "A"),
+            ("y.x.b.multi.test", "B"),
+        ]:
+            async with session.get(
+                "http://127.0.0.1:8080/multi/", headers={"Host": host}
+            ) as resp:
+                assert resp.status == 200
+                assert await resp.text() == name
+
+        async with session.get(
+            "http://127.0.0.1:8080/api/", headers={"Host": "a.multi.test"}
+        ) as resp:
+            assert resp.status == 404
@@ -0,0 +1,47 @@
+import pytest
+from aiohttp import ClientSession
+
+from .conftest import pytestmarkasyncio
+
+ROUTES = """
+routes:
+  /app/:
+    host: 127.0.0.1
+    port: {port}
+"""
+
+
+@pytest.fixture
+def routes_file(tmp_path):
+    from protocol import ReverseProxy
+
+    path = tmp_path / "routes.yaml"
+    path.write_text(ROUTES.format(port=9101))
+    default_path = ReverseProxy.routes_path
+    ReverseProxy.routes_path = path
+    yield path
+    ReverseProxy.routes_path = default_path
+
+
+async def get_app(session: ClientSession) -> str:
+    async with session.get("http://127.0.0.1:8080/app/") as resp:
+        assert resp.status == 200
+        return await resp.text()
+
+
+@pytestmarkasyncio
+async def test_reload_swaps_routes(proxy_server, backends, routes_file):
+    from protocol import ReverseProxy
+
+    assert await ReverseProxy.reload_routes()
+    async with ClientSession() as session:
+        assert await get_app(session) == "A"
+
+        routes_file.write_text(ROUTES.format(port=9102))
+        assert await ReverseProxy.reload_routes()
+        # same keep-alive connection, next request uses the new table
+        assert await get_app(session) == "B"
+
+        routes_file.write_text("routes: [not, a, mapping")
+        assert not await ReverseProxy.reload_routes()
+        assert await get_app(session) == "B"
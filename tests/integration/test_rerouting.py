@@ -0,0 +1,64 @@
+import asyncio
+
+from .conftest import pytestmarkasyncio
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.lower() == b"content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, body
+
+
+def request(path: bytes) -> bytes:
+    return b"GET " + path + b" HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+
+
+@pytestmarkasyncio
+async def test_each_keepalive_request_is_routed(proxy_server, upstream_server):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+
+    writer.write(request(b"/test/"))
+    status, body = await read_response(reader)
+    assert status == 200
+    assert body == b"OK"
+
+    # /api/ points at a backend that is not running, so it must not reuse
+    # the /test/ upstream of the previous request
+    writer.write(request(b"/api/"))
+    status, _ = await read_response(reader)
+    assert status == 502
+
+    writer.close()
+    await writer.wait_closed()
+
+
+@pytestmarkasyncio
+async def test_pipelined_requests(proxy_server, upstream_server):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+
+    body = b'{"n": 1}'
+    writer.write(
+        b"POST /test/echo-json HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        b"Content-Length: "
+        + str(len(body)).encode()
+        + b"\r\n\r\n"
+        + body
+        + request(b"/test/")
+    )
+
+    status, echoed = await read_response(reader)
+    assert status == 200
+    assert b'"body":{"n":1}' in echoed
+
+    status, root = await read_response(reader)
+    assert status == 200
+    assert root == b"OK"
+
+    writer.close()
+    await writer.wait_closed()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+LARGE_SIZE = 8 * 1024 * 1024
+
+
+@pytest_asyncio.fixture()
+async def static_routes(proxy_server, tmp_path):
+    from config import load_routes
+    from protocol import ReverseProxy
+
+    root = tmp_path / "public"
+    root.mkdir()
+    (root / "small.txt").write_bytes(b"hello")
+    (root / "large.bin").write_bytes(os.urandom(LARGE_SIZE))
+    routes = tmp_path / "routes.yaml"
+    routes.write_text(f"routes:\n  /assets/:\n    root: {root}\n")
+    ReverseProxy.install_routes(load_routes(routes))
+    return root
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[bytes, bytes]:
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+    return head, await asyncio.wait_for(reader.readexactly(length), timeout=5)
+
+
+@pytestmarkasyncio
+async def test_static_files(static_routes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    # Pipelined, the large body is sent while the socket drains
+    writer.write(
+        b"GET /assets/large.bin HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        b"GET /assets/small.txt HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        b"GET /assets/small.txt HTTP/1.1\r\nHost: localhost\r\nRange: bytes=1-3\r\n\r\n"
+        b"GET /assets/missing HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    )
+    await asyncio.sleep(0.2)  # let the socket buffers fill up
+
+    head, body = await read_response(reader)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert body == (static_routes / "large.bin").read_bytes()
+
+    head, body = await read_response(reader)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Type: text/plain\r\n" in head
+    assert body == b"hello"
+
+    head, body = await read_response(reader)
+    assert head.startswith(b"HTTP/1.1 206 Partial Content\r\n")
+    assert body == b"ell"
+
+    head, body = await read_response(reader)
+    assert head.startswith(b"HTTP/1.1 404 Not Found\r\n")
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_client_closes_during_transfer(static_routes):
+    from protocol import ReverseProxy
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /assets/large.bin HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    writer.close()
+    await asyncio.sleep(0.2)
+    assert not ReverseProxy._connections
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest_asyncio
+
+from .conftest import pytestmarkasyncio
+
+
+class SilentBackend(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+
+@pytest_asyncio.fixture()
+async def silent_backend():
+    server = await asyncio.get_running_loop().create_server(
+        SilentBackend, "127.0.0.1", 9101
+    )
+    yield
+    from protocol import ReverseProxy
+
+    ReverseProxy._pool.close()
+    server.close()
+    await server.wait_closed()
+
+
+@pytest_asyncio.fixture()
+async def timeouts():
+    from protocol import ReverseProxy
+    from timer_wheel import TimerWheel
+
+    saved = {
+        name: getattr(ReverseProxy, name)
+        for name in ("_timers", "header_timeout", "idle_timeout", "response_timeout")
+    }
+    ReverseProxy._timers = TimerWheel(resolution=0.05)
+    ReverseProxy._timers.start()
+    ReverseProxy.header_timeout = 0.2
+    ReverseProxy.idle_timeout = 0.3
+    ReverseProxy.response_timeout = 0.2
+    yield ReverseProxy
+    ReverseProxy._timers.stop()
+    for name, value in saved.items():
+        setattr(ReverseProxy, name, value)
+
+
+async def read_until_closed(reader: asyncio.StreamReader) -> bytes:
+    return await asyncio.wait_for(reader.read(), timeout=5)
+
+
+@pytestmarkasyncio
+async def test_incomplete_head_times_out(timeouts, proxy_server):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.mul")
+    assert await read_until_closed(reader) == (
+        b"HTTP/1.1 408 Request Timeout\r\nContent-Length: 0\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_idle_connection_is_closed(timeouts, proxy_server, backends):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    await asyncio.wait_for(reader.readuntil(b"A"), timeout=5)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await read_until_closed(reader) == b""
+    # The idle timeout, not the header timeout, applies between requests
+    assert loop.time() - started >= 0.25
+    assert not timeouts._connections
+    writer.close()
+
+
+@pytestmarkasyncio
+async def test_silent_upstream_times_out(timeouts, proxy_server, silent_backend):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 8080)
+    writer.write(b"GET /multi/ HTTP/1.1\r\nHost: a.multi.test\r\n\r\n")
+    response = await read_until_closed(reader)
+    assert response.startswith(b"HTTP/1.1 504 Gateway Timeout\r\n")
+    writer.close()
@@ -0,0 +1,25 @@
+import pytest
+from aiohttp import ClientSession
+
+from .conftest import pytestmarkasyncio
+
+
+@pytestmarkasyncio
+async def test_tunnel_route(proxy_server, upstream_server):
+    async with (
+        ClientSession() as session,
+        session.get("http://127.0.0.1:8080/tunnel/") as resp,
+    ):
+        assert resp.status == 200
+        assert await resp.text() == "OK"
+
+
+@pytestmarkasyncio
+@pytest.mark.parametrize("data_size", [70_000, 10_000_000])
+async def test_tunnel_route_large_body(proxy_server, upstream_server, data_size):
+    async with (
+        ClientSession() as session,
+        session.post("http://127.0.0.1:8080/tunnel/", data=b"x" * data_size) as resp,
+    ):
+        assert resp.status == 200
+        assert await resp.text() == "OK"
@@ -10,3 +10,50 @@ def trie():
     trie.insert(b"/api/v1", Target(host=b"apiv1.local", port=b"8081"))
     trie.insert(b"/static/assets", Target(host=b"static.local", port=b"8082"))
     return trie
+
+
+@pytest.fixture
+def compiled(trie):
+    return trie.compile()
+
+
+class FakeTransport:
+    """Stands in for the transports of protocols under test."""
+
+    def __init__(self, protocol=None, peername=None):
+        self.protocol = protocol
+        self.peername = peername
+        self.reading = True
+        self.limits = None
+        self.closed = False
+        self.written = bytearray()
+
+    def get_protocol(self):
+        return self.protocol
+
+    def get_extra_info(self, name, default=None):
+        if name == "peername" and self.peername is not None:
+            return self.peername
+        return default
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self.limits = (high, low)
+
+    def write(self, data):
+        self.written.extend(data)
+
+    def writelines(self, segments):
+        for data in segments:
+            self.written.extend(data)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
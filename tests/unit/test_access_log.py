@@ -0,0 +1,69 @@
+import os
+import re
+
+from access_log import AccessLog
+
+LINE = re.compile(
+    rb"^127\.0\.0\.1 - - \[\d\d/\w{3}/\d{4}:\d\d:\d\d:\d\d [+-]\d{4}\] "
+    rb'"GET /a\?b=1" 200 0\.001500 example\.com\n$'
+)
+
+
+def test_format(tmp_path):
+    log = AccessLog(tmp_path / "access.log")
+    log._open()
+    log.record(b"127.0.0.1", b"GET", b"/a?b=1", b"example.com", 200, 1_500_000)
+    log.record(None, None, None, None, 400, 0)
+    log._flush()
+    first, second = (tmp_path / "access.log").read_bytes().splitlines(keepends=True)
+    assert LINE.match(first)
+    assert second.startswith(b"- - - [")
+    assert second.endswith(b'] "- -" 400 0.000000 -\n')
+
+
+def test_drops_when_full(tmp_path):
+    log = AccessLog(tmp_path / "access.log", capacity=3)
+    assert log.capacity == 4
+    log._open()
+    for i in range(6):
+        log.record(b"127.0.0.1", b"GET", b"/%d" % i, None, 200, 0)
+    assert log.lost == 2
+    assert log.dropped.words[log.dropped.index] >= 2
+
+    log._flush()
+    # The ring is empty again and takes records from where it stopped
+    log.record(b"127.0.0.1", b"GET", b"/6", None, 200, 0)
+    log._flush()
+    lines = (tmp_path / "access.log").read_bytes().splitlines()
+    assert [line.split(b'"')[1] for line in lines] == [
+        b"GET /0",
+        b"GET /1",
+        b"GET /2",
+        b"GET /3",
+        b"GET /6",
+    ]
+    assert log._reported == 2
+
+
+def test_thread_writes_and_stops(tmp_path):
+    log = AccessLog(tmp_path / "access.log", interval=60)
+    log.start()
+    for i in range(10):
+        log.record(b"127.0.0.1", b"GET", b"/%d" % i, None, 200, 0)
+    # Buffered lines are written on stop, without waiting for the interval
+    log.stop()
+    assert len((tmp_path / "access.log").read_bytes().splitlines()) == 10
+
+
+def test_reopen(tmp_path):
+    path = tmp_path / "access.log"
+    log = AccessLog(path)
+    log._open()
+    log.record(b"127.0.0.1", b"GET", b"/old", None, 200, 0)
+    log._flush()
+    os.rename(path, tmp_path / "access.log.1")
+    log.reopen()
+    log.record(b"127.0.0.1", b"GET", b"/new", None, 200, 0)
+    log._flush()
+    assert b"/old" in (tmp_path / "access.log.1").read_bytes()
+    assert b"/new" in path.read_bytes()
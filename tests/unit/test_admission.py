@@ -0,0 +1,104 @@
+import pytest
+
+from admission import ConcurrencyLimit, TokenBuckets
+
+MS = 1_000_000
+
+
+def test_sheds_over_the_limit():
+    limit = ConcurrencyLimit(max_limit=2, min_limit=1)
+    assert limit.acquire()
+    assert limit.acquire()
+    assert not limit.acquire()
+    limit.release(MS)
+    assert limit.acquire()
+    limit.abandon()
+    assert limit.in_flight == 1
+
+
+def test_backs_off_when_latency_rises():
+    limit = ConcurrencyLimit(max_limit=100, min_limit=10)
+    for _ in range(500):
+        limit.acquire()
+        limit.release(MS)
+    assert limit.limit == 100
+
+    for _ in range(500):
+        limit.acquire()
+        limit.release(50 * MS)
+    assert limit.limit < 100
+    # At most once per window of limit requests
+    assert limit.limit >= 100 * 0.9 ** (500 // 10)
+    assert limit.limit >= limit.min_limit
+
+
+def test_backs_off_on_timeouts():
+    limit = ConcurrencyLimit(max_limit=10, min_limit=1)
+    for _ in range(3):
+        limit.acquire()
+        limit.release(MS)
+    for _ in range(20):
+        limit.acquire()
+        limit.release(MS, overloaded=True)
+    # Twice: the window starts after the first sample
+    assert limit.limit == pytest.approx(10 * 0.9**2)
+
+
+def test_grows_back_while_used():
+    limit = ConcurrencyLimit(max_limit=20, min_limit=2)
+    limit.limit = 5.0
+    for _ in range(3):
+        limit.acquire()
+    for _ in range(50):
+        limit.acquire()
+        limit.release(MS)
+    assert limit.limit > 5
+    assert limit.limit <= 20
+
+
+def test_does_not_grow_unused():
+    limit = ConcurrencyLimit(max_limit=20, min_limit=2)
+    limit.limit = 5.0
+    for _ in range(50):
+        limit.acquire()
+        limit.release(MS)
+    assert limit.limit == 5.0
+
+
+def test_bounds_are_checked():
+    with pytest.raises(ValueError):
+        ConcurrencyLimit(max_limit=1, min_limit=2)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_burst_and_refill():
+    clock = Clock()
+    buckets = TokenBuckets(rate=2, burst=3, clock=clock)
+    assert [buckets.take(b"a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take(b"a") == pytest.approx(0.5)
+    # Other clients have their own bucket
+    assert buckets.take(b"b") == 0
+    clock.now = 0.5
+    assert buckets.take(b"a") == 0
+    assert buckets.take(b"a") > 0
+    clock.now = 100
+    assert [buckets.take(b"a") for _ in range(3)] == [0, 0, 0]
+
+
+def test_token_buckets_are_bounded():
+    buckets = TokenBuckets(rate=1, burst=1, max_clients=2, clock=Clock())
+    assert buckets.take(b"a") == 0
+    assert buckets.take(b"b") == 0
+    assert buckets.take(b"a") > 0  # a is now the most recently seen
+    assert buckets.take(b"c") == 0
+    assert len(buckets) == 2
+    # b was dropped, and starts over with a full bucket
+    assert buckets.take(b"b") == 0
+    assert buckets.take(b"a") == 0
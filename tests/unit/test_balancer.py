@@ -0,0 +1,88 @@
+from collections import Counter
+
+import pytest
+
+from balancer import (
+    LeastOutstandingGroup,
+    PowerOfTwoGroup,
+    RoundRobinGroup,
+    UpstreamGroup,
+    WeightedGroup,
+    make_group,
+)
+from route_trie import Target
+
+
+def targets(*weights):
+    return [
+        Target(f"backend{i}.local".encode(), b"80", weight=weight)
+        for i, weight in enumerate(weights)
+    ]
+
+
+def test_single_target_group():
+    group = make_group(targets(1), "p2c")
+    assert type(group) is UpstreamGroup
+    assert group.pick() is group.targets[0]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        make_group(targets(1, 1), "random")
+
+
+def test_round_robin():
+    group = RoundRobinGroup(targets(1, 1, 1))
+    picked = [group.pick() for _ in range(6)]
+    assert picked == group.targets * 2
+
+
+def test_weighted_is_smooth():
+    a, b, c = backends = targets(5, 1, 1)
+    group = WeightedGroup(backends)
+    picked = [group.pick() for _ in range(7)]
+    assert picked == [a, a, b, a, c, a, a]
+
+
+def test_weighted_normalizes_weights():
+    group = WeightedGroup(targets(300, 100))
+    counts = Counter(group.pick() for _ in range(4))
+    assert list(counts.values()) == [3, 1]
+
+
+def test_least_outstanding():
+    a, b, c = backends = targets(1, 1, 1)
+    group = LeastOutstandingGroup(backends)
+
+    group.start(a)
+    group.start(b)
+    assert group.pick() is c
+
+    group.start(c)
+    group.start(c)
+    group.done(a)
+    assert group.pick() is a
+    assert (a.outstanding, b.outstanding, c.outstanding) == (0, 1, 2)
+
+
+def test_power_of_two_prefers_less_loaded():
+    idle, busy = backends = targets(1, 1)
+    group = PowerOfTwoGroup(backends)
+    for _ in range(5):
+        group.start(busy)
+    assert all(group.pick() is idle for _ in range(10))
+
+
+def test_ejected_targets_are_skipped():
+    a, b, c = backends = targets(1, 1, 1)
+    group = RoundRobinGroup(backends)
+    b.healthy = False
+    group.start(c)
+    assert [group.pick() for _ in range(3)] == [a, a, c]
+
+
+def test_all_targets_down_routes_anyway():
+    group = RoundRobinGroup(targets(1, 1))
+    for target in group.targets:
+        target.healthy = False
+    assert group.pick() is group.targets[0]
@@ -0,0 +1,170 @@
+import pytest
+
+from cache import ResponseCache, etag_matches, freshness_lifetime, parse_headers
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def response(body=b"hello", **headers):
+    head = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n" % len(body)
+    for name, value in headers.items():
+        head += name.replace("_", "-").title().encode() + b": " + value + b"\r\n"
+    return head + b"\r\n" + body
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    return ResponseCache(max_bytes=1024, max_entry_bytes=512, clock=clock)
+
+
+KEY = (b"example.com", b"/static/app.js")
+
+
+def test_parse_headers():
+    headers = parse_headers(
+        b"GET / HTTP/1.1\r\nHost: a\r\nAccept: text/html\r\naccept: */*\r\n\r\n"
+    )
+    assert headers == {b"host": b"a", b"accept": b"text/html, */*"}
+
+
+@pytest.mark.parametrize(
+    "headers, lifetime",
+    [
+        ({b"cache-control": b"max-age=60"}, 60),
+        ({b"cache-control": b"public, s-maxage=10, max-age=60"}, 10),
+        ({b"cache-control": b"no-cache, max-age=60"}, 0),
+        ({b"cache-control": b"no-store"}, None),
+        ({b"cache-control": b"private, max-age=60"}, None),
+        (
+            {
+                b"date": b"Sun, 06 Nov 1994 08:49:37 GMT",
+                b"expires": b"Sun, 06 Nov 1994 08:50:37 GMT",
+            },
+            60,
+        ),
+        ({b"expires": b"0"}, 0),
+        ({}, 0),
+    ],
+)
+def test_freshness_lifetime(headers, lifetime):
+    assert freshness_lifetime(headers) == lifetime
+
+
+def test_etag_matches():
+    assert etag_matches(b'"a", "b"', b'"b"')
+    assert etag_matches(b'W/"a"', b'"a"')
+    assert etag_matches(b"*", b'"a"')
+    assert not etag_matches(b'"a"', b'"b"')
+
+
+def test_store_and_serve(cache, clock):
+    assert cache.lookup(KEY, {}) is None
+    entry = cache.store(KEY, {}, response(cache_control=b"max-age=60"), 200)
+    assert cache.lookup(KEY, {}) is entry
+    assert cache.is_fresh(entry)
+
+    clock.now += 5
+    assert b"".join(cache.response(entry)) == (
+        b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\nCache-Control: max-age=60"
+        b"\r\nAge: 5\r\n\r\nhello"
+    )
+    assert cache.response(entry, head_only=True)[-1] == b"\r\nAge: 5\r\n\r\n"
+
+    clock.now += 60
+    assert not cache.is_fresh(entry)
+
+
+@pytest.mark.parametrize(
+    "raw, status",
+    [
+        (response(cache_control=b"no-store"), 200),
+        (response(cache_control=b"max-age=60", set_cookie=b"a=1"), 200),
+        (response(cache_control=b"max-age=60", vary=b"*"), 200),
+        (response(), 200),  # neither fresh nor revalidatable
+        (response(cache_control=b"max-age=60"), 500),
+        (response(b"x" * 600, cache_control=b"max-age=60"), 200),
+    ],
+)
+def test_not_stored(cache, raw, status):
+    assert cache.store(KEY, {}, raw, status) is None
+    assert len(cache) == 0
+
+
+def test_age_from_upstream(cache, clock):
+    entry = cache.store(KEY, {}, response(cache_control=b"max-age=60", age=b"50"), 200)
+    assert b"Age: 50" not in entry.head
+    clock.now += 11
+    assert not cache.is_fresh(entry)
+
+
+def test_refresh_after_not_modified(cache, clock):
+    entry = cache.store(
+        KEY, {}, response(cache_control=b"max-age=10", etag=b'"v1"'), 200
+    )
+    clock.now += 20
+    assert not cache.is_fresh(entry)
+
+    cache.refresh(entry, b"HTTP/1.1 304 Not Modified\r\n\r\n")
+    assert cache.is_fresh(entry)
+    clock.now += 11
+    assert not cache.is_fresh(entry)
+
+    cache.refresh(
+        entry, b"HTTP/1.1 304 Not Modified\r\nCache-Control: max-age=60\r\n\r\n"
+    )
+    clock.now += 30
+    assert cache.is_fresh(entry)
+
+
+def test_vary(cache):
+    gzip = {b"accept-encoding": b"gzip"}
+    plain = {}
+    entry = cache.store(
+        KEY, gzip, response(cache_control=b"max-age=60", vary=b"Accept-Encoding"), 200
+    )
+    assert cache.lookup(KEY, gzip) is entry
+    assert cache.lookup(KEY, plain) is None
+
+    other = cache.store(
+        KEY, plain, response(cache_control=b"max-age=60", vary=b"Accept-Encoding"), 200
+    )
+    assert cache.lookup(KEY, plain) is other
+    assert cache.lookup(KEY, gzip) is entry
+
+
+def test_replace(cache):
+    cache.store(KEY, {}, response(b"old", cache_control=b"max-age=60"), 200)
+    entry = cache.store(KEY, {}, response(b"new", cache_control=b"max-age=60"), 200)
+    assert cache.lookup(KEY, {}) is entry
+    assert len(cache) == 1
+    assert cache.size == entry.size
+
+
+def test_sieve_eviction(cache):
+    entries = {}
+    for name in (b"a", b"b", b"c"):
+        raw = response(name * 400, cache_control=b"max-age=60")
+        entries[name] = cache.store((None, name), {}, raw, 200)
+    # a was evicted for c
+    assert cache.lookup((None, b"a"), {}) is None
+    assert len(cache) == 2
+
+    # b was visited, so the hand passes it and evicts c
+    assert cache.lookup((None, b"b"), {}) is entries[b"b"]
+    cache.store(
+        (None, b"d"), {}, response(b"d" * 400, cache_control=b"max-age=60"), 200
+    )
+    assert cache.lookup((None, b"b"), {}) is entries[b"b"]
+    assert cache.lookup((None, b"c"), {}) is None
+    assert cache.size <= cache.max_bytes
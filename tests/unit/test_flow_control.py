@@ -0,0 +1,71 @@
+import pytest
+
+from protocol import ReverseProxy, UpStreamReaderProtocol
+
+from .conftest import FakeTransport
+
+
+@pytest.fixture
+def proxied():
+    proxy = ReverseProxy()
+    client = FakeTransport(proxy)
+    proxy.connection_made(client)
+
+    upstream_proto = UpStreamReaderProtocol()
+    upstream = FakeTransport(upstream_proto)
+    upstream_proto.connection_made(upstream)
+    proxy.attach_upstream((b"127.0.0.1", b"9999"), upstream)
+    return proxy, client, upstream
+
+
+@pytest.mark.asyncio
+async def test_client_write_buffer_limits_are_set(proxied):
+    _, client, _ = proxied
+    assert client.limits == (
+        ReverseProxy.write_buffer_high,
+        ReverseProxy.write_buffer_low,
+    )
+
+
+@pytest.mark.asyncio
+async def test_slow_client_pauses_upstream_reads(proxied):
+    proxy, _, upstream = proxied
+
+    proxy.pause_writing()
+    assert not upstream.reading
+
+    proxy.resume_writing()
+    assert upstream.reading
+
+
+@pytest.mark.asyncio
+async def test_slow_upstream_pauses_client_reads(proxied):
+    _, client, upstream = proxied
+
+    upstream.get_protocol().pause_writing()
+    assert not client.reading
+
+    upstream.get_protocol().resume_writing()
+    assert client.reading
+
+
+@pytest.mark.asyncio
+async def test_upstream_attached_to_slow_client_starts_paused(proxied):
+    proxy, _, _ = proxied
+    proxy.pause_writing()
+    proxy.release_upstream(reusable=False)
+
+    other = FakeTransport(UpStreamReaderProtocol())
+    proxy.attach_upstream((b"127.0.0.1", b"9999"), other)
+    assert not other.reading
+
+
+@pytest.mark.asyncio
+async def test_pooled_upstream_is_not_left_paused(proxied):
+    proxy, _, upstream = proxied
+    proxy.pause_writing()
+
+    proxy.release_upstream(reusable=True)
+
+    assert upstream.reading
+    assert ReverseProxy._pool.acquire((b"127.0.0.1", b"9999")) is upstream
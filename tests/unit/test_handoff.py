@@ -0,0 +1,100 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+from handoff import READY, HandoffServer, confirm, take_listener
+
+
+def test_no_running_proxy(tmp_path):
+    assert take_listener(str(tmp_path / "handoff.sock")) is None
+
+
+def test_listener_is_handed_over(tmp_path):
+    path = str(tmp_path / "handoff.sock")
+    listener = socket.create_server(("127.0.0.1", 0))
+    handed_over = threading.Event()
+    HandoffServer(path, listener, on_handoff=handed_over.set).start()
+
+    new_listener, control = take_listener(path)
+    assert new_listener.getsockname() == listener.getsockname()
+    assert new_listener.fileno() != listener.fileno()
+    # The path is free for the new process to serve handoffs on
+    assert not os.path.exists(path)
+
+    confirm(control)
+    assert handed_over.wait(5)
+    new_listener.close()
+    listener.close()
+
+
+def test_unconfirmed_handoff_keeps_serving(tmp_path):
+    path = str(tmp_path / "handoff.sock")
+    listener = socket.create_server(("127.0.0.1", 0))
+    handed_over = threading.Event()
+    HandoffServer(path, listener, on_handoff=handed_over.set).start()
+
+    new_listener, control = take_listener(path)
+    new_listener.close()
+    control.close()  # the new process died before confirming
+
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        handed_over.wait(0.01)
+    new_listener, control = take_listener(path)
+    confirm(control)
+    assert handed_over.wait(5)
+    new_listener.close()
+    listener.close()
+
+
+WORKER = """
+import socket
+import sys
+from cli import run_worker
+
+control = socket.socket(fileno=int(sys.argv[1]))
+run_worker("127.0.0.1", 0, control=control, routes_path=sys.argv[2])
+"""
+ROUTES = Path(__file__).parents[2] / "src" / "routes.yaml"
+
+
+def start_worker(tmp_path, routes_path) -> tuple[subprocess.Popen, socket.socket]:
+    control, worker_end = socket.socketpair()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", WORKER, str(worker_end.fileno()), str(routes_path)],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        cwd=tmp_path,
+        pass_fds=[worker_end.fileno()],
+        stderr=subprocess.DEVNULL,
+    )
+    worker_end.close()
+    control.settimeout(10)
+    return proc, control
+
+
+def test_worker_confirms_once_serving(tmp_path):
+    proc, control = start_worker(tmp_path, ROUTES)
+    try:
+        assert control.recv(16) == READY
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=10) == 0
+    finally:
+        control.close()
+        if proc.poll() is None:
+            proc.kill()
+
+
+def test_worker_failing_to_start_does_not_confirm(tmp_path):
+    proc, control = start_worker(tmp_path, tmp_path / "missing.yaml")
+    try:
+        assert control.recv(16) == b""
+        assert proc.wait(timeout=10) != 0
+    finally:
+        control.close()
+        if proc.poll() is None:
+            proc.kill()
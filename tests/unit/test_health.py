@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from health import HealthChecker
+from route_trie import Target
+
+
+@pytest.mark.asyncio
+async def test_consecutive_failures_eject_until_backoff():
+    health = HealthChecker(max_failures=2, base_ejection=0.02)
+    target = Target(b"127.0.0.1", b"1")
+
+    health.failure(target)
+    health.success(target)
+    health.failure(target)
+    assert target.healthy
+
+    health.failure(target)
+    assert not target.healthy
+
+    await asyncio.sleep(0.05)
+    assert target.healthy
+    # Back on probation, a single failure ejects it again for longer
+    health.failure(target)
+    assert not target.healthy
+    assert target.ejections == 2
+    health.stop()
+
+
+@pytest.mark.asyncio
+async def test_probe():
+    health = HealthChecker(timeout=0.5)
+    server = await asyncio.start_server(
+        lambda reader, writer: writer.write(b"HTTP/1.1 503 Unavailable\r\n\r\n"),
+        "127.0.0.1",
+        0,
+    )
+    port = server.sockets[0].getsockname()[1]
+    target = Target(b"127.0.0.1", str(port).encode())
+    async with server:
+        assert await health.probe(target, None)
+        assert not await health.probe(target, b"/healthz")
+    assert not await health.probe(target, None)
+
+
+@pytest.mark.asyncio
+async def test_successful_probe_readmits():
+    health = HealthChecker(interval=0.01, max_failures=1, base_ejection=60)
+    server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    target = Target(b"127.0.0.1", str(port).encode())
+    health.watch(target)
+
+    health.failure(target)
+    assert not target.healthy
+    async with server:
+        health.start()
+        await asyncio.sleep(0.1)
+        health.stop()
+    assert target.healthy
+
+
+@pytest.mark.asyncio
+async def test_probe_loop_survives_a_failing_probe(monkeypatch):
+    health = HealthChecker(interval=0.01, max_failures=1, base_ejection=60)
+    broken = Target(b"broken.test", b"80")
+    target = Target(b"127.0.0.1", b"80")
+    health.watch(broken)
+    health.watch(target)
+
+    async def probe(self, target, path):
+        if target is broken:
+            raise RuntimeError("unexpected")
+        return True
+
+    monkeypatch.setattr(HealthChecker, "probe", probe)
+    health.failure(target)
+    health.start()
+    await asyncio.sleep(0.05)
+    assert not health._prober.done()
+    health.stop()
+    assert target.healthy
+    assert not broken.healthy
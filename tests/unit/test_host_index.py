@@ -0,0 +1,41 @@
+import pytest
+
+from host_index import HostIndex
+
+
+@pytest.fixture
+def index():
+    index = HostIndex(default="default")
+    index.add(b"example.com", "example")
+    index.add(b"API.Example.com.", "api")
+    index.add(b"*.example.com", "any-example")
+    index.add(b"*.eu.example.com", "any-eu")
+    return index
+
+
+@pytest.mark.parametrize(
+    ("host", "routes"),
+    [
+        (None, "default"),
+        (b"example.com", "example"),
+        (b"example.com:8080", "example"),
+        (b"api.example.com", "api"),
+        (b"API.EXAMPLE.COM.", "api"),
+        (b"www.example.com", "any-example"),
+        (b"a.b.example.com:443", "any-example"),
+        (b"shop.eu.example.com", "any-eu"),
+        (b"eu.example.com", "any-example"),
+        (b"example.org", "default"),
+        (b"[::1]:8080", "default"),
+        (b"", "default"),
+    ],
+)
+def test_lookup(index, host, routes):
+    assert index.lookup(host) == routes
+
+
+def test_no_default():
+    index = HostIndex()
+    index.add(b"*.example.com", "any-example")
+    assert index.lookup(b"example.com") is None
+    assert index.lookup(None) is None
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from metrics import BUCKETS, COUNT, SUM, Registry, bucket_upper_bound
+
+
+@pytest.fixture
+def registry():
+    return Registry(workers=2, region_size=1024 * 1024)
+
+
+def test_buckets_are_contiguous():
+    assert bucket_upper_bound(BUCKETS - 1) == 1 << 28
+    for index in range(1, BUCKETS):
+        assert bucket_upper_bound(index) > bucket_upper_bound(index - 1)
+
+
+@pytest.mark.parametrize("us", [0, 1, 15, 16, 17, 100, 1000, 123456, 10**7])
+def test_record(registry, us):
+    histogram = registry.histogram("latency_seconds")
+    histogram.record(us * 1000 + 999)
+    words = histogram.words
+    (index,) = [i for i in range(BUCKETS) if words[i]]
+    assert bucket_upper_bound(index - 1) <= us < bucket_upper_bound(index)
+    assert words[COUNT] == 1
+    assert words[SUM] == us
+
+
+def test_record_clamps(registry):
+    histogram = registry.histogram("latency_seconds")
+    histogram.record(10**15)
+    histogram.record(-5)
+    assert histogram.words[BUCKETS - 1] == 1
+    assert histogram.words[0] == 1
+
+
+def test_same_name_same_storage(registry):
+    registry.counter("requests_total").inc()
+    registry.counter("requests_total").inc(2)
+    assert registry.collect()["requests_total"] == (0, [3])
+
+
+def test_workers_are_summed(registry):
+    registry.counter('requests_total{route="/"}').inc()
+    registry.histogram("latency_seconds").record(20_000)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            registry.attach(1)
+            registry.counter('requests_total{route="/"}').inc(5)
+            registry.histogram("latency_seconds").record(3_000_000)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    text = registry.render().decode()
+    assert '# TYPE requests_total counter\nrequests_total{route="/"} 6\n' in text
+    assert "# TYPE latency_seconds histogram\n" in text
+    assert 'latency_seconds_bucket{le="1.6e-05"} 0\n' in text
+    assert 'latency_seconds_bucket{le="3.2e-05"} 1\n' in text
+    assert 'latency_seconds_bucket{le="0.004096"} 2\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2\n' in text
+    assert "latency_seconds_sum 0.00302\n" in text
+    assert "latency_seconds_count 2\n" in text
+
+
+def test_render_keeps_every_digit(registry):
+    registry.histogram("latency_seconds").record(1_234_567_000)
+    text = registry.render().decode()
+    # Seconds with microsecond precision need more than six digits
+    assert 'latency_seconds_bucket{le="16.777216"} 1\n' in text
+    assert "latency_seconds_sum 1.234567\n" in text
+
+
+def test_restarted_worker_keeps_counting(registry):
+    registry.attach(1)
+    registry.counter("requests_total").inc(4)
+    registry.attach(1)
+    registry.counter("requests_total").inc()
+    assert registry.collect()["requests_total"] == (0, [5])
+
+
+def test_full_region():
+    registry = Registry(workers=1, region_size=300 * 1024)
+    histograms = [registry.histogram(f"h{i}") for i in range(200)]
+    # Still recordable, just not exported
+    histograms[-1].record(1000)
+    assert len(registry.collect()) < 200
+
+
+def test_groups_built_outside_the_routes_file_export_nothing(tmp_path):
+    from balancer import make_group
+    from metrics import registry
+    from route_trie import Target
+    from static import StaticFiles
+
+    before = set(registry.collect())
+    group = make_group([Target(b"127.0.0.1", b"80"), Target(b"127.0.0.1", b"81")])
+    files = StaticFiles(tmp_path)
+    assert group.metrics is None and files.metrics is None
+    assert set(registry.collect()) == before
+
+
+def test_registry_is_sized_for_the_routes(tmp_path):
+    import yaml
+
+    from config import count_routes, load_routes
+    from metrics import MAX_SERIES, RouteMetrics, capacity, registry
+
+    routes = {
+        f"/r{i}/": {"host": "127.0.0.1", "port": 8000 + i % 50} for i in range(500)
+    }
+    path = tmp_path / "routes.yaml"
+    path.write_text(yaml.safe_dump({"routes": routes}))
+    assert count_routes(path) == (500, 50)
+    # More than the default registry holds
+    assert 500 * (RouteMetrics.HISTOGRAMS + RouteMetrics.COUNTERS) > MAX_SERIES
+
+    registry.share(1, *capacity(*count_routes(path)))
+    try:
+        load_routes(path)
+        names = registry.collect()
+        assert 'proxy_shed_total{route="/r499/",vhost=""}' in names
+        assert 'proxy_upstream_errors_total{upstream="127.0.0.1:8049"}' in names
+        assert not registry._full
+    finally:
+        registry.share(1)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from pool import UpstreamPool
+
+from .conftest import FakeTransport
+
+KEY_A = (b"a.local", b"80")
+KEY_B = (b"b.local", b"80")
+
+
+@pytest.mark.asyncio
+async def test_acquire_returns_most_recently_released():
+    pool = UpstreamPool()
+    first, second = FakeTransport(), FakeTransport()
+    pool.release(KEY_A, first)
+    pool.release(KEY_A, second)
+
+    assert pool.acquire(KEY_A) is second
+    assert pool.acquire(KEY_A) is first
+    assert pool.acquire(KEY_A) is None
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_acquire_skips_closed_transports():
+    pool = UpstreamPool()
+    dead, alive = FakeTransport(), FakeTransport()
+    pool.release(KEY_A, alive)
+    pool.release(KEY_A, dead)
+    dead.close()
+
+    assert pool.acquire(KEY_A) is alive
+    assert len(pool) == 0
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_max_per_host_evicts_oldest_of_host():
+    pool = UpstreamPool(max_per_host=2)
+    transports = [FakeTransport() for _ in range(3)]
+    for transport in transports:
+        pool.release(KEY_A, transport)
+
+    assert transports[0].closed
+    assert len(pool) == 2
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_max_idle_evicts_least_recently_released():
+    pool = UpstreamPool(max_idle=2)
+    a, b, c = FakeTransport(), FakeTransport(), FakeTransport()
+    pool.release(KEY_A, a)
+    pool.release(KEY_B, b)
+    pool.release(KEY_B, c)
+
+    assert a.closed
+    assert pool.acquire(KEY_A) is None
+    assert pool.acquire(KEY_B) is c
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_timeout_closes_transports():
+    pool = UpstreamPool(idle_timeout=0.02)
+    transport = FakeTransport()
+    pool.release(KEY_A, transport)
+
+    await asyncio.sleep(0.05)
+
+    assert transport.closed
+    assert len(pool) == 0
@@ -0,0 +1,106 @@
+import asyncio
+import socket
+
+import pytest
+
+from resolver import Resolver, connect
+from route_trie import Target
+
+
+def test_resolve_now_returns_family_and_sockaddr():
+    resolver = Resolver()
+    addrs = resolver.resolve_now("127.0.0.1", 8080)
+    assert addrs == ((socket.AF_INET, ("127.0.0.1", 8080)),)
+
+
+def test_every_address_is_kept(monkeypatch):
+    infos = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("fe80::1%eth0", 80, 0, 2)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 80)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.2", 80)),
+    ]
+    monkeypatch.setattr(socket, "getaddrinfo", lambda *args, **kwargs: infos)
+    assert Resolver().resolve_now("backend.test", 80) == (
+        (socket.AF_INET6, ("fe80::1%eth0", 80, 0, 2)),
+        (socket.AF_INET, ("10.0.0.1", 80)),
+        (socket.AF_INET, ("10.0.0.2", 80)),
+    )
+
+
+@pytest.mark.asyncio
+async def test_resolve_is_served_from_cache(monkeypatch):
+    resolver = Resolver()
+    addrs = resolver.resolve_now("localhost", 8080)
+
+    async def fail(self, host, port):
+        raise AssertionError("should not resolve again")
+
+    monkeypatch.setattr(Resolver, "_lookup", fail)
+    assert await resolver.resolve("localhost", 8080) == addrs
+
+
+@pytest.mark.asyncio
+async def test_only_hostname_targets_are_refreshed():
+    resolver = Resolver(ttl=0.01)
+    literal = Target(b"127.0.0.1", b"80")
+    hostname = Target(b"localhost", b"80")
+    resolver.watch(literal)
+    resolver.watch(hostname)
+
+    resolver.start()
+    await asyncio.sleep(0.05)
+    resolver.stop()
+
+    assert literal.addrs is None
+    assert hostname.addrs
+    assert all(sockaddr[1] == 80 for _, sockaddr in hostname.addrs)
+
+
+@pytest.mark.asyncio
+async def test_refresh_survives_watch_and_failing_lookups(monkeypatch):
+    resolver = Resolver(ttl=0.01)
+    first = Target(b"first.test", b"80")
+    second = Target(b"second.test", b"80")
+    added = Target(b"added.test", b"80")
+    resolver.watch(first)
+    resolver.watch(second)
+
+    async def lookup(self, host, port):
+        if host == "first.test":
+            # Watched while the refresh is iterating
+            self.watch(added)
+            raise ValueError("unexpected")
+        return (host, port)
+
+    monkeypatch.setattr(Resolver, "_lookup", lookup)
+    resolver.start()
+    await asyncio.sleep(0.05)
+    assert not resolver._refresher.done()
+    resolver.stop()
+
+    assert first.addrs is None
+    assert second.addrs == ("second.test", 80)
+    assert added.addrs == ("added.test", 80)
+
+
+@pytest.mark.asyncio
+async def test_connect_falls_back_to_the_next_address():
+    server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    refused = socket.socket()
+    refused.bind(("127.0.0.1", 0))  # bound but not listening
+    try:
+        sock = await connect(
+            [
+                (socket.AF_INET, refused.getsockname()),
+                (socket.AF_INET, ("127.0.0.1", port)),
+            ]
+        )
+        assert sock.getpeername() == ("127.0.0.1", port)
+        sock.close()
+        with pytest.raises(ConnectionRefusedError):
+            await connect([(socket.AF_INET, refused.getsockname())])
+    finally:
+        refused.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,143 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+from httptools import HttpParserUpgrade
+
+from config import load_routes
+from pool import UpstreamPool
+from protocol import TUNNEL, ReverseProxy, UpStreamReaderProtocol
+
+from .conftest import FakeTransport
+
+
+@pytest.fixture
+def proxy():
+    proxy = ReverseProxy()
+    proxy.connection_made(FakeTransport(peername=("10.0.0.2", 51000)))
+    return proxy
+
+
+def rewrite(proxy: ReverseProxy, head: bytes) -> bytes:
+    proxy._ReverseProxy__parsed = head
+    proxy.req_parser.feed_data(head)
+    proxy._ReverseProxy__parsed = None
+    return b"".join(proxy.outgoing_head(head))
+
+
+def test_adds_forwarded_for_and_via(proxy):
+    head = b"GET /a HTTP/1.1\r\nHost: a.test\r\n\r\n"
+    assert rewrite(proxy, head) == (
+        b"GET /a HTTP/1.1\r\nHost: a.test\r\n"
+        b"X-Forwarded-For: 10.0.0.2\r\nVia: 1.1 py-reverse-proxy\r\n\r\n"
+    )
+
+
+def test_strips_the_route_prefix(proxy):
+    proxy.strip_len = 4
+    head = b"GET /api/users?id=1 HTTP/1.0\r\nHost: a.test\r\n\r\n"
+    assert rewrite(proxy, head).startswith(
+        b"GET /users?id=1 HTTP/1.0\r\nHost: a.test\r\n"
+    )
+    assert rewrite(proxy, head).endswith(b"Via: 1.0 py-reverse-proxy\r\n\r\n")
+
+
+def test_drops_hop_by_hop_headers(proxy):
+    head = (
+        b"GET / HTTP/1.1\r\nConnection: keep-alive, X-Trace\r\nHost: a.test\r\n"
+        b"x-trace: 1\r\nKeep-Alive: timeout=5\r\nAccept: */*\r\nTE: trailers\r\n\r\n"
+    )
+    assert rewrite(proxy, head) == (
+        b"GET / HTTP/1.1\r\nHost: a.test\r\nAccept: */*\r\n"
+        b"X-Forwarded-For: 10.0.0.2\r\nVia: 1.1 py-reverse-proxy\r\n\r\n"
+    )
+
+
+def test_appends_to_forwarded_for(proxy):
+    head = (
+        b"GET / HTTP/1.1\r\nX-Forwarded-For: 1.2.3.4\r\nHost: a.test\r\n"
+        b"x-forwarded-for: 5.6.7.8\r\n\r\n"
+    )
+    assert rewrite(proxy, head) == (
+        b"GET / HTTP/1.1\r\nHost: a.test\r\n"
+        b"X-Forwarded-For: 1.2.3.4, 5.6.7.8, 10.0.0.2\r\n"
+        b"Via: 1.1 py-reverse-proxy\r\n\r\n"
+    )
+
+
+def test_upgrade_keeps_its_headers(proxy):
+    head = (
+        b"GET /ws HTTP/1.1\r\nHost: a.test\r\nConnection: Upgrade\r\n"
+        b"Upgrade: websocket\r\nKeep-Alive: 5\r\n\r\n"
+    )
+    proxy._ReverseProxy__parsed = head
+    with pytest.raises(HttpParserUpgrade):
+        proxy.req_parser.feed_data(head)
+    proxy.body_remaining = TUNNEL
+    assert b"".join(proxy.outgoing_head(head)) == (
+        b"GET /ws HTTP/1.1\r\nHost: a.test\r\nConnection: Upgrade\r\n"
+        b"Upgrade: websocket\r\n"
+        b"X-Forwarded-For: 10.0.0.2\r\nVia: 1.1 py-reverse-proxy\r\n\r\n"
+    )
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """An upstream connection of the only route, ``/a/``."""
+    path = tmp_path / "routes.yaml"
+    path.write_text("routes:\n  /a/:\n    host: 127.0.0.1\n    port: 9999\n")
+    monkeypatch.setattr(ReverseProxy, "_routes", load_routes(path), raising=False)
+    monkeypatch.setattr(ReverseProxy, "_pool", UpstreamPool())
+    return FakeTransport(UpStreamReaderProtocol())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "target", [b"/a/abs?q=1", b"http://x/a/abs?q=1", b"http://u@x:80/a/abs?q=1"]
+)
+async def test_upstream_gets_the_origin_form_without_prefix(proxy, upstream, target):
+    ReverseProxy._pool.release((b"127.0.0.1", b"9999"), upstream)
+    proxy.data_received(b"GET %s HTTP/1.1\r\nHost: x\r\n\r\n" % target)
+    assert upstream.written.startswith(b"GET /abs?q=1 HTTP/1.1\r\nHost: x\r\n")
+    proxy.connection_lost()
+
+
+PIPELINED = (
+    b"POST /a/x HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+    b"3\r\nabc\r\n0\r\n\r\n"
+    b"GET /a/y HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 6.6.6.6\r\n\r\n"
+)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("split", [len(PIPELINED), 72, 71, 70, 69, 60])
+async def test_request_pipelined_after_a_chunked_body_is_rewritten(
+    proxy, upstream, split
+):
+    upstream.get_protocol().connection_made(upstream)
+    ReverseProxy._pool.release((b"127.0.0.1", b"9999"), upstream)
+    proxy.data_received(PIPELINED[:split])
+    proxy.data_received(PIPELINED[split:])
+    assert upstream.written == (
+        b"POST /x HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n"
+        b"X-Forwarded-For: 10.0.0.2\r\nVia: 1.1 py-reverse-proxy\r\n\r\n"
+        b"3\r\nabc\r\n0\r\n\r\n"
+    )
+    upstream.written.clear()
+    upstream.get_protocol().data_received(
+        b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"
+    )
+    assert upstream.written == (
+        b"GET /y HTTP/1.1\r\nHost: x\r\n"
+        b"X-Forwarded-For: 6.6.6.6, 10.0.0.2\r\nVia: 1.1 py-reverse-proxy\r\n\r\n"
+    )
+    proxy.connection_lost()
+
+
+def test_debug_records_are_skipped_when_disabled(proxy, monkeypatch):
+    logger = Mock(isEnabledFor=Mock(return_value=False))
+    monkeypatch.setattr(ReverseProxy, "logger", logger)
+    proxy.connection_made(FakeTransport(peername=("10.0.0.2", 51000)))
+    rewrite(proxy, b"GET /a HTTP/1.1\r\nHost: a.test\r\n\r\n")
+    logger.isEnabledFor.assert_called_with(logging.DEBUG)
+    logger.debug.assert_not_called()
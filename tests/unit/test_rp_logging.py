@@ -0,0 +1,14 @@
+import logging
+import queue
+
+from metrics import registry
+from rp_logging import DroppingQueueHandler
+
+
+def test_full_queue_drops_and_counts():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = registry.collect().get("proxy_log_dropped_total", (0, [0]))[1][0]
+    for i in range(3):
+        handler.emit(logging.makeLogRecord({"msg": f"record {i}"}))
+    assert handler.queue.qsize() == 1
+    assert registry.collect()["proxy_log_dropped_total"] == (0, [before + 2])
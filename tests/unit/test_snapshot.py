@@ -0,0 +1,158 @@
+import json
+import os
+import struct
+
+import pytest
+
+from config import load_routes
+from resolver import Resolver
+from route_table import EDGE, read_layout
+from snapshot import HEADER, compile_snapshot, load_snapshot
+
+ROUTES = """
+routes:
+  /:
+    host: 127.0.0.1
+    port: 8000
+  /api/:
+    host: 127.0.0.1
+    port: 8001
+  /t/:tenant/files/*:
+    balance: weighted
+    health_check: /healthz
+    upstreams:
+      - host: 127.0.0.1
+        port: 8002
+        weight: 3
+      - host: 127.0.0.1
+        port: 8003
+
+hosts:
+  "*.example.com":
+    /api/:
+      host: 127.0.0.1
+      port: 9001
+"""
+
+REQUESTS = [
+    (None, b"/"),
+    (None, b"/api/users"),
+    (None, b"/t/42/files/a/b"),
+    (b"shop.example.com", b"/api/users"),
+    (b"shop.example.com", b"/"),
+]
+
+
+def describe(index, host, path):
+    routes = index.lookup(host)
+    match = routes.match(path) if routes is not None else None
+    if match is None:
+        return None
+    prefix_len, group = match
+    return prefix_len, [(t.host, t.port, t.weight) for t in group.targets]
+
+
+@pytest.fixture
+def routes_file(tmp_path):
+    path = tmp_path / "routes.yaml"
+    path.write_text(ROUTES)
+    return path
+
+
+def test_snapshot_matches_yaml(routes_file):
+    from_yaml = load_routes(routes_file)
+    compile_snapshot(routes_file, routes_file.with_suffix(".snapshot"))
+    from_snapshot = load_snapshot(routes_file.with_suffix(".snapshot"), Resolver())
+
+    for host, path in REQUESTS:
+        assert describe(from_snapshot, host, path) == describe(from_yaml, host, path)
+    assert len(from_snapshot.upstreams) == len(from_yaml.upstreams)
+    assert b"/healthz" in [check for _, check in from_snapshot.upstreams]
+
+
+def test_load_routes_prefers_fresh_snapshot(routes_file, monkeypatch):
+    snapshot_path = routes_file.with_suffix(".snapshot")
+    compile_snapshot(routes_file, snapshot_path)
+
+    loaded = []
+    import snapshot
+
+    real_load = snapshot.load_snapshot
+    monkeypatch.setattr(
+        snapshot,
+        "load_snapshot",
+        lambda path, resolver: loaded.append(path) or real_load(path, resolver),
+    )
+    load_routes(routes_file)
+    assert loaded == [snapshot_path]
+
+    # The YAML file changed after the snapshot was compiled
+    stat = snapshot_path.stat()
+    os.utime(routes_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    load_routes(routes_file)
+    assert loaded == [snapshot_path]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "routes.snapshot"
+    path.write_bytes(b"not a snapshot at all")
+    with pytest.raises(ValueError):
+        load_snapshot(path, Resolver())
+
+
+@pytest.mark.parametrize("keep", [HEADER.size, 100, -8])
+def test_load_routes_falls_back_to_yaml_on_corrupt_snapshot(routes_file, keep):
+    expected = load_routes(routes_file)
+    snapshot_path = routes_file.with_suffix(".snapshot")
+    compile_snapshot(routes_file, snapshot_path)
+    # Truncated, yet newer than the YAML file
+    snapshot_path.write_bytes(snapshot_path.read_bytes()[:keep])
+    with pytest.raises(ValueError):
+        load_snapshot(snapshot_path, Resolver())
+
+    loaded = load_routes(routes_file)
+    for host, path in REQUESTS:
+        assert describe(loaded, host, path) == describe(expected, host, path)
+
+
+def edge_field(index: int):
+    """Corrupts a field of the first used edge slot."""
+
+    def corrupt(table, spec):
+        for slot in range(spec.slots):
+            at = spec.edges + slot * EDGE.size
+            fields = list(EDGE.unpack_from(table, at))
+            if fields[1] >= 0:
+                fields[index] = 1 << 20
+                EDGE.pack_into(table, at, *fields)
+                return
+
+    return corrupt
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda table, spec: struct.pack_into("=I", table, 4, 1 << 20),  # slots
+        lambda table, spec: struct.pack_into("=I", table, 4, 3),
+        lambda table, spec: struct.pack_into("=i", table, spec.targets, 99),
+        lambda table, spec: struct.pack_into("=i", table, spec.params, 1 << 20),
+        lambda table, spec: struct.pack_into("=i", table, spec.wildcards, -2),
+        edge_field(2),  # child
+        edge_field(3),  # offset into the segments
+        edge_field(4),  # length
+    ],
+)
+def test_rejects_out_of_range_tables(routes_file, corrupt):
+    snapshot_path = routes_file.with_suffix(".snapshot")
+    compile_snapshot(routes_file, snapshot_path)
+    data = bytearray(snapshot_path.read_bytes())
+    meta_len = HEADER.unpack_from(data)[3]
+    entry = json.loads(data[HEADER.size : HEADER.size + meta_len])["tables"][0]
+    start = ((HEADER.size + meta_len + 7) & ~7) + entry["offset"]
+    table = memoryview(data)[start : start + entry["length"]]
+    corrupt(table, read_layout(table))
+    table.release()
+    snapshot_path.write_bytes(data)
+    with pytest.raises(ValueError):
+        load_snapshot(snapshot_path, Resolver())
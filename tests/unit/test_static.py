@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from static import StaticFiles
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "app.js").write_bytes(b"0123456789")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "index.html").write_bytes(b"<h1>docs</h1>")
+    return StaticFiles(tmp_path)
+
+
+def respond(files, path, method=b"GET", **headers):
+    headers = {
+        name.replace("_", "-").encode(): value for name, value in headers.items()
+    }
+    head, file, offset, count = files.respond(method, path, headers, True)
+    body = os.pread(file.fd, count, offset) if file is not None else b""
+    if file is not None:
+        file.release()
+    return head, body
+
+
+def test_file(files):
+    head, body = respond(files, b"/app.js")
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Type: text/javascript\r\n" in head
+    assert b"Content-Length: 10\r\n" in head
+    assert b"ETag: " in head
+    assert b"Last-Modified: " in head
+    assert body == b"0123456789"
+
+
+def test_head_request(files):
+    head, body = respond(files, b"/app.js", method=b"HEAD")
+    assert b"Content-Length: 10\r\n" in head
+    assert body == b""
+
+
+def test_directory_index(files):
+    head, body = respond(files, b"/docs/")
+    assert b"Content-Type: text/html\r\n" in head
+    assert body == b"<h1>docs</h1>"
+
+
+@pytest.mark.parametrize(
+    "path", [b"/missing.js", b"/../etc/passwd", b"/%2e%2e/etc/passwd", b"/a%00.js"]
+)
+def test_not_found(files, path):
+    head, _ = respond(files, path)
+    assert head.startswith(b"HTTP/1.1 404 Not Found\r\n")
+
+
+def test_method_not_allowed(files):
+    head, _ = respond(files, b"/app.js", method=b"POST")
+    assert head.startswith(b"HTTP/1.1 405 Method Not Allowed\r\n")
+    assert b"Allow: GET, HEAD\r\n" in head
+
+
+def test_conditional(files):
+    head, _ = respond(files, b"/app.js")
+    etag = head.split(b"ETag: ")[1].split(b"\r\n")[0]
+    last_modified = head.split(b"Last-Modified: ")[1].split(b"\r\n")[0]
+
+    head, body = respond(files, b"/app.js", if_none_match=etag)
+    assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+    assert body == b""
+    head, _ = respond(files, b"/app.js", if_none_match=b'"other"')
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    head, _ = respond(files, b"/app.js", if_modified_since=last_modified)
+    assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+
+
+@pytest.mark.parametrize(
+    "byte_range, content_range, expected",
+    [
+        (b"bytes=2-4", b"bytes 2-4/10", b"234"),
+        (b"bytes=7-", b"bytes 7-9/10", b"789"),
+        (b"bytes=-3", b"bytes 7-9/10", b"789"),
+        (b"bytes=5-100", b"bytes 5-9/10", b"56789"),
+    ],
+)
+def test_range(files, byte_range, content_range, expected):
+    head, body = respond(files, b"/app.js", range=byte_range)
+    assert head.startswith(b"HTTP/1.1 206 Partial Content\r\n")
+    assert b"Content-Range: " + content_range + b"\r\n" in head
+    assert body == expected
+
+
+def test_range_ignored(files):
+    for byte_range in (b"bytes=0-1,4-5", b"items=0-1", b"bytes=x-y"):
+        head, body = respond(files, b"/app.js", range=byte_range)
+        assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    head, body = respond(files, b"/app.js", range=b"bytes=0-1", if_range=b'"stale"')
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert body == b"0123456789"
+
+
+def test_range_not_satisfiable(files):
+    head, _ = respond(files, b"/app.js", range=b"bytes=10-")
+    assert head.startswith(b"HTTP/1.1 416 Range Not Satisfiable\r\n")
+    assert b"Content-Range: bytes */10\r\n" in head
+
+
+def test_open_files_are_reused(files, tmp_path):
+    first = files.open(files.resolve(b"/app.js"))
+    assert files.open(files.resolve(b"/app.js")) is first
+
+    (tmp_path / "app.js").write_bytes(b"changed")
+    files.check_interval = 0
+    file = files.open(files.resolve(b"/app.js"))
+    assert file is not first
+    assert first.fd == -1
+    assert file.size == 7
+
+
+def test_open_files_are_bounded(files, tmp_path):
+    files.max_open_files = 2
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(name.encode())
+    first = files.open(files.resolve(b"/a"))
+    # A file still being sent stays open after it is evicted
+    first.users += 1
+    files.open(files.resolve(b"/b"))
+    files.open(files.resolve(b"/c"))
+    assert len(files._files) == 2
+    assert first.evicted
+    assert os.pread(first.fd, 1, 0) == b"a"
+    first.release()
+    assert first.fd == -1
@@ -0,0 +1,84 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from psutil import Process, pid_exists
+
+SUPERVISOR = """
+import time
+from supervisor import Supervisor
+
+Supervisor(lambda: time.sleep(60), workers=2, restart_delay=0).run()
+"""
+
+
+def wait_for_workers(pid: int, count: int, exclude=(), timeout=5.0) -> list[int]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        workers = [
+            child.pid
+            for child in Process(pid).children()
+            if child.pid not in exclude and child.status() != "zombie"
+        ]
+        if len(workers) == count:
+            return workers
+        time.sleep(0.05)
+    raise AssertionError(f"expected {count} workers of {pid}")
+
+
+def test_restarts_dead_workers_and_stops_on_sigterm():
+    proc = subprocess.Popen(
+        [sys.executable, "-c", SUPERVISOR],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    try:
+        first, second = wait_for_workers(proc.pid, 2)
+
+        os.kill(first, signal.SIGKILL)
+        (replacement,) = wait_for_workers(proc.pid, 1, exclude=(first, second))
+        assert replacement != first
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=5) == 0
+        assert not pid_exists(second)
+        assert not pid_exists(replacement)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+
+ON_START = """
+import os
+import threading
+import time
+from supervisor import Supervisor
+
+def worker():
+    os.write(1, b"%d\\n" % threading.active_count())
+    time.sleep(60)
+
+def on_start():
+    threading.Thread(target=time.sleep, args=(60,), daemon=True).start()
+    os.write(1, b"started\\n")
+
+Supervisor(worker, workers=2, on_start=on_start).run()
+"""
+
+
+def test_workers_are_forked_before_on_start():
+    proc = subprocess.Popen(
+        [sys.executable, "-c", ON_START],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        stdout=subprocess.PIPE,
+    )
+    try:
+        lines = sorted(proc.stdout.readline().strip() for _ in range(3))
+        # Workers only have their main thread
+        assert lines == [b"1", b"1", b"started"]
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=5) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
@@ -0,0 +1,128 @@
+import pytest
+
+from timer_wheel import Timer, TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def wheel(clock):
+    return TimerWheel(resolution=1.0, slots=8, clock=clock)
+
+
+def advance(wheel: TimerWheel, now: float) -> None:
+    wheel._clock.now = now
+    wheel.advance()
+
+
+def fired_timer(fired: list, name: str) -> Timer:
+    return Timer(lambda: fired.append(name))
+
+
+def test_fires_after_deadline_never_before(wheel):
+    fired = []
+    timer = fired_timer(fired, "a")
+    wheel.schedule(timer, 2.5)
+    assert len(wheel) == 1
+    advance(wheel, 102.4)
+    assert fired == []
+    advance(wheel, 103.0)
+    assert fired == ["a"]
+    assert len(wheel) == 0
+    assert timer.tick == -1
+
+
+def test_cancel(wheel):
+    fired = []
+    timer = fired_timer(fired, "a")
+    wheel.schedule(timer, 1)
+    wheel.cancel(timer)
+    wheel.cancel(timer)
+    advance(wheel, 110.0)
+    assert fired == []
+    assert len(wheel) == 0
+
+
+def test_pushed_back_deadline_stays_in_its_slot(wheel):
+    fired = []
+    timer = fired_timer(fired, "a")
+    wheel.schedule(timer, 1)
+    tick = timer.tick
+    wheel.schedule(timer, 5)
+    assert timer.tick == tick
+    advance(wheel, 104.9)
+    assert fired == []
+    # At most a tick late
+    advance(wheel, 106.0)
+    assert fired == ["a"]
+
+
+def test_earlier_deadline_moves(wheel):
+    fired = []
+    timer = fired_timer(fired, "a")
+    wheel.schedule(timer, 5)
+    wheel.schedule(timer, 1)
+    advance(wheel, 102.0)
+    assert fired == ["a"]
+
+
+def test_deadline_beyond_a_turn(wheel):
+    fired = []
+    wheel.schedule(fired_timer(fired, "a"), 20)
+    for second in range(101, 120):
+        advance(wheel, float(second))
+    assert fired == []
+    advance(wheel, 121.0)
+    assert fired == ["a"]
+
+
+def test_callback_can_reschedule_and_cancel(wheel):
+    fired = []
+    b = fired_timer(fired, "b")
+
+    def first():
+        fired.append("a")
+        wheel.cancel(b)
+        wheel.schedule(a, 1)
+
+    a = Timer(first)
+    wheel.schedule(a, 1)
+    wheel.schedule(b, 2)
+    advance(wheel, 102.0)
+    assert fired == ["a"]
+    advance(wheel, 110.0)
+    assert fired == ["a", "a"]
+
+
+def test_slots_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        TimerWheel(slots=100)
+
+
+@pytest.mark.asyncio
+async def test_start_counts_deadlines_from_the_clock_now(wheel):
+    fired = []
+    pending = fired_timer(fired, "pending")
+    wheel.schedule(pending, 1)
+    # A slow startup between building the wheel and running the loop
+    wheel._clock.now = 103.0
+    wheel.start()
+    try:
+        wheel.schedule(fired_timer(fired, "a"), 2)
+        advance(wheel, 104.0)
+        assert fired == ["pending"]
+        advance(wheel, 106.0)
+        assert fired == ["pending", "a"]
+    finally:
+        wheel.stop()
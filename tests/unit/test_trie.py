@@ -1,3 +1,8 @@
+import pytest
+
+from route_trie import RouteTrie, Target
+
+
 def test_root_match(trie):
     key, target = trie.match(b"/")
     assert key == b"/"
@@ -52,3 +57,94 @@ def test_empty_path(trie):
     assert key == b"/"
     assert target.host == b"default.local"
     assert target.port == b"80"
+
+
+@pytest.mark.parametrize(
+    ("path", "prefix", "host"),
+    [
+        (b"/", b"", b"default.local"),
+        (b"", b"", b"default.local"),
+        (b"/api", b"/api", b"api.local"),
+        (b"/api/", b"/api", b"api.local"),
+        (b"/apix", b"", b"default.local"),
+        (b"/api/v1/resource", b"/api/v1", b"apiv1.local"),
+        (b"//api//v1//", b"//api//v1", b"apiv1.local"),
+        (b"/static/css", b"", b"default.local"),
+        (b"/static/assets/css/style.css", b"/static/assets", b"static.local"),
+    ],
+)
+def test_compiled_match(compiled, path, prefix, host):
+    prefix_len, target = compiled.match(path)
+    assert path[:prefix_len] == prefix
+    assert target.host == host
+
+
+def test_compiled_without_root_route():
+    trie = RouteTrie()
+    trie.insert(b"/api", Target(host=b"api.local", port=b"8080"))
+    compiled = trie.compile()
+    assert compiled.match(b"/") is None
+    assert compiled.match(b"/static") is None
+    assert compiled.match(b"/api/x")[0] == 4
+
+
+def test_compiled_large_table():
+    trie = RouteTrie()
+    for i in range(5000):
+        trie.insert(b"/svc%d/v%d" % (i, i % 7), Target(host=b"%d" % i, port=b"80"))
+    compiled = trie.compile()
+    for i in range(5000):
+        prefix = b"/svc%d/v%d" % (i, i % 7)
+        assert compiled.match(prefix + b"/items") == (
+            len(prefix),
+            compiled.match(prefix)[1],
+        )
+        assert compiled.match(prefix)[1].host == b"%d" % i
+
+
+@pytest.fixture
+def patterns():
+    trie = RouteTrie()
+    trie.insert(b"/t/:tenant/api", Target(host=b"tenant-api.local", port=b"80"))
+    trie.insert(b"/t/admin/api", Target(host=b"admin-api.local", port=b"80"))
+    trie.insert(b"/t/:tenant/files/*", Target(host=b"files.local", port=b"80"))
+    trie.insert(b"/t/:tenant/files/public", Target(host=b"public.local", port=b"80"))
+    trie.insert(b"/static/*", Target(host=b"static.local", port=b"80"))
+    return trie
+
+
+@pytest.mark.parametrize(
+    ("path", "prefix", "host"),
+    [
+        (b"/t/42/api", b"/t/42/api", b"tenant-api.local"),
+        (b"/t/42/api/users", b"/t/42/api", b"tenant-api.local"),
+        # literal beats parameter
+        (b"/t/admin/api/users", b"/t/admin/api", b"admin-api.local"),
+        # literal beats wildcard, the wildcard takes the rest
+        (b"/t/7/files/public", b"/t/7/files/public", b"public.local"),
+        (b"/t/7/files/a/b.txt", b"/t/7/files", b"files.local"),
+        (b"/t/7/files/public/x", b"/t/7/files/public", b"public.local"),
+        (b"/static/css/site.css", b"/static", b"static.local"),
+    ],
+)
+def test_pattern_match(patterns, path, prefix, host):
+    key, target = patterns.match(path)
+    assert key == prefix
+    assert target.host == host
+
+    prefix_len, target = patterns.compile().match(path)
+    assert path[:prefix_len] == prefix
+    assert target.host == host
+
+
+@pytest.mark.parametrize(
+    "path", [b"/t/42", b"/t/admin/files/x", b"/static", b"/t/7/files"]
+)
+def test_pattern_no_match(patterns, path):
+    assert patterns.match(path) is None
+    assert patterns.compile().match(path) is None
+
+
+def test_wildcard_must_be_last():
+    with pytest.raises(ValueError):
+        RouteTrie().insert(b"/a/*/b", Target(host=b"a.local", port=b"80"))
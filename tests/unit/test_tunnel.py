@@ -0,0 +1,65 @@
+import asyncio
+import socket
+
+import pytest
+
+from tunnel import SPLICE_SUPPORTED, SpliceTunnel
+
+pytestmark = pytest.mark.skipif(not SPLICE_SUPPORTED, reason="needs os.splice")
+
+
+async def recv_all(loop, sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = await loop.sock_recv(sock, size - len(data))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+@pytest.fixture
+def tunnel_pair():
+    client, client_side = socket.socketpair()
+    upstream, upstream_side = socket.socketpair()
+    for sock in (client, client_side, upstream, upstream_side):
+        sock.setblocking(False)
+    yield client, client_side, upstream, upstream_side
+    for sock in (client, upstream):
+        sock.close()
+
+
+@pytest.mark.asyncio
+async def test_relays_both_directions(tunnel_pair):
+    loop = asyncio.get_running_loop()
+    client, client_side, upstream, upstream_side = tunnel_pair
+    tunnel = SpliceTunnel(loop, client_side, upstream_side)
+    tunnel.start()
+
+    payload = b"x" * 3_000_000
+    send = loop.create_task(loop.sock_sendall(client, payload))
+    assert await recv_all(loop, upstream, len(payload)) == payload
+    await send
+
+    await loop.sock_sendall(upstream, b"response")
+    assert await recv_all(loop, client, 8) == b"response"
+    tunnel.close()
+
+
+@pytest.mark.asyncio
+async def test_eof_is_propagated_and_closes(tunnel_pair):
+    loop = asyncio.get_running_loop()
+    client, client_side, upstream, upstream_side = tunnel_pair
+    tunnel = SpliceTunnel(loop, client_side, upstream_side)
+    tunnel.start()
+
+    await loop.sock_sendall(client, b"request")
+    client.shutdown(socket.SHUT_WR)
+    assert await recv_all(loop, upstream, 100) == b"request"
+
+    await loop.sock_sendall(upstream, b"response")
+    upstream.shutdown(socket.SHUT_WR)
+    assert await recv_all(loop, client, 100) == b"response"
+
+    await asyncio.sleep(0.01)
+    assert tunnel.closed
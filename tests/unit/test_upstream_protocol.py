@@ -0,0 +1,94 @@
+import pytest
+
+from protocol import UpStreamReaderProtocol
+
+from .conftest import FakeTransport
+
+
+class FakeProxy:
+    def __init__(self):
+        self.written = bytearray()
+        self.completed: list[bool] = []
+        self.statuses: list[int] = []
+        self.eof = False
+        self.fill = None
+        self.sent = 0
+
+    def write(self, data):
+        self.written.extend(data)
+
+    def upstream_response_complete(self, keep_alive, status):
+        self.completed.append(keep_alive)
+        self.statuses.append(status)
+
+    def upstream_done(self):
+        self.eof = True
+
+
+@pytest.fixture
+def upstream():
+    def make(head_request=False):
+        proto = UpStreamReaderProtocol()
+        proto.connection_made(FakeTransport())
+        proto.proxy = FakeProxy()
+        proto.head_request = head_request
+        return proto
+
+    return make
+
+
+def test_content_length_response(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nab")
+    assert proto.proxy.completed == []
+    proto.data_received(b"cd")
+    assert proto.proxy.completed == [True]
+    assert proto.proxy.written.endswith(b"abcd")
+
+
+def test_chunked_response(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+    proto.data_received(b"2\r\nok\r\n")
+    assert proto.proxy.completed == []
+    proto.data_received(b"0\r\n\r\n")
+    assert proto.proxy.completed == [True]
+
+
+def test_interim_response_is_not_final(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 100 Continue\r\n\r\n")
+    assert proto.proxy.completed == []
+    proto.data_received(b"HTTP/1.1 204 No Content\r\n\r\n")
+    assert proto.proxy.completed == [True]
+    assert proto.proxy.statuses == [204]
+
+
+def test_not_modified_has_no_body(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 304 Not Modified\r\nContent-Length: 10\r\n\r\n")
+    assert proto.proxy.completed == [True]
+
+
+def test_head_response_has_no_body(upstream):
+    proto = upstream(head_request=True)
+    proto.data_received(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n")
+    assert proto.proxy.completed == [True]
+
+    proto.data_received(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+    assert proto.proxy.completed == [True, True]
+
+
+def test_close_delimited_response(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nbody")
+    assert proto.proxy.completed == []
+    proto.eof_received()
+    assert proto.proxy.eof
+
+
+def test_upstream_reset_mid_response(upstream):
+    proto = upstream()
+    proto.data_received(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nab")
+    proto.connection_lost(ConnectionResetError())
+    assert proto.proxy.eof